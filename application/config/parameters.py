@@ -9,3 +9,6 @@ params['basePath'] = os.path.dirname(
 params['configPath'] = os.path.dirname(os.path.abspath(__file__))
 params['directories.resources'] = '/ide/resources'
 params['directories.icons'] = '/ide/resources/icons'
+# directory of the monitoring time series saved on disk (see application.lib.timeseries_store), None to keep them in
+# memory only
+params['directories.monitoring'] = None
@@ -14,6 +14,7 @@ from functools import wraps
 
 from application.lib.instrum_classes import *
 from application.lib.helper_classes import Helper
+from application.lib.rack_snapshot import RackSnapshot, takeSnapshot, restoreSnapshot
 
 __instrumentsRootDir__ = os.path.join(os.getcwd(), 'lab/instruments')  # Debug here
 __configsDir__ = os.path.join(os.getcwd(), 'lab/configs')
@@ -78,6 +79,7 @@ class InstrumentMgr(Singleton, Helper):
     """
 
     _initialized = False
+    _lastSnapshot = None
 
     def __init__(self, name=None, parent=None, globals={}, instrumentsRootDir=__instrumentsRootDir__, frontpanelsRootDir=__instrumentsRootDir__):
         """
@@ -561,6 +563,51 @@ class InstrumentMgr(Singleton, Helper):
         else:
             return None
 
+    # VISA I/O statistics
+
+    def _visaInstruments(self, instrumentNames=None):
+        """
+        Private method returning the managed local VISA instruments with names in instrumentNames (all if None).
+        """
+        return [instrument for instrument in self._instruments
+                if isinstance(instrument, VisaInstrument) and (instrumentNames is None or instrument.name() in instrumentNames)]
+
+    def enableIOStatistics(self, instrumentNames=None, enable=True):
+        """
+        Starts (or stops if enable is False) recording the VISA I/O statistics of the instruments in instrumentNames
+        (all VISA instruments if None). Returns the names of the instruments concerned.
+        """
+        instruments = self._visaInstruments(instrumentNames)
+        for instrument in instruments:
+            instrument.enableIOStatistics(enable)
+        return [instrument.name() for instrument in instruments]
+
+    def clearIOStatistics(self, instrumentNames=None):
+        """
+        Clears the VISA I/O statistics of the instruments in instrumentNames (all VISA instruments if None).
+        """
+        for instrument in self._visaInstruments(instrumentNames):
+            instrument.ioStatistics().clear()
+
+    def ioStatistics(self, instrumentNames=None):
+        """
+        Returns the dictionary {instrument name: {command prefix: statistics}} of the VISA I/O statistics
+        of the instruments in instrumentNames (all VISA instruments if None). See VisaIOStatistics.statistics().
+        """
+        return dict([(instrument.name(), instrument.ioStatistics().statistics())
+                     for instrument in self._visaInstruments(instrumentNames)])
+
+    def ioStatisticsCube(self, instrumentNames=None):
+        """
+        Returns a datacube 'VISA I/O statistics' with one child cube per instrument (attribute instrument = name).
+        See VisaIOStatistics.toDatacube().
+        """
+        from application.lib.datacube import Datacube
+        cube = Datacube('VISA I/O statistics')
+        for instrument in self._visaInstruments(instrumentNames):
+            cube.addChild(instrument.ioStatistics().toDatacube(instrument.name()), instrument=instrument.name())
+        return cube
+
     # Instrument configuration management
 
     def config1Instr(self, instrument, withCurrentState=True):
@@ -592,7 +639,13 @@ class InstrumentMgr(Singleton, Helper):
         if instruments is None:
             instruments = self._instruments              # all managed instruments
         for instrument in instruments:
-            config[instrument.name()] = self.config1Instr(instrument, withCurrentState)
+            config[instrument.name()] = self.config1Instr(instrument, withCurrentState=False)
+        if withCurrentState:                             # states queried concurrently
+            snapshot = self.snapshot(instruments)
+            for name, state in snapshot.states.items():
+                config[name]['state'] = state
+            for name, error in snapshot.errors.items():
+                print 'Could not get the state of instrument %s: %s' % (name, error)
         return config
 
     def saveCurrentConfigInFile(self, instruments=None, withCurrentState=True, filename=None):
@@ -615,14 +668,17 @@ class InstrumentMgr(Singleton, Helper):
         file.write(configString)
         file.close()
 
-    def restoreConfig(self, config, instrumentNames=None, mode='reload', loadIfNotLoaded=False):
+    def restoreConfig(self, config, instrumentNames=None, mode='reload', loadIfNotLoaded=False, onlyChanged=False):
         """
         Restores the config of the instruments in instrumentNames (or all instruments in config if instrumentNames is None).
         If loadIfNotLoaded is true, also loads the instruments if necessary.
+        The states are restored one after the other in the order of instrumentNames, and only for the instruments whose current
+        state differs if onlyChanged is true.
         Possible problem: consequence of the mode used
         """
         if instrumentNames is None:
             instrumentNames = config.keys()
+        toRestore = []
         for name in instrumentNames:
             if name in config:
                 # print 'instrument %s in config' % instrumentName
@@ -642,15 +698,56 @@ class InstrumentMgr(Singleton, Helper):
                     except:
                         print "Could not load instrument %s:" % name
                         print traceback.print_exc()
-                if name in self._instruments.names():
-                    try:
-                        state = instrumentConfig['state']
-                        self.getInstrument(name).restoreState(state)
-                    except:
-                        print "Could not restore the state of instrument %s:" % name
-                        print traceback.print_exc()
+                if name in self._instruments.names() and 'state' in instrumentConfig:
+                    toRestore.append(name)
             else:
                 print 'No state found in config for instrument %s' % name
+        snapshot = RackSnapshot(dict([(name, config[name]['state']) for name in toRestore]))
+        self.restoreSnapshot(snapshot, toRestore, onlyChanged=onlyChanged)
+
+    def snapshot(self, instruments=None, timeout=10.):
+        """
+        Returns a RackSnapshot of the current states of the instruments (all managed instruments if None), queried
+        concurrently for the different VISA resources with a timeout of timeout seconds per instrument (see application.lib.rack_snapshot).
+        The snapshot is kept as lastSnapshot().
+        """
+        if instruments is None:
+            instruments = self._instruments
+        self._lastSnapshot = takeSnapshot([instrument for instrument in instruments if instrument is not None], timeout)
+        return self._lastSnapshot
+
+    def lastSnapshot(self):
+        return self._lastSnapshot
+
+    def snapshotDiff(self, instruments=None, previous=None, timeout=10.):
+        """
+        Takes a new snapshot and returns {instrument name: {key: (previous value, current value)}} for the instruments
+        whose state differs from the snapshot previous (the last snapshot if None).
+        """
+        if previous is None:
+            previous = self.lastSnapshot()
+        current = self.snapshot(instruments, timeout)
+        if previous is None:
+            return current.diff(RackSnapshot())
+        return current.diff(previous)
+
+    def restoreSnapshot(self, snapshot, instrumentNames=None, onlyChanged=True, timeout=10.):
+        """
+        Restores one after the other the states of snapshot (a RackSnapshot or a file name) for the instruments in
+        instrumentNames, in this order (all instruments of the snapshot if None). If onlyChanged is true, a snapshot of the current states is taken
+        first and only the instruments whose state differs are restored.
+        Returns the list of the names of the instruments restored.
+        """
+        if isinstance(snapshot, basestring):
+            snapshot = RackSnapshot.load(snapshot)
+        if instrumentNames is None:
+            instrumentNames = snapshot.states.keys()
+        instruments = [self.getInstrument(name) for name in instrumentNames if name in self._instruments.names()]
+        current = self.snapshot(instruments, timeout) if onlyChanged else None
+        restored, errors = restoreSnapshot(instruments, snapshot, current, timeout)
+        for name, error in errors.items():
+            print "Could not restore the state of instrument %s: %s" % (name, error)
+        return restored.keys()
 
     def loadAndRestoreConfig(self, filename=None, instrumentNames=None, mode='reload', loadIfNotLoaded=False):
         """
@@ -729,6 +826,12 @@ class RemoteInstrumentMgr():
             attr = getattr(self._manager, attr)
             return lambda *args, **kwargs: True if attr(*args, **kwargs) else False
 
+    def ioStatistics(self, instrumentNames=None):
+        """
+        Returns the VISA I/O statistics of the served instruments (see InstrumentMgr.ioStatistics).
+        """
+        return self._manager.ioStatistics(instrumentNames)
+
     def dispatch(self, instrument, attribute, args=[], kwargs={}):
         """
         Dispatches an attribute (callable or not) to an instrument, with possibly arguments
@@ -0,0 +1,129 @@
+"""
+Incremental index of the block structure of a code editor document, independent of Qt.
+
+The index keeps, for each line of the document:
+  - its indentation (number of leading whitespace characters), or None for blank and comment lines;
+  - the sorted list of the lines starting with '##', i.e. the beginnings of the code cells run by the IDE.
+It is updated from the lines replaced by each edit (see LineTextWidget.updateBlockIndex, connected to
+QTextDocument.contentsChange), so that the editor never copies the whole text to find the current cell:
+    index = CodeBlockIndex(lines)
+    index.update(firstLine, nbrRemovedLines, newLines)
+    (startLine, endLine) = index.cellRange(line)
+Cell lookups are bisections in the list of cell beginnings (O(log n)). An edit within a line costs O(log n), and an
+edit adding or removing lines shifts the following cell beginnings.
+The fold markers of the line number bar are given by isFoldStart() and foldRange(): a line starts a fold if it
+begins a cell or if the next non-blank, non-comment line is more indented.
+"""
+
+import bisect
+import re
+
+_indentation = re.compile(r'[ \t]*')
+
+
+def lineIndentation(text):
+    """
+    Returns the number of leading whitespace characters of text, or None for a blank or comment line.
+    """
+    indentation = _indentation.match(text).end()
+    if indentation == len(text) or text[indentation] == '#':
+        return None
+    return indentation
+
+
+class CodeBlockIndex(object):
+    """
+    Cells ('##' lines), indentations and folds of a list of lines, updated incrementally (see module docstring).
+    """
+
+    cellDelimiter = '##'
+
+    def __init__(self, lines=()):
+        self.reset(lines)
+
+    def reset(self, lines):
+        """
+        Rebuilds the index from the list of lines of the whole document.
+        """
+        self._indentations = [lineIndentation(line) for line in lines] or [None]
+        self._cellStarts = [i for i, line in enumerate(lines) if line.startswith(self.cellDelimiter)]
+
+    def __len__(self):
+        return len(self._indentations)
+
+    def update(self, firstLine, nbrRemovedLines, newLines):
+        """
+        Replaces the nbrRemovedLines lines starting at firstLine by the list of lines newLines.
+        """
+        lastLine = firstLine + nbrRemovedLines
+        delta = len(newLines) - nbrRemovedLines
+        self._indentations[firstLine:lastLine] = [lineIndentation(line) for line in newLines]
+        if not self._indentations:
+            self._indentations = [None]
+        i0 = bisect.bisect_left(self._cellStarts, firstLine)
+        i1 = bisect.bisect_left(self._cellStarts, lastLine)
+        following = self._cellStarts[i1:]
+        if delta:
+            following = [line + delta for line in following]
+        self._cellStarts[i0:] = [firstLine + i for i, line in enumerate(newLines)
+                                 if line.startswith(self.cellDelimiter)] + following
+
+    def indentation(self, line):
+        return self._indentations[line]
+
+    def cellStarts(self):
+        return list(self._cellStarts)
+
+    def isCellStart(self, line):
+        i = bisect.bisect_left(self._cellStarts, line)
+        return i < len(self._cellStarts) and self._cellStarts[i] == line
+
+    def cellRange(self, line, lastLine=None):
+        """
+        Returns the (first, last) lines of the cell(s) containing the lines line to lastLine (line by default).
+        """
+        i = bisect.bisect_right(self._cellStarts, line)
+        first = self._cellStarts[i - 1] if i > 0 else 0
+        j = bisect.bisect_right(self._cellStarts, line if lastLine is None else lastLine)
+        last = self._cellStarts[j] - 1 if j < len(self._cellStarts) else len(self._indentations) - 1
+        return first, last
+
+    def nextCodeLine(self, line):
+        """
+        Returns the first non-blank, non-comment line after line, or None.
+        """
+        for next in xrange(line + 1, len(self._indentations)):
+            if self._indentations[next] is not None:
+                return next
+        return None
+
+    def isFoldStart(self, line):
+        """
+        Returns True if line begins a cell or is followed by a more indented block.
+        """
+        if self.isCellStart(line):
+            return True
+        indentation = self._indentations[line]
+        if indentation is None:
+            return False
+        next = self.nextCodeLine(line)
+        return next is not None and self._indentations[next] > indentation
+
+    def foldRange(self, line):
+        """
+        Returns the (first, last) lines of the cell beginning at line, or of the block indented under line, last
+        excluding the trailing blank and comment lines.
+        """
+        if self.isCellStart(line):
+            return self.cellRange(line)
+        next = self.nextCodeLine(line)
+        if next is None:
+            return line, line
+        indentation = self._indentations[next]
+        last = next
+        for following in xrange(next + 1, len(self._indentations)):
+            if self._indentations[following] is not None:
+                if self._indentations[following] < indentation:
+                    break
+                last = following
+        return line, last
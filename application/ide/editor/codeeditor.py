@@ -23,6 +23,7 @@ from PyQt4.QtGui import *
 from PyQt4.QtCore import *
 
 from syntaxhighlighter import *
+from codeblocks import CodeBlockIndex
 from application.config.parameters import *
 from application.ide.widgets.observerwidget import ObserverWidget
 
@@ -497,56 +498,18 @@ class LineTextWidget(QPlainTextEdit):
                     break
 
         def isBeginningOfBlock(self, block):
-            if block.text()[:2] == "##":
-                return True
-            else:
-                if re.match("^\s*$", block.text()):
-                    return False
-                matchBlock = re.search("^(\s+)", block.text())
-                if matchBlock is None:
-                    indentation = ""
-                else:
-                    indentation = matchBlock.group(1)
-                nextBlock = block.next()
-                while nextBlock.isValid() and re.match("(^\s*$)|(^\s*\#.*$)", nextBlock.text()):
-                    nextBlock = nextBlock.next()
-                matchNextBlock = re.search("^(\s+)", nextBlock.text())
-                if matchNextBlock is None:
-                    nextIndentation = ""
-                else:
-                    nextIndentation = matchNextBlock.group(1)
-                if len(nextIndentation) > len(indentation):
-                    return True
+            """
+            Returns True if block begins a ## cell or is followed by a more indented block (see codeblocks).
+            """
+            return self.edit.blockIndex().isFoldStart(block.blockNumber())
 
         def getEnclosingBlocks(self, block):
-            if block.text()[:2] == "##":
-                startBlock = block
-                while block.next().isValid() and block.next().text()[:2] != "##":
-                    block = block.next()
-                    endBlock = block
-                return (startBlock, endBlock)
-            else:
-                matchBlock = re.search("^(\s+)", block.text())
-                if matchBlock is None:
-                    indentation = ""
-                else:
-                    indentation = matchBlock.group(1)
-                nextBlock = block.next()
-                while nextBlock.next().isValid() and re.match("(^\s*$)|(^\s*\#.*$)", nextBlock.text()):
-                    nextBlock = nextBlock.next()
-                matchNextBlock = re.search("^(\s+)", nextBlock.text())
-                if matchNextBlock is None:
-                    nextIndentation = ""
-                else:
-                    nextIndentation = matchNextBlock.group(1)
-                startBlock = block
-                endBlock = startBlock
-                while block.next().isValid() and (block.next().text()[:len(nextIndentation)] == nextIndentation or re.match("(^\s*$)|(^\s*\#.*$)", block.next().text())):
-                    block = block.next()
-                    endBlock = block
-                while endBlock.isValid() and re.match("(^\s*$)|(^\s*\#.*$)", endBlock.text()):
-                    endBlock = endBlock.previous()
-                return (startBlock, endBlock)
+            """
+            Returns the (startBlock, endBlock) of the cell or indented block beginning at block.
+            """
+            (first, last) = self.edit.blockIndex().foldRange(block.blockNumber())
+            document = self.edit.document()
+            return (document.findBlockByNumber(first), document.findBlockByNumber(last))
 
         def paintEvent(self, event):
 
@@ -632,6 +595,53 @@ class LineTextWidget(QPlainTextEdit):
         self.number_bar = self.NumberBar(self)
         self.number_bar.setTextEdit(self)
         self.viewport().installEventFilter(self)
+        # block structure (cells, indentations, folds) maintained from the document changes
+        self._blockIndex = CodeBlockIndex()
+        self.connect(self.document(), SIGNAL('contentsChange(int,int,int)'), self.updateBlockIndex)
+        self.resetBlockIndex()
+
+    def setDocument(self, document):
+        if document is self.document():
+            return
+        self.disconnect(self.document(), SIGNAL('contentsChange(int,int,int)'), self.updateBlockIndex)
+        QPlainTextEdit.setDocument(self, document)
+        self.connect(document, SIGNAL('contentsChange(int,int,int)'), self.updateBlockIndex)
+        self.resetBlockIndex()
+
+    def blockIndex(self):
+        return self._blockIndex
+
+    def resetBlockIndex(self):
+        """
+        Rebuilds the block index from the whole document.
+        """
+        lines = []
+        block = self.document().firstBlock()
+        while block.isValid():
+            lines.append(unicode(block.text()))
+            block = block.next()
+        self._blockIndex.reset(lines)
+
+    def updateBlockIndex(self, position, charsRemoved, charsAdded):
+        """
+        Updates the block index with the lines modified by a change of the document (contentsChange signal).
+        """
+        document = self.document()
+        first = document.findBlock(position)
+        # Qt may count the end of the document in charsAdded when the whole text is replaced
+        last = document.findBlock(min(position + charsAdded, document.characterCount() - 1))
+        if not (first.isValid() and last.isValid()):
+            return self.resetBlockIndex()
+        firstLine = first.blockNumber()
+        nbrRemovedLines = last.blockNumber() - firstLine + 1 - (document.blockCount() - len(self._blockIndex))
+        if nbrRemovedLines < 0 or firstLine + nbrRemovedLines > len(self._blockIndex):
+            return self.resetBlockIndex()
+        lines = [unicode(first.text())]
+        block = first
+        while block != last:
+            block = block.next()
+            lines.append(unicode(block.text()))
+        self._blockIndex.update(firstLine, nbrRemovedLines, lines)
 
     def appendPlainText(self, string):
         QPlainTextEdit.appendPlainText(self, string)
@@ -1070,7 +1080,7 @@ class CodeEditor(SearchableEditor, LineTextWidget):
         cursor = self.textCursor()
         if cursor.position() == block.cursor.selectionStart() and block.cursor.selectionStart() != 0:
             cursor.setPosition(block.cursor.selectionStart() - 1)
-
+            self.setTextCursor(cursor)
             block = self.getCurrentBlock()
             cursor.setPosition(block.cursor.selectionStart())
         else:
@@ -1078,8 +1088,31 @@ class CodeEditor(SearchableEditor, LineTextWidget):
         self.setTextCursor(cursor)
 
     def getCurrentBlock(self, delimiter="\n##"):
-        # Bug Check what happens in all cases
-        text = unicode(self.document().toPlainText())
+        """
+        Returns an ExtraSelection of the code around the current selection, or None if it is empty:
+            - delimiter "\n##": the ## cell(s), found in the block index;
+            - delimiter "\n": the lines;
+            - delimiter "": the whole text.
+        Other delimiters are searched in the whole text.
+        """
+        document = self.document()
+        cursor = self.textCursor()
+        if delimiter in ("\n" + CodeBlockIndex.cellDelimiter, "\n"):
+            firstLine = document.findBlock(cursor.selectionStart()).blockNumber()
+            lastLine = document.findBlock(cursor.selectionEnd()).blockNumber()
+            if delimiter != "\n":
+                (firstLine, lastLine) = self._blockIndex.cellRange(firstLine, lastLine)
+            blockStart = document.findBlockByNumber(firstLine).position()
+            lastBlock = document.findBlockByNumber(lastLine)
+            blockEnd = lastBlock.position() + lastBlock.length() - 1
+            if blockStart == blockEnd:
+                return None
+            selection = QTextEdit.ExtraSelection()
+            cursor.setPosition(blockStart, QTextCursor.MoveAnchor)
+            cursor.setPosition(blockEnd, QTextCursor.KeepAnchor)
+            selection.cursor = cursor
+            return selection
+        text = unicode(document.toPlainText())
         blockStart = 0
         blockEnd = len(text)
         if delimiter != "":
@@ -1127,8 +1160,6 @@ class CodeEditor(SearchableEditor, LineTextWidget):
 
         self._errorSelections = []
 
-        selection = self.getCurrentBlock()
-
         selection.format = QTextCharFormat()
         pen = QPen()
         #      selection.format.setProperty(QTextFormat.OutlinePen,pen)
@@ -0,0 +1,96 @@
+"""
+Vectorized encoding of waveforms and markers for the upload to arbitrary waveform generators.
+All functions work on whole numpy arrays and return (or decode) the binary strings sent to the instruments:
+  - clipWaveform(waveform): clips a real waveform to [-1, 1] and tells whether clipping occurred;
+  - toInt14(waveform): converts a waveform in [-1, 1] to the 14-bit DAC range [0, 2^14-1];
+  - encodeIntData(values, markers): 16-bit little-endian words with the 14-bit value and 2 marker bits (Tektronix INT format);
+  - encodeRealData(values, markers): 5 bytes per point, float32 little-endian + marker byte (Tektronix REAL format);
+  - encodeMarkers(markers): 1 byte per point with the 2 marker bits in bits 6 and 7;
+  - decodeIntData, decodeRealData, decodeMarkers: the reverse operations;
+  - encodeBlock(prefix, data): the full command 'prefix#<n><nBytes><data>' (header given by
+    application.lib.visa_blocks.blockHeader).
+"""
+
+import numpy
+
+from application.lib.visa_blocks import blockHeader
+
+_int14Max = (1 << 14) - 1
+_realDtype = numpy.dtype([('value', '<f4'), ('marker', 'u1')])
+
+
+def clipWaveform(waveform):
+    """
+    Returns (real part of waveform clipped to [-1, 1] as a new float array, True if some points were clipped).
+    """
+    waveform = numpy.real(numpy.asarray(waveform)).astype(numpy.float64)
+    clipped = bool(len(waveform)) and (waveform.max() > 1 or waveform.min() < -1)
+    if clipped:
+        numpy.clip(waveform, -1, 1, out=waveform)
+    return waveform, clipped
+
+
+def toInt14(waveform):
+    """
+    Converts a waveform encoded between -1 and 1 into the DAC range 0, 2^14-1 = 16383 (as floats).
+    """
+    return (numpy.asarray(waveform, dtype=numpy.float64) + 1.0) / 2.0 * _int14Max
+
+
+def encodeIntData(values, markers):
+    """
+    Returns the string of 16-bit little-endian words ((marker & 3) << 14) + (int(value) & 0x3FFF).
+    Values are truncated towards zero as int() does.
+    """
+    words = numpy.asarray(values).astype(numpy.int64) & _int14Max
+    words |= (numpy.asarray(markers).astype(numpy.int64) & 3) << 14
+    return words.astype('<u2').tostring()
+
+
+def encodeRealData(values, markers):
+    """
+    Returns the string of 5-byte points: float32 little-endian value followed by the marker byte (marker << 6).
+    """
+    data = numpy.empty(len(values), dtype=_realDtype)
+    data['value'] = values
+    data['marker'] = (numpy.asarray(markers).astype(numpy.uint8) & 3) << 6
+    return data.tostring()
+
+
+def encodeMarkers(markers):
+    """
+    Returns the string of marker bytes (marker << 6).
+    """
+    return ((numpy.asarray(markers).astype(numpy.uint8) & 3) << 6).tostring()
+
+
+def decodeIntData(data):
+    """
+    Returns (values, markers) decoded from a string of 16-bit words, as in the original readIntData of the awgv2 driver.
+    """
+    words = numpy.frombuffer(data, dtype='<u2', count=len(data) / 2)
+    return ((words >> 6) & 0xFF).astype(int), (words >> 14).astype(int)
+
+
+def decodeRealData(data):
+    """
+    Returns (values, markers) decoded from a string of 5-byte points.
+    """
+    points = numpy.frombuffer(data, dtype=_realDtype, count=len(data) / 5)
+    return points['value'].astype(float), points['marker'].astype(int)
+
+
+def decodeMarkers(data):
+    """
+    Returns the markers decoded from a string of marker bytes.
+    """
+    return (numpy.frombuffer(data, dtype=numpy.uint8) >> 6).astype(int)
+
+
+def encodeBlock(prefix, data):
+    """
+    Returns the command string prefix + blockHeader(len(data)) + data, data being a string or a numpy array.
+    """
+    if isinstance(data, numpy.ndarray):
+        data = numpy.ascontiguousarray(data).tostring()
+    return ''.join([prefix, blockHeader(len(data)), data])
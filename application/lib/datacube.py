@@ -750,6 +750,28 @@ class Datacube(Subject, Observer, Reloadable, Debugger):
             if values is not None:
                 self.notify("commit")
 
+    def createCols(self, columns, offsetRow=0, notify=True):
+        """
+        Creates (or overwrites) several columns at once from columns, a list of (name, values) pairs, with a single
+        adjustment of the table and a single notification (instead of one per column with createCol).
+        Then sets the values of each column starting from row index = offsetRow.
+        """
+        self.setModified()
+        self.debugPrint('In ', self._meta["name"], 'createCols(names=', [name for name, values in columns], ')')
+        if offsetRow < 0:
+            offsetRow = max(self._meta["length"] + offsetRow + 1, 0)
+        for name, values in columns:
+            self._addFields({name: None}, adjustTable=False)
+            if values is not None:
+                self._meta["length"] = max(self._meta["length"], offsetRow + len(values))
+        self._adjustTable(notifyFields=False)
+        for name, values in columns:
+            if values is not None:
+                self._table[offsetRow:offsetRow + len(values), self.columnIndex(name)] = values
+        if notify:
+            self.notify("names", self._meta["fieldNames"])
+            self.notify("commit")
+
     # **********************
     # * Row management     *
     # **********************
@@ -3,6 +3,8 @@ Some convenience classes for managing instruments.
 """
 
 import traceback
+import time
+import threading
 import socket
 import inspect
 import os.path
@@ -14,16 +16,54 @@ try:
 except:
     print 'Cannot import win32com.client or pythoncom'
 
+from application.lib.visa_simulation import isSimulated, simulatedInstrument, SimulatedVisaIOError
+from application.lib.visa_statistics import VisaIOStatistics
+from application.lib.visa_cache import SettingsCache
+from application.lib.visa_batch import CommandBatch
+from application.lib.visa_completion import OperationFuture, OperationTimeoutError, completedFuture, waitAll, waitAny
+
 try:
     from pyvisa import visa, vpp43
     from visa import VI_ERROR_CONN_LOST, VI_ERROR_INV_OBJECT, VisaIOError, Error, instrument
 except:
     print 'Cannot import visa and/or vpp43 from pyvisa.'
+    # only simulated VISA instruments can be used
+    VisaIOError = Error = SimulatedVisaIOError
 
 from application.lib.base_classes1 import *
 from application.lib.com_classes import *
 
 
+def _trackedInitialize(initialize):
+    """
+    Returns the initialize method supplemented by an update of the instrument's loadInfo and initialized attributes.
+    """
+    def trackedInitialize(self, *args, **kwargs):
+        self.initialized = False
+        result = initialize(self, *args, **kwargs)
+        self.loadInfo.update({'args': args, 'kwargs': kwargs})
+        self.initialized = True
+        return result
+    trackedInitialize.__name__ = initialize.__name__
+    trackedInitialize.__doc__ = initialize.__doc__
+    trackedInitialize.__module__ = initialize.__module__
+    trackedInitialize.original = initialize
+    return trackedInitialize
+
+
+class InstrumentType(type):
+    """
+    Metaclass of the instruments, wrapping at class creation the initialize method defined by each instrument class
+    so that a call to it updates the instrument's loadInfo and initialized attributes.
+    """
+
+    def __new__(mcs, name, bases, namespace):
+        initialize = namespace.get('initialize')
+        if inspect.isfunction(initialize) and not hasattr(initialize, 'original'):
+            namespace['initialize'] = _trackedInitialize(initialize)
+        return type.__new__(mcs, name, bases, namespace)
+
+
 class Instrument(Debugger, ThreadedDispatcher, Reloadable, object):
     """
     A generic Insrument class (inheriting ThreadedDispatcher) with the following attributes:
@@ -41,6 +81,8 @@ class Instrument(Debugger, ThreadedDispatcher, Reloadable, object):
     A single or several frontpanels, local or distant, can be used to interact with the instrument as any other piece of python code.
     """
 
+    __metaclass__ = InstrumentType
+
     def __init__(self, name=None):  # One should always pass a name to instantiate an instrument
         """
         Private class creator initializing the name and empty list of states.
@@ -70,27 +112,11 @@ class Instrument(Debugger, ThreadedDispatcher, Reloadable, object):
         NOTE: A call to this method is detected by the instrument which triggers automatically an update
         of its loadInfo and initialized attributes; this allows the programmer of the overriden initialize
         method to forget about these attributes.
+        (The initialize method of each instrument class is wrapped once at class creation by the InstrumentType
+        metaclass, so that the other attributes are accessed without overhead.)
         """
         pass  # override me if needed
 
-    def __getattribute__(self, attributeName):
-        """
-        Propagates normally all attributes except initialize(), which is supplemented by an update
-        of the instrument's loadInfo and initialized attributes; this allows the programmer of the overriden
-        initialize method to forget about these attributes.
-        """
-        attr = object.__getattribute__(self, attributeName)
-        if attributeName == 'initialize':
-            def initialize2(*args, **kwargs):
-                self.initialized = False
-                result = attr(*args, **kwargs)
-                self.loadInfo.update({'args': args, 'kwargs': kwargs})
-                self.initialized = True
-                return result
-            return initialize2
-        else:
-            return attr
-
     def __str__(self):
         return "Instrument \"%s\"" % self.name()
 
@@ -165,7 +191,8 @@ class Instrument(Debugger, ThreadedDispatcher, Reloadable, object):
         """
         argNames, kwargs = [], {}
         try:
-            args, varargs, keywords, defaults = argspec = inspect.getargspec(self.initialize)
+            initialize = getattr(self.initialize, 'original', self.initialize)
+            args, varargs, keywords, defaults = argspec = inspect.getargspec(initialize)
             try:
                 args.remove('self')
             except:
@@ -474,6 +501,19 @@ class VisaInstrument(Instrument):
     A class representing an instrument that can be interfaced via NI VISA protocol.
     """
 
+    _ioStatistics = None            # VisaIOStatistics recording the VISA calls, or None if disabled
+    _ioStatisticsStore = None
+    cachedSettings = []             # patterns of the headers of the settings cached by the driver (see lib.visa_cache)
+    cacheInvalidations = []         # [(command pattern, pattern of the invalidated settings or None for all)]
+    _settingsCache = None
+    maxMessageLength = 512          # maximum length of the joined messages of a batch (see batch())
+    maxQueriesPerMessage = 16       # maximum number of queries per joined message of a batch
+    _batch = None                   # active CommandBatch
+    _batchQueries = None            # {batch key: queries learned}
+    _batchStatistics = None
+    _ioLock = None                  # RLock serializing the VISA calls of the instrument (see ioLock())
+    _ioLockCreation = threading.Lock()
+
     def __init__(self, name='', visaAddress=None, term_chars=None, scpi=False, testString='', **kwargs):
         """
         Initialization
@@ -504,6 +544,7 @@ class VisaInstrument(Instrument):
         """
         Return the VISA handle for this instrument.
         If the VISA connection was lost, it reopens the VISA handle.
+        A simulated resource is opened instead if the VISA address is simulated (see application.lib.visa_simulation).
         """
         if forceReload or self._handle is None:
             try:
@@ -515,23 +556,179 @@ class VisaInstrument(Instrument):
                     self._handle = None
             except:
                 pass
-            self._handle = visa.instrument(self._visaAddress)
+            self.invalidateCache()
+            if isSimulated(self._visaAddress):
+                self._handle = simulatedInstrument(self._visaAddress)
+            else:
+                self._handle = visa.instrument(self._visaAddress)
         return self._handle
 
+    def getHandle(self, forceReload=False):
+        """
+        Same as visaHandle().
+        """
+        return self.visaHandle(forceReload=forceReload)
+
     def visaAddress(self):
         return self._visaAddress
 
+    def ioLock(self):
+        """
+        Returns the reentrant lock held during each VISA call and each batch of the instrument, so that the instrument
+        can be called from several threads (snapshots, operation futures...).
+        A sequence of calls that must not be interleaved with those of other threads is run in a 'with ioLock():' block.
+        """
+        if self._ioLock is None:
+            with self._ioLockCreation:
+                if self._ioLock is None:
+                    self._ioLock = threading.RLock()
+        return self._ioLock
+
     def executeVisaCommand(self, method, *args, **kwargs):
         """
-        This function executes a VISA command.
+        This function executes a VISA command, holding the I/O lock of the instrument (see ioLock()).
+        method is the name of a method of the VISA handle (or the method itself).
+        If the I/O statistics are enabled, the call is recorded (see enableIOStatistics()).
         """
-        try:
-            returnValue = method(*args, **kwargs)
-            return returnValue
-        except Error as error:
-            print 'Visa call error => Invalidating Visa handle.'
-            self._handle = None
-            raise
+        with self.ioLock():
+            if isinstance(method, str):
+                handle = self._handle if self._handle is not None else self.visaHandle()
+                method = getattr(handle, method)
+            try:
+                if self._ioStatistics is None:
+                    return method(*args, **kwargs)
+                t0 = time.time()
+                returnValue = method(*args, **kwargs)
+                self._ioStatistics.record(method.__name__, args, returnValue, time.time() - t0)
+                return returnValue
+            except Error as error:
+                print 'Visa call error => Invalidating Visa handle.'
+                self._handle = None
+                raise
+
+    def write(self, message, *args, **kwargs):
+        with self.ioLock():
+            if self._batch is not None and not args and not kwargs:
+                return self._batch.write(message)
+            return self._write(message, *args, **kwargs)
+
+    def ask(self, message, *args, **kwargs):
+        with self.ioLock():
+            if self._batch is not None and not args and not kwargs:
+                return self._batch.ask(message)
+            return self._ask(message, *args, **kwargs)
+
+    def _write(self, message, *args, **kwargs):
+        if self.cachedSettings and not args and not kwargs:
+            return self.settingsCache().write(message, lambda m: self.executeVisaCommand('write', m))
+        return self.executeVisaCommand('write', message, *args, **kwargs)
+
+    def _ask(self, message, *args, **kwargs):
+        if self.cachedSettings and not args and not kwargs:
+            return self.settingsCache().ask(message, lambda m: self.executeVisaCommand('ask', m))
+        return self.executeVisaCommand('ask', message, *args, **kwargs)
+
+    def read(self, *args, **kwargs):
+        with self.ioLock():
+            if self._batch is not None:
+                self._batch.flush()
+            return self.executeVisaCommand('read', *args, **kwargs)
+
+    def read_raw(self, *args, **kwargs):
+        with self.ioLock():
+            if self._batch is not None:
+                self._batch.flush()
+            return self.executeVisaCommand('read_raw', *args, **kwargs)
+
+    def ask_for_values(self, *args, **kwargs):
+        with self.ioLock():
+            if self._batch is not None:
+                self._batch.flush()
+            return self.executeVisaCommand('ask_for_values', *args, **kwargs)
+
+    def batch(self, key=None, queries=None):
+        """
+        Returns a CommandBatch context in which the writes are sent with the next query as a single message and the
+        queries are prefetched in joined messages (see application.lib.visa_batch).
+        The queries prefetched are queries and those asked in the previous contexts of the same key.
+        """
+        return CommandBatch(self, key, queries)
+
+    def learnedBatchQueries(self, key):
+        """
+        Returns the list of the queries learned for the batches of the given key.
+        """
+        if key is None or self._batchQueries is None:
+            return []
+        return self._batchQueries.get(key, [])
+
+    def _learnBatchQueries(self, key, queries):
+        if self._batchQueries is None:
+            self._batchQueries = dict()
+        learned = self._batchQueries.setdefault(key, [])
+        learned.extend([query for i, query in enumerate(queries) if query not in learned and query not in queries[:i]])
+
+    def batchStatistics(self):
+        """
+        Returns the dictionary {'commands', 'messages'} of the numbers of commands issued in batches by the driver and of
+        the messages actually sent for them (the round trips saved being commands - messages).
+        """
+        if self._batchStatistics is None:
+            self._batchStatistics = {'commands': 0, 'messages': 0}
+        return self._batchStatistics
+
+    def settingsCache(self):
+        """
+        Returns the SettingsCache of the settings declared in cachedSettings (None if the driver declares no setting).
+        """
+        if self._settingsCache is None and self.cachedSettings:
+            self._settingsCache = SettingsCache(self.cachedSettings, self.cacheInvalidations)
+        return self._settingsCache
+
+    def invalidateCache(self, keyPattern=None):
+        """
+        Drops the cached settings whose normalized header matches keyPattern (all settings if None).
+        To be called after the instrument has been modified from its front panel or by another program.
+        """
+        if self._settingsCache is not None:
+            self._settingsCache.invalidate(keyPattern)
+
+    def setCacheEnabled(self, enabled=True):
+        """
+        Enables or disables the settings cache (and empties it).
+        """
+        if self.settingsCache() is not None:
+            self._settingsCache.invalidate()
+            self._settingsCache.enabled = enabled
+
+    def cacheStatistics(self):
+        """
+        Returns the counters {'hits', 'misses', 'skippedWrites', 'settings'} of the settings cache (None if no cache).
+        """
+        if self.settingsCache() is not None:
+            return self._settingsCache.statistics()
+
+    def enableIOStatistics(self, enable=True):
+        """
+        Starts (or stops if enable is False) recording the statistics of the VISA calls of this instrument.
+        The statistics recorded so far are kept (use ioStatistics().clear() to reset them).
+        """
+        if enable:
+            self._ioStatistics = self.ioStatistics()
+        else:
+            self._ioStatistics = None
+        return self._ioStatistics is not None
+
+    def ioStatisticsEnabled(self):
+        return self._ioStatistics is not None
+
+    def ioStatistics(self):
+        """
+        Returns the VisaIOStatistics object of this instrument.
+        """
+        if self._ioStatisticsStore is None:
+            self._ioStatisticsStore = VisaIOStatistics()
+        return self._ioStatisticsStore
 
     def isSCPI(self):
         """
@@ -546,15 +743,83 @@ class VisaInstrument(Instrument):
             pass
         return self.scpi
 
-    def waitForOperationComplete(self, checkSCPI=True):
+    def waitForOperationComplete(self, checkSCPI=True, timeout=60.):
         """
         Wait for operation complete of a SCPI instrument.
         """
         if not self.scpi and checkSCPI:
-            print 'WARNING: %s is not necessarily a SCPI instrument.\nRun %s.isSCPI() to check and avoid this warning.' % (self.name()) * 2
+            print 'WARNING: %s is not necessarily a SCPI instrument.\nRun %s.isSCPI() to check and avoid this warning.' % ((self.name(),) * 2)
         if not checkSCPI or self.scpi:
-            self.write('*WAI')
-            self.ask('*OPC?')
+            return self.operationComplete(timeout=timeout).result()
+
+    def operationComplete(self, operation=None, timeout=60., useSRQ=True, minInterval=0.005, maxInterval=0.5):
+        """
+        Starts an overlapped operation followed by *OPC and returns an OperationFuture completed (with the event status
+        register) when the instrument sets its operation complete bit, or failed with OperationTimeoutError after timeout s.
+        operation is a command string (e.g. 'INIT'), a function starting the operation, or None for the pending operations.
+        Completion is detected by service request if useSRQ and the VISA resource supports it (GPIB), and otherwise
+        by polling *ESR? with intervals growing from minInterval to maxInterval. The event status enable and service
+        request enable masks set for the service request are restored when the future is done.
+        No other command should be sent to the instrument until the future is done.
+        """
+        handle = self.visaHandle()
+        srq = useSRQ and hasattr(handle, 'wait_for_srq')
+        self.ask('*ESR?')                           # clears the event status register
+        masks = None
+        if srq:
+            masks = (int(self.ask('*ESE?')), int(self.ask('*SRE?')))
+            self.write('*ESE 1;*SRE 32')
+        try:
+            if isinstance(operation, basestring):
+                self.write(operation)
+            elif operation is not None:
+                operation()
+            self.write('*OPC')
+        except:
+            self._restoreStatusMasks(masks)
+            raise
+        future = OperationFuture(self.name())
+        return future.start(self._waitOperationComplete, future, srq, timeout, minInterval, maxInterval, masks)
+
+    def _restoreStatusMasks(self, masks):
+        """
+        Private method restoring the (*ESE, *SRE) masks saved by operationComplete() (nothing if masks is None).
+        """
+        if masks is not None:
+            self.write('*ESE %i;*SRE %i' % masks)
+
+    def _waitOperationComplete(self, future, srq, timeout, minInterval, maxInterval, masks=None):
+        """
+        Private method waiting in the thread of future for the operation complete bit (see operationComplete()), and
+        restoring the status masks at the end.
+        """
+        try:
+            return self._pollOperationComplete(future, srq, timeout, minInterval, maxInterval)
+        finally:
+            self._restoreStatusMasks(masks)
+
+    def _pollOperationComplete(self, future, srq, timeout, minInterval, maxInterval):
+        deadline = time.time() + timeout
+        interval = minInterval
+        while not future.cancelled():
+            if srq:
+                try:
+                    self.visaHandle().wait_for_srq(min(maxInterval, max(deadline - time.time(), 1e-3)))
+                except Error:
+                    pass
+                else:
+                    esr = int(self.ask('*ESR?'))    # clears the service request
+                    if esr & 1:
+                        return esr
+            else:
+                esr = int(self.ask('*ESR?'))
+                if esr & 1:
+                    return esr
+            if time.time() > deadline:
+                raise OperationTimeoutError('Operation of %s not complete after %s s.' % (self.name(), timeout))
+            if not srq:
+                time.sleep(interval)
+                interval = min(interval * 1.5, maxInterval)
 
     def __getattr__(self, attr):
         """
@@ -563,7 +828,7 @@ class VisaInstrument(Instrument):
         handle = self.visaHandle()
         if hasattr(handle, attr):
             attr1 = getattr(handle, attr)
-            if hasattr(attr, '__call__'):
+            if hasattr(attr1, '__call__'):
                 return lambda *args, **kwargs: self.executeVisaCommand(attr1, *args, **kwargs)
             else:
                 return attr1
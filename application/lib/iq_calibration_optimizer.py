@@ -0,0 +1,165 @@
+"""
+Model-based minimization of the leakage of an IQ mixer over a calibration map.
+
+Each evaluation of the leakage (dc offsets on I and Q at a LO frequency, or sideband correction (absC, argC_rad) at a
+(LO, IF) pair) is a full round trip through the AWG and the spectrum analyzer. minimizeQuadratic() cuts the number of
+evaluations by fitting a local quadratic model of the leakage power to the points already measured and jumping to the
+minimum of the model, within a trust region:
+  - the power, in dBm, is fitted in linear units, in which the leakage is quadratic around its minimum;
+  - the trust radius grows when the model predicts well and shrinks otherwise, and the search stops when the steps or
+    the radius get below xtol.
+A CalibrationSweep runs minimizeQuadratic() at the successive points of a map, each point starting from the optimum of
+the previous one with a smaller initial step, and checkpoints each optimum (e.g. into the calibration Datacube) as soon
+as it is found, so that an interrupted map resumes at the first point without optimum:
+    sweep = CalibrationSweep(objective, x0=[0, 0], step=[0.05, 0.05], moveTo=moveTo, done=done, store=store)
+    sweep.run(points)
+"""
+
+import numpy
+
+
+def _quadraticTerms(z):
+    """
+    Private function returning the (m, 1 + n + n(n+1)/2) design matrix of a quadratic form of the (m, n) points z.
+    """
+    m, n = z.shape
+    columns = [numpy.ones(m)] + [z[:, i] for i in range(n)]
+    columns += [z[:, i] * z[:, j] for i in range(n) for j in range(i, n)]
+    return numpy.array(columns).T
+
+
+def _fitQuadratic(z, y, weights=None):
+    """
+    Private function returning the gradient g and Hessian H at 0 of the weighted quadratic least-squares fit of y(z).
+    """
+    n = z.shape[1]
+    if weights is None:
+        weights = numpy.ones(len(y))
+    coefficients = numpy.linalg.lstsq(_quadraticTerms(z) * weights[:, numpy.newaxis], y * weights, rcond=-1)[0]
+    g = coefficients[1:n + 1]
+    H = numpy.empty((n, n))
+    k = n + 1
+    for i in range(n):
+        for j in range(i, n):
+            H[i, j] = H[j, i] = coefficients[k] * (2 if i == j else 1)
+            k += 1
+    return g, H
+
+
+def _stencil(n):
+    """
+    Private function returning the 1 + n + n(n+1)/2 points of unit steps determining a quadratic form in n dimensions.
+    """
+    eye = numpy.eye(n)
+    points = [numpy.zeros(n)] + [eye[i] for i in range(n)] + [-eye[i] for i in range(n)]
+    points += [eye[i] + eye[j] for i in range(n) for j in range(i + 1, n)]
+    return points
+
+
+def minimizeQuadratic(function, x0, step, xtol=5e-4, maxEvaluations=30, decibels=True):
+    """
+    Minimizes function(x) from x0 (see module docstring), with initial steps step along each coordinate.
+    The values of function are powers in dBm if decibels is True, linear otherwise.
+    Returns (x, value, evaluations, history) where history is the list of the evaluated (x, value).
+    """
+    x0 = numpy.array(x0, dtype=float)
+    step = numpy.abs(numpy.array(step, dtype=float)) * numpy.ones(len(x0))
+    xtol = numpy.array(xtol, dtype=float) * numpy.ones(len(x0))
+    scaledTolerance = (xtol / step).min()
+    z, values = [], []
+
+    def evaluate(point):
+        value = function(x0 + point * step)
+        z.append(numpy.array(point, dtype=float))
+        values.append(float(value))
+        return value
+
+    for point in _stencil(len(x0)):
+        if len(values) < maxEvaluations:
+            evaluate(point)
+    radius = 1.
+    nbrTerms = _quadraticTerms(numpy.zeros((1, len(x0)))).shape[1]
+    while len(values) < maxEvaluations and radius > scaledTolerance:
+        points = numpy.array(z)
+        y = numpy.array(values)
+        if decibels:
+            y = 10 ** (y / 10.)
+        best = y.argmin()
+        distances = numpy.sqrt(((points - points[best]) ** 2).sum(axis=1))
+        selected = numpy.argsort(distances)[:max(nbrTerms, int((distances <= 3 * radius).sum()))]
+        # relative least squares if the noise is in dB
+        weights = 1. / y[selected] if decibels else None
+        g, H = _fitQuadratic(points[selected] - points[best], y[selected], weights)
+        try:
+            numpy.linalg.cholesky(H)
+            move = -numpy.linalg.solve(H, g)
+        except numpy.linalg.LinAlgError:
+            move = -g / max(numpy.sqrt((g ** 2).sum()), 1e-300) * radius
+        length = numpy.sqrt((move ** 2).sum())
+        if length > radius:
+            move *= radius / length
+            length = radius
+        if numpy.all(numpy.abs(move) * step < xtol):
+            break
+        predicted = y[best] + (g * move).sum() + 0.5 * move.dot(H).dot(move)
+        value = evaluate(points[best] + move)
+        actual = 10 ** (value / 10.) if decibels else value
+        if actual < y[best] and actual - y[best] <= 0.5 * (predicted - y[best]):
+            radius = max(radius, 2 * length)            # good model: allow longer steps
+        else:
+            radius = 0.5 * min(radius, length)          # poor model or no improvement: shrink the trust region
+    best = int(numpy.argmin(values))
+    history = [(x0 + point * step, value) for point, value in zip(z, values)]
+    return x0 + z[best] * step, values[best], len(values), history
+
+
+class CalibrationSweep(object):
+    """
+    Runs minimizeQuadratic() over the points of a calibration map, with warm starts and checkpoints (see module
+    docstring):
+      - objective(x, point) returns the leakage power at parameters x and map point point;
+      - moveTo(point), if given, is called once before minimizing at point (e.g. to set the LO frequency);
+      - done(point), if given, returns the optimum already stored for point, or None;
+      - store(point, x, value, evaluations), if given, checkpoints the optimum of point.
+    """
+
+    def __init__(self, objective, x0, step, warmStep=None, xtol=5e-4, maxEvaluations=30, decibels=True,
+                 moveTo=None, done=None, store=None):
+        self.objective = objective
+        self.x0 = numpy.array(x0, dtype=float)
+        self.step = numpy.array(step, dtype=float)
+        self.warmStep = self.step / 4. if warmStep is None else numpy.array(warmStep, dtype=float)
+        self.xtol = xtol
+        self.maxEvaluations = maxEvaluations
+        self.decibels = decibels
+        self.moveTo = moveTo
+        self.done = done
+        self.store = store
+        self.evaluations = 0
+        self.results = []
+
+    def run(self, points):
+        """
+        Minimizes the objective at all points in order, skipping the ones already done.
+        Returns the list of (point, x, value, evaluations), value being None for the skipped points.
+        """
+        self.evaluations = 0
+        self.results = []
+        x, warm = self.x0, False
+        for point in points:
+            previous = self.done(point) if self.done is not None else None
+            if previous is not None:
+                x, warm = numpy.array(previous, dtype=float), True
+                self.results.append((point, x, None, 0))
+                continue
+            if self.moveTo is not None:
+                self.moveTo(point)
+            x, value, evaluations, history = minimizeQuadratic(lambda parameters: self.objective(parameters, point),
+                                                               x, self.warmStep if warm else self.step,
+                                                               self.xtol, self.maxEvaluations, self.decibels)
+            warm = True
+            self.evaluations += evaluations
+            self.results.append((point, x, value, evaluations))
+            if self.store is not None:
+                self.store(point, x, value, evaluations)
+        return self.results
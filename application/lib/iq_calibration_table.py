@@ -0,0 +1,128 @@
+"""
+Compiled lookup tables of the calibration of an IQ mixer.
+
+The calibration of an IQ mixer is stored in two datacubes:
+  - the offset cube, with columns LO_GHz, lowI and lowQ (dc offsets on I and Q at each carrier frequency);
+  - the sideband cube, with a column LO_GHz and, for each LO, a child cube of columns IF_GHz, absC and argC_rad
+    (complex correction |c| exp(j phi) at each sideband frequency).
+An IQCalibrationTable reads these cubes once and compiles them into numpy arrays:
+  - the offsets on the sorted LO frequencies of the offset cube;
+  - absC and argC_rad on a rectilinear (LO, IF) grid, made of the sorted LO frequencies of the sideband cube and of the
+    union of the IF frequencies of its children, each child being linearly interpolated on the IF grid.
+Lookups are then linear in LO for the offsets and bilinear in (LO, IF) for the sideband corrections, vectorized over
+any number of (LO, IF) pairs. Frequencies outside a grid are clamped to its edges, and a missing calibration gives
+zero corrections.
+The table does not follow the changes of the cubes: its owner (see iqmixer.Instr.calibrationTable()) has to rebuild it
+whenever the calibration cubes are set, loaded or recalibrated.
+"""
+
+import numpy
+
+
+def _lastUnique(keys, values):
+    """
+    Private function returning the sorted unique keys and the values of their last occurrences.
+    """
+    keys, values = numpy.asarray(keys, dtype=float), numpy.asarray(values, dtype=float)
+    reversedKeys, indices = numpy.unique(keys[::-1], return_index=True)
+    return reversedKeys, values[::-1][indices]
+
+
+def _locate(grid, x):
+    """
+    Private function returning the indices i of the grid intervals containing x, and the fractions t of x in them.
+    """
+    if len(grid) < 2:
+        return numpy.zeros(numpy.shape(x), dtype=int), numpy.zeros(numpy.shape(x))
+    i = numpy.clip(numpy.searchsorted(grid, x, side='right') - 1, 0, len(grid) - 2)
+    t = numpy.clip((x - grid[i]) / (grid[i + 1] - grid[i]), 0., 1.)
+    return i, t
+
+
+class IQCalibrationTable(object):
+    """
+    Compiled offset and sideband calibrations of an IQ mixer (see module docstring).
+    """
+
+    def __init__(self, offsetCube=None, sidebandCube=None):
+        self.offsetLO = numpy.zeros(0)
+        self.iOffsets = numpy.zeros(0)
+        self.qOffsets = numpy.zeros(0)
+        self.sidebandLO = numpy.zeros(0)
+        self.sidebandIF = numpy.zeros(0)
+        self.absC = numpy.zeros((0, 0))
+        self.argC = numpy.zeros((0, 0))
+        if offsetCube is not None:
+            self._compileOffsets(offsetCube)
+        if sidebandCube is not None:
+            self._compileSideband(sidebandCube)
+
+    def _compileOffsets(self, cube):
+        names = cube.names()
+        if not all([name in names for name in ['LO_GHz', 'lowI', 'lowQ']]) or len(cube.column('LO_GHz')) == 0:
+            return
+        self.offsetLO, self.iOffsets = _lastUnique(cube.column('LO_GHz'), cube.column('lowI'))
+        self.qOffsets = _lastUnique(cube.column('LO_GHz'), cube.column('lowQ'))[1]
+
+    def _compileSideband(self, cube):
+        if 'LO_GHz' not in cube.names():
+            return
+        rows = []
+        for LO in numpy.unique(cube.column('LO_GHz')):
+            children = cube.children(LO_GHz=LO)
+            if not children:
+                continue
+            child = children[-1]
+            names = child.names()
+            if not all([name in names for name in ['IF_GHz', 'absC', 'argC_rad']]) or len(child.column('IF_GHz')) == 0:
+                continue
+            IFs, absC = _lastUnique(child.column('IF_GHz'), child.column('absC'))
+            rows.append((LO, IFs, absC, _lastUnique(child.column('IF_GHz'), child.column('argC_rad'))[1]))
+        if not rows:
+            return
+        self.sidebandLO = numpy.array([row[0] for row in rows], dtype=float)
+        self.sidebandIF = numpy.unique(numpy.concatenate([row[1] for row in rows]))
+        self.absC = numpy.array([numpy.interp(self.sidebandIF, row[1], row[2]) for row in rows])
+        self.argC = numpy.array([numpy.interp(self.sidebandIF, row[1], row[3]) for row in rows])
+
+    def hasOffsets(self):
+        return len(self.offsetLO) > 0
+
+    def hasSideband(self):
+        return len(self.sidebandLO) > 0
+
+    def offsets(self, LO):
+        """
+        Returns the (I offset, Q offset) at the carrier frequencies LO (scalar or array).
+        """
+        LO = numpy.asarray(LO, dtype=float)
+        if not self.hasOffsets():
+            return numpy.zeros(LO.shape)[()], numpy.zeros(LO.shape)[()]
+        return numpy.interp(LO, self.offsetLO, self.iOffsets)[()], numpy.interp(LO, self.offsetLO, self.qOffsets)[()]
+
+    def sideband(self, LO, IF):
+        """
+        Returns the bilinearly interpolated (c, phi) corrections at the carrier frequencies LO and sideband frequencies
+        IF (scalars or arrays broadcast together).
+        """
+        LO, IF = numpy.broadcast_arrays(numpy.asarray(LO, dtype=float), numpy.asarray(IF, dtype=float))
+        if not self.hasSideband():
+            return numpy.zeros(LO.shape)[()], numpy.zeros(LO.shape)[()]
+        i, u = _locate(self.sidebandLO, LO)
+        j, v = _locate(self.sidebandIF, IF)
+        i1 = numpy.minimum(i + 1, len(self.sidebandLO) - 1)
+        j1 = numpy.minimum(j + 1, len(self.sidebandIF) - 1)
+        corrections = []
+        for table in [self.absC, self.argC]:
+            corrections.append(((1 - u) * ((1 - v) * table[i, j] + v * table[i, j1]) +
+                                u * ((1 - v) * table[i1, j] + v * table[i1, j1]))[()])
+        return tuple(corrections)
+
+    def corrections(self, LO, IF):
+        """
+        Returns the dictionary {'i0', 'q0', 'c', 'phi'} of the corrections at the carrier frequencies LO and sideband
+        frequencies IF.
+        """
+        i0, q0 = self.offsets(LO)
+        c, phi = self.sideband(LO, IF)
+        return {'i0': i0, 'q0': q0, 'c': c, 'phi': phi}
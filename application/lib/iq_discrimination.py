@@ -0,0 +1,263 @@
+"""
+Batched Gaussian-mixture discrimination of IQ readout distributions.
+
+The IQ distributions of the points of a sweep (amplitude, frequency...) are given as a (nbrPoints, nbrSamples, 2) array,
+or as a list of (nbrSamples, 2) arrays of possibly different lengths. fitSweep() fits a mixture of nComponents 2D
+Gaussians with full covariances to all the points at once, the expectation-maximization iterations being vectorized
+across points and components:
+  - a first pass fits the anchor points (one point every anchorStep points, all the points if warmStart=False), each
+    one started from the split of its distribution along its principal axis;
+  - a second pass fits all the other points at once, each one warm-started from the solution of its nearest anchor.
+Converged points are dropped from the iterations, so that the cost follows the total number of iterations.
+The components of each point are sorted by decreasing weights, as in jba_sb.multiGaussianClusters().
+separatrices() gives, for all the points, the separatrix orthogonal to the segment joining the two main centers (as
+jba_sb.separatrixBimodal()), the threshold along this segment and the assignment fidelities, and separatrixLine() the
+line y = a x + b fitted through the separatrix points of the sweep (as jba_sb.separatrixMulti()).
+"""
+
+import math
+import numpy
+import scipy.special
+
+
+class MixtureFit(object):
+    """
+    Gaussian mixtures of the points of a sweep: weights (P, K), means (P, K, 2), covariances (P, K, 2, 2),
+    logLikelihoods (P,) (mean per sample) and iterations (P,).
+    """
+
+    def __init__(self, weights, means, covariances, logLikelihoods=None, iterations=None):
+        self.weights = weights
+        self.means = means
+        self.covariances = covariances
+        self.logLikelihoods = logLikelihoods
+        self.iterations = iterations
+
+    def __len__(self):
+        return len(self.weights)
+
+    def sigmas(self):
+        """
+        Returns (angles, sigmas): the angles (in radians) of the principal axes of largest variance, and the standard
+        deviations along the principal axes (largest first), of all the components.
+        """
+        eigvals, eigvecs = numpy.linalg.eigh(self.covariances)
+        angles = numpy.arctan2(eigvecs[..., 1, 1], eigvecs[..., 0, 1])
+        return angles, numpy.sqrt(numpy.maximum(eigvals[..., ::-1], 0.))
+
+    def model(self, index):
+        """
+        Returns the mixture of point index in the format of jba_sb.multiGaussianClusters():
+        ([weight, center, angle in degrees, sigmas], ...).
+        """
+        angles, sigmas = self.sigmas()
+        return tuple([[self.weights[index, k], self.means[index, k], numpy.rad2deg(angles[index, k]), sigmas[index, k]]
+                      for k in range(self.weights.shape[1])])
+
+
+def _stack(distributions):
+    """
+    Private function returning (samples (P, N, 2), mask (P, N)) from a list of (n_i, 2) distributions or an array.
+    """
+    if isinstance(distributions, numpy.ndarray) and distributions.ndim == 3:
+        return distributions.astype(float), numpy.ones(distributions.shape[:2])
+    lengths = [len(distribution) for distribution in distributions]
+    samples = numpy.zeros((len(distributions), max(lengths), 2))
+    mask = numpy.zeros((len(distributions), max(lengths)))
+    for i, distribution in enumerate(distributions):
+        samples[i, :lengths[i]] = distribution
+        mask[i, :lengths[i]] = 1.
+    return samples, mask
+
+
+def _logDensities(samples, weights, means, covariances):
+    """
+    Private function returning the (P, K, N) log of weight * density of the components for all samples.
+    """
+    a, b, d = covariances[..., 0, 0], covariances[..., 0, 1], covariances[..., 1, 1]
+    det = a * d - b * b
+    dx = samples[:, numpy.newaxis, :, 0] - means[:, :, numpy.newaxis, 0]
+    dy = samples[:, numpy.newaxis, :, 1] - means[:, :, numpy.newaxis, 1]
+    mahalanobis = (d[..., numpy.newaxis] * dx * dx - 2 * b[..., numpy.newaxis] * dx * dy +
+                   a[..., numpy.newaxis] * dy * dy) / det[..., numpy.newaxis]
+    return (numpy.log(weights) - math.log(2 * math.pi) - 0.5 * numpy.log(det))[..., numpy.newaxis] - 0.5 * mahalanobis
+
+
+def _maximize(samples, mask, responsibilities, regularization):
+    """
+    Private function returning (weights, means, covariances) from the (P, K, N) responsibilities.
+    """
+    responsibilities = responsibilities * mask[:, numpy.newaxis, :]
+    counts = responsibilities.sum(axis=2) + 1e-12
+    weights = counts / mask.sum(axis=1)[:, numpy.newaxis]
+    means = numpy.matmul(responsibilities, samples) / counts[..., numpy.newaxis]
+    x, y = samples[..., 0], samples[..., 1]
+    covariances = numpy.empty(means.shape + (2,))
+    covariances[..., 0, 0] = numpy.matmul(responsibilities, (x * x)[..., numpy.newaxis])[..., 0] / counts
+    covariances[..., 0, 1] = numpy.matmul(responsibilities, (x * y)[..., numpy.newaxis])[..., 0] / counts
+    covariances[..., 1, 1] = numpy.matmul(responsibilities, (y * y)[..., numpy.newaxis])[..., 0] / counts
+    covariances[..., 1, 0] = covariances[..., 0, 1]
+    covariances -= means[..., :, numpy.newaxis] * means[..., numpy.newaxis, :]
+    covariances[..., 0, 0] += regularization
+    covariances[..., 1, 1] += regularization
+    return weights, means, covariances
+
+
+def _principalSplit(samples, mask, nComponents, regularization):
+    """
+    Private function returning initial (weights, means, covariances) by splitting each distribution in nComponents
+    slices of equal populations along its principal axis.
+    """
+    counts = mask.sum(axis=1)
+    mean = (samples * mask[..., numpy.newaxis]).sum(axis=1) / counts[:, numpy.newaxis]
+    centered = (samples - mean[:, numpy.newaxis, :]) * mask[..., numpy.newaxis]
+    covariance = numpy.einsum('pnd,pne->pde', centered, centered) / counts[:, numpy.newaxis, numpy.newaxis]
+    axis = numpy.linalg.eigh(covariance)[1][..., -1]
+    projections = numpy.einsum('pnd,pd->pn', centered, axis)
+    projections[mask == 0] = numpy.nan
+    limits = numpy.nanpercentile(projections, numpy.linspace(0, 100, nComponents + 1)[1:-1], axis=1).T
+    labels = (projections[:, :, numpy.newaxis] > limits[:, numpy.newaxis, :]).sum(axis=2)
+    responsibilities = (labels[:, numpy.newaxis, :] == numpy.arange(nComponents)[numpy.newaxis, :, numpy.newaxis])
+    return _maximize(samples, mask, responsibilities.astype(float), regularization)
+
+
+def _expectationMaximization(samples, mask, weights, means, covariances, maxIterations, tolerance, regularization):
+    """
+    Private function running the EM iterations on all points until the mean log-likelihood of every point changes by
+    less than tolerance. Returns a MixtureFit.
+    """
+    nbrPoints = len(samples)
+    counts = mask.sum(axis=1)
+    logLikelihoods = numpy.empty(nbrPoints)
+    logLikelihoods.fill(-numpy.inf)
+    iterations = numpy.zeros(nbrPoints, dtype=int)
+    index = numpy.arange(nbrPoints)
+    # compacted arrays of the active points, reindexed only when some of them converge
+    active = [samples, mask, counts, weights.copy(), means.copy(), covariances.copy(), logLikelihoods.copy()]
+    for i in range(maxIterations):
+        if len(index) == 0:
+            break
+        activeSamples, activeMask, activeCounts, activeWeights, activeMeans, activeCovariances, previous = active
+        logDensities = _logDensities(activeSamples, activeWeights, activeMeans, activeCovariances)
+        norm = numpy.logaddexp.reduce(logDensities, axis=1)
+        current = (norm * activeMask).sum(axis=1) / activeCounts
+        responsibilities = numpy.exp(logDensities - norm[:, numpy.newaxis, :])
+        activeWeights, activeMeans, activeCovariances = _maximize(activeSamples, activeMask, responsibilities,
+                                                                  regularization)
+        iterations[index] += 1
+        converged = numpy.abs(current - previous) < tolerance
+        active = [activeSamples, activeMask, activeCounts, activeWeights, activeMeans, activeCovariances, current]
+        if converged.any() or i == maxIterations - 1:
+            done = converged if i < maxIterations - 1 else numpy.ones(len(index), dtype=bool)
+            weights[index[done]], means[index[done]] = activeWeights[done], activeMeans[done]
+            covariances[index[done]], logLikelihoods[index[done]] = activeCovariances[done], current[done]
+            active = [array[~done] for array in active]
+            index = index[~done]
+    return MixtureFit(weights, means, covariances, logLikelihoods, iterations)
+
+
+def _sortByWeight(fit):
+    order = numpy.argsort(-fit.weights, axis=1)
+    points = numpy.arange(len(fit))[:, numpy.newaxis]
+    return MixtureFit(fit.weights[points, order], fit.means[points, order], fit.covariances[points, order],
+                      fit.logLikelihoods, fit.iterations)
+
+
+def fitSweep(distributions, nComponents=2, warmStart=True, init=None, anchorStep=8, maxIterations=100,
+             tolerance=1e-6, regularization=1e-9):
+    """
+    Fits a mixture of nComponents Gaussians to the IQ distributions of all the points of a sweep (see module docstring).
+    init is an optional MixtureFit of the same number of points to start from.
+    Returns a MixtureFit with the components sorted by decreasing weights.
+    """
+    samples, mask = _stack(distributions)
+    nbrPoints = len(samples)
+    if init is not None:
+        start = (init.weights.copy(), init.means.copy(), init.covariances.copy())
+        return _sortByWeight(_expectationMaximization(samples, mask, *(start + (maxIterations, tolerance,
+                                                                                regularization))))
+    anchors = numpy.arange(nbrPoints)
+    if warmStart and nbrPoints > 1:
+        anchors = numpy.unique(numpy.append(anchors[::max(anchorStep, 1)], nbrPoints - 1))
+    start = _principalSplit(samples[anchors], mask[anchors], nComponents, regularization)
+    anchorFit = _expectationMaximization(samples[anchors], mask[anchors],
+                                         *(start + (maxIterations, tolerance, regularization)))
+    fit = MixtureFit(numpy.empty((nbrPoints, nComponents)), numpy.empty((nbrPoints, nComponents, 2)),
+                     numpy.empty((nbrPoints, nComponents, 2, 2)), numpy.empty(nbrPoints),
+                     numpy.zeros(nbrPoints, dtype=int))
+    for name in ['weights', 'means', 'covariances', 'logLikelihoods', 'iterations']:
+        getattr(fit, name)[anchors] = getattr(anchorFit, name)
+    others = numpy.setdiff1d(numpy.arange(nbrPoints), anchors)
+    if len(others):
+        # each other point starts from the solution of its nearest anchor
+        nearest = anchors[numpy.abs(others[:, numpy.newaxis] - anchors[numpy.newaxis, :]).argmin(axis=1)]
+        start = (fit.weights[nearest].copy(), fit.means[nearest].copy(), fit.covariances[nearest].copy())
+        warm = _expectationMaximization(samples[others], mask[others],
+                                        *(start + (maxIterations, tolerance, regularization)))
+        for name in ['weights', 'means', 'covariances', 'logLikelihoods', 'iterations']:
+            getattr(fit, name)[others] = getattr(warm, name)
+    return _sortByWeight(fit)
+
+
+def fitDistribution(distribution, nComponents=2, init=None, **kwargs):
+    """
+    Fits a mixture of nComponents Gaussians to a single (N, 2) distribution, starting from init (a MixtureFit of one
+    point, e.g. the fit of the previous point of a sweep) if given. Returns a MixtureFit of one point.
+    """
+    return fitSweep([distribution], nComponents, warmStart=False, init=init, **kwargs)
+
+
+def separatrices(fit):
+    """
+    Returns for all the points of fit the dictionary of arrays:
+      - 'points' (P, 2): separatrix points on the segments joining the centers c1 and c2 of the two main components;
+      - 'angles' (P,): angles between x and the separatrices;
+      - 'weights' (P, 2), 'centers' (P, 2, 2): weights and centers of the two main components;
+      - 'sigmas' (P, 2): radii of the 1-sigma ellipses of the components along c1c2;
+      - 'thresholds' (P,): distances from c1 to the separatrix point along c1c2;
+      - 'fidelities' (P, 2): probabilities that a sample of each component is on its side of the separatrix;
+      - 'fidelity' (P,): readout fidelities 1 - P(2|1) - P(1|2).
+    """
+    centers = fit.means[:, :2]
+    covariances = fit.covariances[:, :2]
+    c1c2 = centers[:, 1] - centers[:, 0]
+    distances = numpy.sqrt((c1c2 ** 2).sum(axis=1))
+    u = c1c2 / distances[:, numpy.newaxis]
+    inverses = numpy.linalg.inv(covariances)
+    sigmas = 1. / numpy.sqrt(numpy.einsum('pd,pkde,pe->pk', u, inverses, u))
+    thresholds = sigmas[:, 0] / sigmas.sum(axis=1) * distances
+    points = centers[:, 0] + thresholds[:, numpy.newaxis] * u
+    marginals = numpy.sqrt(numpy.einsum('pd,pkde,pe->pk', u, covariances, u))
+    errors = 0.5 * scipy.special.erfc(numpy.array([thresholds, distances - thresholds]).T / (math.sqrt(2) * marginals))
+    return {'points': points, 'angles': numpy.arctan2(u[:, 1], u[:, 0]) + math.pi / 2, 'weights': fit.weights[:, :2],
+            'centers': centers, 'sigmas': sigmas, 'thresholds': thresholds, 'fidelities': 1. - errors,
+            'fidelity': 1. - errors.sum(axis=1)}
+
+
+def separatrixLine(separatrix, wMin=0., wMax=1.):
+    """
+    Returns ([a, b], status) of the line y = a x + b fitted through the separatrix points of the points whose weights
+    differ by at most abs(wMax - wMin), status being 'ok', 'invalid' if the line passes outside the two centers or
+    closer than a sigma to one of them for a selected point, or an error message if no point is selected.
+    """
+    weights = separatrix['weights']
+    selected = numpy.abs(weights[:, 1] - weights[:, 0]) <= abs(wMax - wMin)
+    points = separatrix['points'][selected]
+    if len(points) == 0:
+        return None, 'Error:Cannot proceed with an empty list of separatrices.'
+    if len(points) == 1:
+        a = math.tan(separatrix['angles'][selected][0])
+        return numpy.array([a, points[0, 1] - a * points[0, 0]]), 'ok'
+    A = numpy.vstack([points[:, 0], numpy.ones(len(points))]).T
+    a, b = coefficients = numpy.linalg.lstsq(A, points[:, 1], rcond=-1)[0]
+    c1, c2 = separatrix['centers'][selected, 0], separatrix['centers'][selected, 1]
+    c1c2 = c2 - c1
+    # intersections of the line with the segments c1c2
+    xi = ((b - c1[:, 1]) * c1c2[:, 0] + c1[:, 0] * c1c2[:, 1]) / (-a * c1c2[:, 0] + c1c2[:, 1])
+    intersections = numpy.array([xi, a * xi + b]).T
+    d1, d2 = c1 - intersections, c2 - intersections
+    inside = (d1 * d2).sum(axis=1) < 0
+    sigmas = separatrix['sigmas'][selected]
+    tooClose = (numpy.sqrt((d1 ** 2).sum(axis=1)) < sigmas[:, 0]) | (numpy.sqrt((d2 ** 2).sum(axis=1)) < sigmas[:, 1])
+    status = 'ok' if numpy.all(inside & ~tooClose) else 'invalid'
+    return coefficients, status
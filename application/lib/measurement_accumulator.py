@@ -0,0 +1,127 @@
+"""
+Streaming accumulation of the results of a measurement taken in chunks.
+
+A long measurement (e.g. nLoops acquisitions of a JBA split in chunks of at most _nLoopsMax loops) gives, for each
+chunk, a dictionary {key: value} of averages over the weight (number of loops) of the chunk. A MeasurementAccumulator
+keeps for each key the weighted running mean and variance of the chunk values (West's incremental algorithm), so that
+after each chunk:
+  - means() are the averages over all the loops of the successful chunks;
+  - errors() are the standard errors of these means, estimated from the dispersion of the chunks;
+  - converged(target) tells whether the errors are below a target uncertainty, to stop the measurement early.
+Chunks failing after all their retries are recorded once by addFailure() with their weight and error, so that the
+sample actually averaged is known; the failed attempts that were retried are only counted by addRetry().
+"""
+
+import math
+
+
+class MeasurementAccumulator(object):
+    """
+    Weighted running means and variances of the values of chunks of a measurement (see module docstring).
+    """
+
+    def __init__(self):
+        self.clear()
+
+    def clear(self):
+        self._stats = dict()        # {key: [sum of weights, sum of squared weights, mean, sum of weighted squares]}
+        self.chunks = 0
+        self.weight = 0.
+        self.failedChunks = 0
+        self.failedWeight = 0.
+        self.failures = []          # [(weight, error message)]
+        self.retries = 0            # failed attempts retried
+
+    def add(self, values, weight=1.):
+        """
+        Adds the dictionary values of the averages over a chunk of the given weight.
+        The values that are not numbers are ignored.
+        """
+        weight = float(weight)
+        if weight <= 0:
+            return
+        for key, value in values.items():
+            try:
+                value = float(value)
+            except (TypeError, ValueError):
+                continue
+            stats = self._stats.setdefault(key, [0., 0., 0., 0.])
+            stats[0] += weight
+            stats[1] += weight ** 2
+            delta = value - stats[2]
+            stats[2] += delta * weight / stats[0]
+            stats[3] += weight * delta * (value - stats[2])
+        self.chunks += 1
+        self.weight += weight
+
+    def addRetry(self, error=None):
+        """
+        Counts a failed attempt of a chunk that is retried.
+        """
+        self.retries += 1
+
+    def addFailure(self, weight, error=None):
+        """
+        Records a chunk of the given weight lost after all its attempts failed.
+        """
+        self.failedChunks += 1
+        self.failedWeight += weight
+        self.failures.append((weight, '%s: %s' % (type(error).__name__, error) if error is not None else ''))
+
+    def means(self):
+        """
+        Returns the dictionary of the weighted means.
+        """
+        return dict([(key, stats[2]) for key, stats in self._stats.items()])
+
+    def variance(self, key):
+        """
+        Returns the weighted variance of the chunk values of key (None with less than two chunks).
+        """
+        weights, squaredWeights, mean, squares = self._stats[key]
+        denominator = weights - squaredWeights / weights
+        if denominator <= 0:
+            return None
+        return squares / denominator
+
+    def error(self, key):
+        """
+        Returns the standard error of the mean of key (None with less than two chunks).
+        """
+        variance = self.variance(key)
+        if variance is None:
+            return None
+        weights, squaredWeights = self._stats[key][:2]
+        return math.sqrt(max(variance, 0.) * squaredWeights) / weights
+
+    def errors(self):
+        """
+        Returns the dictionary of the standard errors of the means.
+        """
+        return dict([(key, self.error(key)) for key in self._stats])
+
+    def uncertainty(self, keys=None):
+        """
+        Returns the largest standard error of the keys (all keys if None), None if it cannot be estimated yet.
+        """
+        if keys is None:
+            keys = self._stats.keys()
+        errors = [self.error(key) for key in keys if key in self._stats]
+        if not errors or None in errors:
+            return None
+        return max(errors)
+
+    def converged(self, target, keys=None, minChunks=2):
+        """
+        Returns True if at least minChunks chunks were added and the uncertainty of keys is at most target.
+        """
+        uncertainty = self.uncertainty(keys)
+        return self.chunks >= minChunks and uncertainty is not None and uncertainty <= target
+
+    def summary(self):
+        """
+        Returns {'means', 'errors', 'chunks', 'weight', 'failedChunks', 'failedWeight', 'failures', 'retries'}.
+        """
+        return {'means': self.means(), 'errors': self.errors(), 'chunks': self.chunks, 'weight': self.weight,
+                'failedChunks': self.failedChunks, 'failedWeight': self.failedWeight, 'failures': list(self.failures),
+                'retries': self.retries}
@@ -0,0 +1,223 @@
+"""
+Snapshots and restores of the states of a rack of instruments.
+
+takeSnapshot(instruments) queries the current states of the instruments concurrently, one thread per VISA resource
+(instruments sharing a resource, as the units of a rack, are queried one after the other), with a per-instrument timeout.
+The instruments without VISA address, as the composite instruments driving several VISA instruments, are queried one
+after the other once the VISA instruments are done. The VISA calls of an instrument are serialized by its I/O lock
+(see VisaInstrument.ioLock()).
+It returns a RackSnapshot with:
+  - states: {instrument name: state} of the instruments that answered in time;
+  - errors: {instrument name: error message} of the others;
+  - diff(previous): {instrument name: differences} of the states that changed since a previous snapshot.
+restoreSnapshot(instruments, snapshot) restores the states of the snapshot one after the other in the order given, only
+for the instruments whose current state differs if current (a snapshot of the current states) is given.
+Snapshots are saved with dump(filename) and read with RackSnapshot.load(filename), in binary (cPickle) if the filename
+ends with .pickle and otherwise in YAML with the C emitter and parser of libyaml when available.
+"""
+
+import time
+import cPickle
+import yaml
+import numpy
+
+from application.lib.visa_completion import OperationFuture, OperationTimeoutError
+
+try:
+    _YamlDumper, _YamlLoader = yaml.CDumper, yaml.CLoader
+except AttributeError:
+    _YamlDumper, _YamlLoader = yaml.Dumper, yaml.Loader
+
+
+def resourceKey(instrument):
+    """
+    Returns the key of the resource of an instrument: its VISA address if any, and otherwise its name.
+    """
+    try:
+        address = instrument.visaAddress()
+    except Exception:
+        address = None
+    return address if address is not None else instrument.name()
+
+
+def statesEqual(state1, state2, rtol=0.):
+    """
+    Returns True if two states (nested dictionaries, lists, numbers, strings or numpy arrays) are equal,
+    numbers being compared with the relative tolerance rtol.
+    """
+    if isinstance(state1, dict) and isinstance(state2, dict):
+        return set(state1) == set(state2) and all([statesEqual(state1[key], state2[key], rtol) for key in state1])
+    if isinstance(state1, (list, tuple)) and isinstance(state2, (list, tuple)):
+        return len(state1) == len(state2) and all([statesEqual(a, b, rtol) for a, b in zip(state1, state2)])
+    if isinstance(state1, numpy.ndarray) or isinstance(state2, numpy.ndarray):
+        try:
+            return numpy.shape(state1) == numpy.shape(state2) and numpy.allclose(state1, state2, rtol=rtol, atol=0.)
+        except TypeError:
+            return numpy.array_equal(state1, state2)
+    if isinstance(state1, float) or isinstance(state2, float):
+        try:
+            return abs(state1 - state2) <= rtol * max(abs(state1), abs(state2))
+        except TypeError:
+            return False
+    return state1 == state2
+
+
+def stateDiff(previous, current, rtol=0.):
+    """
+    Returns the differences between two states: {key: (previous value, current value)} for dictionaries,
+    or {None: (previous, current)} for other states (empty dictionary if the states are equal).
+    """
+    if isinstance(previous, dict) and isinstance(current, dict):
+        return dict([(key, (previous.get(key), current.get(key))) for key in set(previous) | set(current)
+                     if key not in previous or key not in current or not statesEqual(previous[key], current[key], rtol)])
+    if statesEqual(previous, current, rtol):
+        return {}
+    return {None: (previous, current)}
+
+
+def _runGroups(groups, function, timeout, interval=1e-3):
+    """
+    Private function calling function(instrument) for the instruments of each group one after the other, the groups
+    being run concurrently, each call being given up after timeout seconds (the next calls of the group are then
+    skipped). Returns ({name: result}, {name: error message}).
+    """
+    instruments = [instrument for group in groups for instrument in group]
+    started = dict()    # {name: start time of the call}
+    futures = dict([(instrument.name(), OperationFuture(instrument.name())) for instrument in instruments])
+
+    def runGroup(group):
+        for instrument in group:
+            future = futures[instrument.name()]
+            if future.done():               # given up
+                return
+            started[instrument.name()] = time.time()
+            try:
+                future.setResult(function(instrument))
+            except Exception as error:
+                future.setException(error)
+    for group in groups:
+        OperationFuture(group[0].name()).start(runGroup, group)
+    results, errors = dict(), dict()
+    pending = [[instrument.name() for instrument in group] for group in groups]
+    while any(pending):
+        for names in pending:
+            while names and futures[names[0]].done():
+                name = names.pop(0)
+                try:
+                    results[name] = futures[name].result()
+                except Exception as error:
+                    errors[name] = '%s: %s' % (type(error).__name__, error)
+            if names and names[0] in started and time.time() - started[names[0]] > timeout:
+                for name in names:
+                    futures[name].setException(OperationTimeoutError())
+                errors[names[0]] = 'no answer after %s s' % timeout
+                errors.update([(name, 'skipped (%s did not answer)' % names[0]) for name in names[1:]])
+                del names[:]
+        time.sleep(interval)
+    return results, errors
+
+
+def _runByResource(instruments, function, timeout, interval=1e-3):
+    """
+    Private function calling function(instrument) for all instruments, concurrently for the VISA instruments of
+    different resources, then one after the other for the instruments without VISA address (composite instruments
+    driving the VISA instruments, remote instruments...), each call being given up after timeout seconds.
+    Returns ({name: result}, {name: error message}).
+    """
+    groups, others = dict(), []
+    for instrument in instruments:
+        key = resourceKey(instrument)
+        if key == instrument.name():
+            others.append(instrument)
+        else:
+            groups.setdefault(key, []).append(instrument)
+    results, errors = _runGroups(groups.values(), function, timeout, interval)
+    if others:
+        otherResults, otherErrors = _runGroups([others], function, timeout, interval)
+        results.update(otherResults)
+        errors.update(otherErrors)
+    return results, errors
+
+
+class RackSnapshot(object):
+    """
+    The states of a rack of instruments at a given time (see module docstring).
+    """
+
+    def __init__(self, states=None, errors=None, timestamp=None, duration=0.):
+        self.states = states if states is not None else dict()
+        self.errors = errors if errors is not None else dict()
+        self.timestamp = timestamp if timestamp is not None else time.time()
+        self.duration = duration
+
+    def __repr__(self):
+        return '<RackSnapshot of %i instruments (%i errors) taken in %.3f s>' % (len(self.states), len(self.errors),
+                                                                                 self.duration)
+
+    def diff(self, previous, rtol=0.):
+        """
+        Returns {instrument name: stateDiff} for the instruments whose state differs from the snapshot previous
+        (instruments absent from previous have the difference {None: (None, state)}).
+        """
+        diff = dict()
+        for name, state in self.states.items():
+            if name in previous.states:
+                differences = stateDiff(previous.states[name], state, rtol)
+            else:
+                differences = {None: (None, state)}
+            if differences:
+                diff[name] = differences
+        return diff
+
+    def toDict(self):
+        return {'states': self.states, 'errors': self.errors, 'timestamp': self.timestamp, 'duration': self.duration}
+
+    def dump(self, filename):
+        """
+        Saves the snapshot to filename, in binary if filename ends with .pickle and in YAML otherwise.
+        """
+        with open(filename, 'wb') as snapshotFile:
+            if filename.endswith('.pickle'):
+                cPickle.dump(self.toDict(), snapshotFile, cPickle.HIGHEST_PROTOCOL)
+            else:
+                yaml.dump(self.toDict(), snapshotFile, Dumper=_YamlDumper)
+
+    @classmethod
+    def load(cls, filename):
+        """
+        Returns the snapshot saved in filename.
+        """
+        with open(filename, 'rb') as snapshotFile:
+            if filename.endswith('.pickle'):
+                dictionary = cPickle.load(snapshotFile)
+            else:
+                dictionary = yaml.load(snapshotFile, Loader=_YamlLoader)
+        return cls(**dictionary)
+
+
+def takeSnapshot(instruments, timeout=10.):
+    """
+    Returns a RackSnapshot of the current states of the instruments, queried concurrently (see module docstring).
+    """
+    t0 = time.time()
+    states, errors = _runByResource(instruments, lambda instrument: instrument.currentState(), timeout)
+    return RackSnapshot(states, errors, t0, time.time() - t0)
+
+
+def restoreSnapshot(instruments, snapshot, current=None, timeout=10., rtol=0.):
+    """
+    Restores the states of snapshot for the instruments, or only for those whose state in the snapshot current differs
+    if current is not None. The states are restored one after the other in the order of instruments (the restore of an
+    instrument may depend on the previous ones, as for a composite instrument and its sub-instruments), the following
+    restores being skipped if one is given up after timeout seconds.
+    Returns ({name: result of restoreState} of the instruments restored, {name: error message}).
+    """
+    instruments = [instrument for instrument in instruments if instrument.name() in snapshot.states]
+    if current is not None:
+        diff = snapshot.diff(current, rtol)
+        instruments = [instrument for instrument in instruments
+                       if instrument.name() in diff or instrument.name() in current.errors]
+    if not instruments:
+        return dict(), dict()
+    return _runGroups([instruments], lambda instrument: instrument.restoreState(snapshot.states[instrument.name()]),
+                      timeout)
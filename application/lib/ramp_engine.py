@@ -0,0 +1,170 @@
+"""
+Asynchronous slewed ramps of DC sources.
+
+A Ramp brings the output of a source from its current value to a target value at a given slew rate.
+Ramps are run by a RampScheduler in a background thread, which steps all the active ramps at each tick, so that several
+sources ramp simultaneously and the calling script is not blocked:
+    ramps = [yoko1.setVoltage(0.5, slewrate=0.1, wait=False), yoko2.setVoltage(-0.2, slewrate=0.1, wait=False)]
+    waitAll(ramps)
+The value written at each tick is computed from the time elapsed since the start of the ramp, so that the slew rate
+does not depend on the time taken by the I/O. A Ramp is an OperationFuture: ramp.result() waits for the end of the ramp
+and returns the value read back, and ramp.cancel() stops the source at its current value.
+Starting a ramp on a source cancels the ramp already running on it.
+"""
+
+import time
+import threading
+
+from application.lib.visa_completion import OperationFuture
+
+
+class Ramp(OperationFuture):
+    """
+    A ramp of a source to the value stop at slewrate (in units per second):
+      - setValue(value): function writing the output value of the source;
+      - readValue(): function reading the output value of the source (start value if start is None, and result);
+      - minStep: smallest change of the value written to the source (the precision of the source), or a function
+        returning it, called in the scheduler thread at the start of the ramp;
+      - progress(value): function called with the value written, at most every notifyInterval seconds and at the end.
+    """
+
+    def __init__(self, name, setValue, stop, slewrate, start=None, readValue=None, minStep=0., progress=None,
+                 notifyInterval=0.2):
+        OperationFuture.__init__(self, name)
+        if not slewrate:
+            raise ValueError('A ramp needs a non zero slew rate.')
+        self.stop = float(stop)
+        self.slewrate = abs(float(slewrate))
+        self.start = start
+        self._setValue = setValue
+        self._readValue = readValue
+        self._minStep = minStep
+        self._progress = progress
+        self.notifyInterval = notifyInterval
+        self.value = start
+        self._t0 = None
+        self._lastNotification = 0.
+
+    def duration(self):
+        """
+        Returns the duration of the ramp in seconds (None if not started yet).
+        """
+        if self.start is None:
+            return None
+        return abs(self.stop - self.start) / self.slewrate
+
+    def valueAt(self, t):
+        """
+        Returns the value of the ramp at time t.
+        """
+        if self.stop > self.start:
+            return min(self.start + self.slewrate * (t - self._t0), self.stop)
+        return max(self.start - self.slewrate * (t - self._t0), self.stop)
+
+    def step(self, now):
+        """
+        Writes the value of the ramp at time now if it differs by at least minStep from the last written one.
+        Returns True when the ramp is finished.
+        """
+        if self._t0 is None:
+            if self.start is None:
+                self.start = self._readValue()
+            if hasattr(self._minStep, '__call__'):
+                self._minStep = self._minStep()
+            self.value = self.start
+            self._t0 = now
+        value = self.valueAt(now)
+        finished = value == self.stop
+        if finished or abs(value - self.value) >= self._minStep:
+            self._setValue(value)
+            self.value = value
+            if self._progress is not None and (finished or now - self._lastNotification >= self.notifyInterval):
+                self._lastNotification = now
+                self._progress(value)
+        if finished:
+            self.setResult(self._readValue() if self._readValue is not None else value)
+        return finished
+
+
+class RampScheduler(object):
+    """
+    Runs the active ramps in a background thread, stepping each of them every stepTime seconds.
+    The thread is started with the first ramp and ends when no ramp is active.
+    """
+
+    def __init__(self, stepTime=0.05):
+        self.stepTime = stepTime
+        self._lock = threading.RLock()
+        self._ramps = dict()        # {source: ramp}
+        self._thread = None
+
+    def start(self, ramp, source=None):
+        """
+        Starts ramp on source (any hashable object identifying the source, ramp.name if None), cancelling the ramp
+        already running on it, and returns ramp.
+        """
+        if source is None:
+            source = ramp.name
+        with self._lock:
+            previous = self._ramps.get(source)
+            if previous is not None:
+                previous.cancel()
+            self._ramps[source] = ramp
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='RampScheduler')
+                self._thread.daemon = True
+                self._thread.start()
+        return ramp
+
+    def ramp(self, source):
+        """
+        Returns the ramp running on source (or None).
+        """
+        return self._ramps.get(source)
+
+    def ramps(self):
+        """
+        Returns the dictionary {source: ramp} of the active ramps.
+        """
+        with self._lock:
+            return dict(self._ramps)
+
+    def cancel(self, source=None):
+        """
+        Cancels the ramp running on source (all ramps if None).
+        """
+        with self._lock:
+            for key, ramp in self._ramps.items():
+                if source is None or key == source:
+                    ramp.cancel()
+
+    def _run(self):
+        while True:
+            tick = time.time()
+            with self._lock:
+                for source, ramp in self._ramps.items():
+                    if not ramp.done():
+                        try:
+                            ramp.step(time.time())
+                        except Exception as error:
+                            ramp.setException(error)
+                    if ramp.done():
+                        del self._ramps[source]
+                if not self._ramps:
+                    self._thread = None
+                    return
+            # the next tick is stepTime after this one, whatever the time spent in the I/O
+            time.sleep(max(0., tick + self.stepTime - time.time()))
+
+
+_scheduler = None
+
+
+def rampScheduler():
+    """
+    Returns the RampScheduler shared by the sources.
+    """
+    global _scheduler
+    if _scheduler is None:
+        _scheduler = RampScheduler()
+    return _scheduler
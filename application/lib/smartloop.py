@@ -54,6 +54,8 @@ class SmartLoop(Debugger, Subject, Observer, Reloadable):
         using methods 'setAutoreverse', 'getAutoreverse', 'setAutoLoop', 'getAutoLoop'.
       Duration of an iteration averaged over all previous iterations (that were not paused) can be obtained using 'iterationDuration()'.
       A dictionary including all loop parameters as well as an estimate of the remaining time before termination is obtained with method 'getParams'
+      The planned trajectory of the loop up to its next termination is obtained as a numpy array with 'sweepPlan()',
+        and the cartesian product of the trajectories of the loop and its descendants with 'nestedSweepPlan()'.
 
     Iteration mechanism:
       As any other iterator in python, the smartloop increments itself by its next() method, which
@@ -109,6 +111,7 @@ class SmartLoop(Debugger, Subject, Observer, Reloadable):
                 self._step = (stop - start) / linnsteps
             else:
                 self._stop = start + linnsteps * self._step
+            self._invalidatePlan()
 
         self._lm = None               # loop can have a loop manager
         if toLoopManager:             # and adds itself to it if toManager is true.
@@ -130,6 +133,7 @@ class SmartLoop(Debugger, Subject, Observer, Reloadable):
         self._previousValue = None    # previousValue will be valued at second iteration
         self._paused = False
         self._finished = False
+        self._plan = None               # cached sweep plan (see sweepPlan())
 
         # time management
         self._time = None               # time of the last iteration
@@ -294,6 +298,9 @@ class SmartLoop(Debugger, Subject, Observer, Reloadable):
             if nextVal is None:
                 self._finished = True
             else:
+                # a value out of the cached plan (autoloop restart) starts a new plan
+                if self._plan is not None and self._plan.indexOf(nextVal) is None:
+                    self._invalidatePlan()
                 self.incrementIndexValue(nextVal)
         self._imposedValue = None
         self.debugPrint(' new value=', self._value,
@@ -514,6 +521,9 @@ class SmartLoop(Debugger, Subject, Observer, Reloadable):
             # It is self._start at start with self._start being always a number
             # at start
             steps2Go = 0
+        elif isinstance(nextVal, (int, long, float)) and self.sweepPlan() is not None:
+            # O(1) count in the sweep plan
+            steps2Go = self._plan.stepsFrom(nextVal)
         elif all([isinstance(v, (int, long, float)) for v in [self._step, nextVal]]):
             steps2Go, steps2Start, steps2Stop = None, None, None
             if self._value is not None and isinstance(self._start, (int, long, float)):
@@ -546,6 +556,59 @@ class SmartLoop(Debugger, Subject, Observer, Reloadable):
         """ returns the list of tuples (index,output value,time) """
         return self._history
 
+    # Sweep plans
+
+    def _buildPlan(self, origin):
+        """
+        Private function.
+        Returns a SweepPlan of the loop starting at origin, or None if the loop parameters are not numerical.
+        """
+        try:
+            return SweepPlan(self._start, self._stop, self._step, origin=origin, mode=self.getMode())
+        except ValueError:
+            return None
+
+    def _invalidatePlan(self):
+        """
+        Private function.
+        Clears the cached sweep plan after a change of the loop parameters.
+        """
+        self._plan = None
+
+    def sweepPlan(self, fromStart=False):
+        """
+        Returns the SweepPlan of the loop, i.e. the values it will output up to its next termination (or reversion or restart),
+        or None if start, stop or step is not a number.
+        The plan starts at the imposed value if jumpToValue was called, at the current value if the loop is running,
+        or at the first value otherwise or if fromStart is true.
+        The plan is cached and invalidated by any change of the loop parameters (setStart, setStop, setStep, reverse, jumpToValue,...).
+        """
+        if fromStart:
+            return self._buildPlan(self._first)
+        if self._plan is None:
+            origin = self._imposedValue
+            if origin is None:
+                origin = self._value
+            if origin is None:
+                origin = self._start if self._start is not None else self._first
+            self._plan = self._buildPlan(origin)
+        return self._plan
+
+    def nestedSweepPlan(self, snake=False):
+        """
+        Returns the NestedSweepPlan of the loop and of its chain of first descendants (children()[0], grand-children()[0],...),
+        or None if one of these loops has no sweep plan.
+        Descendants are planned from their first value since they are reinitialized at each iteration of their parent.
+        If snake is True, inner loops are traversed alternatively forward and backward.
+        """
+        loops = [self]
+        while loops[-1].children():
+            loops.append(loops[-1].children()[0])
+        plans = [self.sweepPlan()] + [loop.sweepPlan(fromStart=True) for loop in loops[1:]]
+        if any([plan is None for plan in plans]):
+            return None
+        return NestedSweepPlan(plans, names=[loop.getName() for loop in loops], snake=snake)
+
     def setName(self, newName):
         """
         Immediately redefines the name of the loop.
@@ -562,6 +625,7 @@ class SmartLoop(Debugger, Subject, Observer, Reloadable):
         self._start = newStart
         if firstIsStart and newStart is not None:
             self._first = newStart
+        self._invalidatePlan()
         self.notify('updateLoop')
 
     def setFirst(self, newFirst):
@@ -571,6 +635,7 @@ class SmartLoop(Debugger, Subject, Observer, Reloadable):
         """
         if newFirst is not None:
             self._first = newFirst
+        self._invalidatePlan()
         self.notify('updateLoop')
 
     def setStop(self, newStop):
@@ -578,6 +643,7 @@ class SmartLoop(Debugger, Subject, Observer, Reloadable):
         Stores in _nextParams dictionary the new stop and corresponding new nsteps, leaving other parameters unchanged.
         """
         self._stop = newStop
+        self._invalidatePlan()
         self.notify('updateLoop')
 
     def setStep(self, newStep):
@@ -586,18 +652,21 @@ class SmartLoop(Debugger, Subject, Observer, Reloadable):
         """
         self.debugPrint('in setStep with newStep = %s' % newStep)
         self._step = newStep
+        self._invalidatePlan()
         self.notify('updateLoop')
 
     def reverse(self):
         """ Reverse the ramp direction by reversing the sign of step immediately"""
         self.debugPrint('reversing step')
         self._step *= -1
+        self._invalidatePlan()
         self.notify('updateLoop')
 
     def jumpToValue(self, value):
         """ Stores in _nextParams dictionary the value to which the loop will jump at next iteration."""
         self.debugPrint('in jumpToValue with value = ', value)
         self._imposedValue = value
+        self._invalidatePlan()
         self.notify('updateLoop')
 
     def jumpToFirst(self):
@@ -661,6 +730,7 @@ class SmartLoop(Debugger, Subject, Observer, Reloadable):
     def setAutoreverse(self, ONorOFF):
         """ Set the autoreverse flag to True or False"""
         self._autoreverse = ONorOFF
+        self._invalidatePlan()
         self.notify('updateLoop')
         return self._autoreverse
 
@@ -671,6 +741,7 @@ class SmartLoop(Debugger, Subject, Observer, Reloadable):
     def setAutoloop(self, ONorOFF):
         """ Set the autoloop flag to True or False"""
         self._autoloop = ONorOFF
+        self._invalidatePlan()
         self.notify('updateLoop')
         return self._autoloop
 
@@ -763,6 +834,13 @@ class PredefinedLoop(SmartLoop):
         # the value has the index in a predefined loop
         return self._values[self._value]
 
+    def _buildPlan(self, origin):
+        # the plan is computed on indices and mapped onto the predefined values
+        try:
+            return SweepPlan(self._start, self._stop, self._step, origin=origin, mode=self.getMode(), table=self._values)
+        except ValueError:
+            return None
+
 
 class AdaptiveLoop(SmartLoop):
     """
@@ -811,3 +889,193 @@ class AdaptiveLoop(SmartLoop):
             'in preincrement calling self._adaptFunc with feedBackValues=', self._feedBackValues)
         if self._adaptFunc is not None:
             self._adaptFunc(self)
+
+
+class SweepPlan(object):
+    """
+    The SweepPlan class is the precomputed trajectory of a SmartLoop, i.e. the array of values the loop will output
+    from an origin value up to its next termination (or reversion/looping in autoreverse and autoloop modes).
+      The SweepPlan is built from the loop's start, stop, step and origin values, and its mode 'normal', 'autoRev' or 'autoLoop'.
+      Values are generated lazily as a numpy array at the first call to 'values()' and then kept in memory.
+      Values are rounded as in SmartLoop.addStep() so that the plan and the running loop give the same numbers.
+      The number of values from any value of the plan to the end of the pass is obtained in O(1) with 'stepsFrom(value)'.
+      A full period of an autoreverse or autoloop loop is given by 'cycle()'.
+      An optional table of predefined values can be passed, in which case the plan is computed on indices and
+        'values()' returns the table values at these indices (used by PredefinedLoop).
+    A SweepPlan is typically obtained from SmartLoop.sweepPlan(), and can be consumed in one shot by instruments supporting
+    hardware list modes (AWG sequences, VNA segment sweeps,...).
+    """
+
+    def __init__(self, start, stop, step, origin=None, mode='normal', table=None):
+        if not all([isinstance(v, (int, long, float)) for v in [start, stop, step]]) or step == 0:
+            raise ValueError('A sweep plan requires numerical start, stop and non-zero step.')
+        if origin is None:
+            origin = start
+        self._start, self._stop, self._step, self._origin = start, stop, step, origin
+        self._mode = mode
+        self._table = table
+        self._lo, self._hi = (start, stop) if start <= stop else (stop, start)
+        self._integer = all([isinstance(v, (int, long)) for v in [origin, step]])
+        # boundary of the range in the direction of the step
+        self._end = self._hi if step > 0 else self._lo
+        self._length = self._count(origin)
+        self._values = None
+        self._cycle = None
+
+    def _count(self, value):
+        """
+        Private function.
+        Returns the number of values from value (included) up to the boundary in the direction of the step.
+        """
+        if value - self._hi > epsilon or self._lo - value > epsilon:
+            return 0
+        return int(floor((self._end - value) / float(self._step) + epsilon)) + 1
+
+    def _grid(self, origin, step, n):
+        """
+        Private function.
+        Returns the n values origin + k * step with the same rounding as SmartLoop.addStep().
+        """
+        if self._integer:
+            return origin + step * arange(n)
+        return around(origin + step * arange(n, dtype=float), digits - int(log10(abs(step))))
+
+    def _toValues(self, array):
+        if self._table is None:
+            return array
+        return asarray(self._table)[array.astype(int)]
+
+    def __len__(self):
+        """ Returns the number of values in the current pass of the plan."""
+        return self._length
+
+    def __getitem__(self, i):
+        return self.values()[i]
+
+    def __iter__(self):
+        return iter(self.values())
+
+    def mode(self):
+        """ Returns the mode 'normal', 'autoRev' or 'autoLoop' of the plan."""
+        return self._mode
+
+    def isPeriodic(self):
+        """ Returns True if the loop is restarted or reversed indefinitely at the end of the pass."""
+        return self._mode in ['autoRev', 'autoLoop']
+
+    def origin(self):
+        """ Returns the first value of the plan."""
+        return self._origin
+
+    def values(self):
+        """
+        Returns the array of values from the origin up to the end of the pass.
+        The array is generated at the first call only.
+        """
+        if self._values is None:
+            self._values = self._toValues(self._grid(self._origin, self._step, self._length))
+        return self._values
+
+    def cycle(self):
+        """
+        Returns the array of values of a full period of an autoreverse loop (back and forth on the grid of the origin)
+        or of an autoloop loop (from start to stop with the origin at start), and the current pass in normal mode.
+        """
+        if not self.isPeriodic():
+            return self.values()
+        if self._cycle is None:
+            step = abs(self._step)
+            if self._mode == 'autoRev':
+                # lowest point of the grid of the origin within the range
+                low = self._origin - step * int(floor((self._origin - self._lo) / float(step) + epsilon))
+                n = int(floor((self._hi - low) / float(step) + epsilon)) + 1
+                forward = self._grid(low, step, n)
+                cycle = concatenate((forward, forward[-2:0:-1]))
+            else:
+                sign = 1 if self._stop >= self._start else -1
+                n = int(floor(abs(self._stop - self._start) / float(step) + epsilon)) + 1
+                cycle = self._grid(self._start, sign * step, n)
+            self._cycle = self._toValues(cycle)
+        return self._cycle
+
+    def stepsFrom(self, value):
+        """
+        Returns in O(1) the number of values of the plan from value (included) to the end of the pass,
+        or 0 if value is outside the range.
+        """
+        return self._count(value)
+
+    def indexOf(self, value):
+        """
+        Returns in O(1) the position of value in the plan, or None if value is not a value of the plan.
+        """
+        k = (value - self._origin) / float(self._step)
+        i = int(floor(k + 0.5))
+        if abs(k - i) > epsilon * (1 + abs(k)) or i < 0 or i >= self._length:
+            return None
+        return i
+
+
+class NestedSweepPlan(object):
+    """
+    The NestedSweepPlan class is the cartesian product of the sweep plans of nested loops, ordered from the outermost to the innermost loop.
+      'points()' returns a (n, d) numpy array with one row per iteration of the innermost loop and one column per loop;
+      'columns()' returns a dictionary {loopName: column array} ready to be consumed by a datacube or an instrument list mode.
+      If snake is True, inner loops are traversed alternatively forward and backward (as autoreverse children would do),
+        which avoids large jumps of the swept parameters at the end of each inner pass.
+    Outer values are taken from each plan's values(), i.e. the current pass of the loop.
+    """
+
+    def __init__(self, plans, names=None, snake=False):
+        self._plans = list(plans)
+        if names is None:
+            names = ['loop%i' % i for i in range(len(self._plans))]
+        self._names = list(names)
+        self._snake = snake
+        self._points = None
+
+    def __len__(self):
+        n = 1
+        for plan in self._plans:
+            n *= len(plan)
+        return n
+
+    def shape(self):
+        """ Returns the tuple of lengths of the nested plans."""
+        return tuple([len(plan) for plan in self._plans])
+
+    def names(self):
+        return self._names
+
+    def plans(self):
+        return self._plans
+
+    def points(self):
+        """
+        Returns the (n, d) array of points of the product, the last column varying the fastest.
+        The array is generated at the first call only.
+        """
+        if self._points is None:
+            shape = self.shape()
+            n = len(self)
+            flat = arange(n)
+            columns = []
+            period = n
+            outerIndex = zeros(n, dtype=int)      # index of the current pass of the level above
+            for plan, m in zip(self._plans, shape):
+                period //= m
+                k = (flat // period) % m
+                if self._snake:
+                    k = where(outerIndex % 2 == 1, m - 1 - k, k)
+                outerIndex = flat // period
+                columns.append(plan.values()[k])
+            if columns:
+                self._points = column_stack(columns)
+            else:
+                self._points = zeros((0, 0))
+        return self._points
+
+    def columns(self):
+        """ Returns the dictionary {name: array of values} of the product."""
+        points = self.points()
+        return dict([(name, points[:, i]) for i, name in enumerate(self._names)])
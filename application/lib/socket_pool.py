@@ -0,0 +1,180 @@
+"""
+Shared client layer for the instruments queried through plain TCP sockets (MMR3 thermometry modules, temperature and
+helium level servers).
+
+A SocketConnection is a persistent TCP connection with a receive buffer: replies are read by blocks with readLine()
+and readExactly() instead of one recv(1) system call per byte.
+A ConnectionPool keeps one connection per (address, port), shared by all the instruments using the same server, and
+runs request transactions on it:
+    values = socketPool.request(address, port, lambda connection: ...)
+A transaction failing with a socket error (server restarted, idle connection closed by the server...) is retried on a
+new connection, so that reconnection is transparent as long as the transactions are idempotent queries.
+For the servers that push a single value on each new connection and close it, readOnConnect() returns the value as soon
+as its line is terminated, without waiting for the server to close the connection (with the same retry on failure).
+"""
+
+import socket
+import threading
+
+
+class SocketConnection(object):
+    """
+    Persistent TCP connection to (address, port) with buffered reading.
+    """
+
+    def __init__(self, address, port, timeout=2.0):
+        self.address = address
+        self.port = port
+        self.timeout = timeout
+        self._socket = None
+        self._buffer = ''
+        self.lock = threading.RLock()
+
+    def connect(self):
+        self.close()
+        self._socket = socket.create_connection((self.address, self.port), self.timeout)
+        self._socket.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        return self
+
+    def connected(self):
+        return self._socket is not None
+
+    def close(self):
+        if self._socket is not None:
+            try:
+                self._socket.close()
+            except socket.error:
+                pass
+        self._socket = None
+        self._buffer = ''
+
+    def sendall(self, data):
+        if self._socket is None:
+            self.connect()
+        self._socket.sendall(data)
+
+    def _receive(self):
+        """
+        Appends a block of received data to the buffer, raising socket.error if the connection is closed.
+        """
+        if self._socket is None:
+            raise socket.error('not connected to %s:%s' % (self.address, self.port))
+        data = self._socket.recv(65536)
+        if not data:
+            raise socket.error('connection closed by %s:%s' % (self.address, self.port))
+        self._buffer += data
+
+    def readLine(self, terminator='\n'):
+        """
+        Returns the next line, without terminator and '\r'.
+        """
+        while terminator not in self._buffer:
+            self._receive()
+        line, self._buffer = self._buffer.split(terminator, 1)
+        return line.replace('\r', '')
+
+    def readExactly(self, length):
+        """
+        Returns the next length bytes.
+        """
+        while len(self._buffer) < length:
+            self._receive()
+        data, self._buffer = self._buffer[:length], self._buffer[length:]
+        return data
+
+    def readAll(self, terminator=None):
+        """
+        Returns all the data until the server closes the connection (or the timeout expires), and closes it.
+        If terminator is not None, returns the first line (without terminator and '\r') as soon as it is received,
+        without waiting for the server to close the connection.
+        """
+        try:
+            while terminator is None or terminator not in self._buffer:
+                self._receive()
+        except socket.error:
+            if not self._buffer:
+                raise
+        data = self._buffer
+        if terminator is not None and terminator in data:
+            data = data.split(terminator, 1)[0].replace('\r', '')
+        self.close()
+        return data
+
+
+class ConnectionPool(object):
+    """
+    Persistent connections shared by (address, port) (see module docstring).
+    """
+
+    def __init__(self, timeout=2.0, retries=1):
+        self.timeout = timeout
+        self.retries = retries
+        self._connections = dict()
+        self._lock = threading.Lock()
+        self.connects = 0
+        self.requests = 0
+        self.failures = 0
+
+    def connection(self, address, port):
+        """
+        Returns the connection to (address, port), created (but not connected) if needed.
+        """
+        with self._lock:
+            key = (address, port)
+            if key not in self._connections:
+                self._connections[key] = SocketConnection(address, port, self.timeout)
+            return self._connections[key]
+
+    def request(self, address, port, transaction, timeout=None):
+        """
+        Runs transaction(connection) on the connection to (address, port), connecting it if needed, and returns its
+        result. On a socket error, the connection is closed and the transaction retried on a new connection up to
+        retries times.
+        """
+        connection = self.connection(address, port)
+        with connection.lock:
+            for attempt in range(self.retries + 1):
+                try:
+                    if not connection.connected():
+                        connection.timeout = timeout or self.timeout
+                        connection.connect()
+                        self.connects += 1
+                    self.requests += 1
+                    return transaction(connection)
+                except (socket.error, socket.timeout, ValueError, IndexError):
+                    # ValueError and IndexError: reply garbled by a connection lost in the middle of it
+                    self.failures += 1
+                    connection.close()
+                    if attempt == self.retries:
+                        raise
+
+    def close(self, address=None, port=None):
+        """
+        Closes the connection to (address, port), or all the connections if address is None.
+        """
+        with self._lock:
+            for key, connection in self._connections.items():
+                if address is None or key == (address, port):
+                    with connection.lock:
+                        connection.close()
+
+    def statistics(self):
+        return {'connections': len(self._connections), 'connects': self.connects, 'requests': self.requests,
+                'failures': self.failures}
+
+
+def readOnConnect(address, port, timeout=0.5, retries=1, terminator='\n'):
+    """
+    Connects to a server pushing a value on each new connection and returns the value as soon as its line is terminated
+    by terminator, or otherwise all the data sent before the server closes the connection or the timeout expires,
+    retrying up to retries times on a socket error.
+    """
+    for attempt in range(retries + 1):
+        try:
+            return SocketConnection(address, port, timeout).connect().readAll(terminator)
+        except (socket.error, socket.timeout):
+            if attempt == retries:
+                raise
+
+# pool shared by all the socket instruments
+socketPool = ConnectionPool()
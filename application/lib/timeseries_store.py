@@ -0,0 +1,348 @@
+"""
+Bounded multi-resolution store of monitoring time series (temperatures, helium level, magnetic field...).
+
+A TimeSeriesStore keeps the readings of a quantity at three resolutions, each one in a fixed-size ring of numpy records
+so that the memory does not grow however long the monitoring runs:
+  - 'raw': the readings (time, value) themselves (rawCapacity records);
+  - 'minute' and 'hour': the (time, mean, min, max, count) of the readings in each minute and each hour.
+If a directory is given, every record is also appended to on-disk segments <directory>/<name>/<level>-<index>.bin
+(one segment per day for raw readings, 30 days for minutes, a year for hours), and the rings are refilled from the
+last segments when a store is created again, so that the history survives restarts.
+Range queries (query(), records()) pick the finest resolution holding at most maxPoints records in the range, from the
+rings or from the disk segments when the range is older than the rings:
+    store = timeSeries('fridge_temperature')
+    store.append(0.012)
+    times, values = store.query(time.time() - 3 * 86400, maxPoints=500)
+timeSeries() returns the store shared by all the panels and scripts using the same name. Its stores are kept in memory
+only, unless a directory is given or the parameter 'directories.monitoring' of application.config.parameters is set
+(an absolute path, or relative to the application directory), e.g. params['directories.monitoring'] = 'D:/monitoring'.
+"""
+
+import os
+import math
+import time
+import threading
+
+import numpy
+
+from application.config.parameters import params
+
+RAW = numpy.dtype([('time', '<f8'), ('value', '<f8')])
+AGGREGATE = numpy.dtype([('time', '<f8'), ('mean', '<f8'), ('min', '<f8'), ('max', '<f8'), ('count', '<f8')])
+
+
+
+class Ring(object):
+    """
+    Fixed-capacity ring of time-ordered numpy records.
+    """
+
+    def __init__(self, capacity, dtype):
+        self.records = numpy.zeros(capacity, dtype=dtype)
+        self.start = 0
+        self.size = 0
+
+    def __len__(self):
+        return self.size
+
+    def append(self, record):
+        capacity = len(self.records)
+        self.records[(self.start + self.size) % capacity] = record
+        if self.size < capacity:
+            self.size += 1
+        else:
+            self.start = (self.start + 1) % capacity
+
+    def extend(self, records):
+        for record in records[-len(self.records):]:
+            self.append(record)
+
+    def _segments(self):
+        end = self.start + self.size
+        if end <= len(self.records):
+            return [self.records[self.start:end]]
+        return [self.records[self.start:], self.records[:end - len(self.records)]]
+
+    def oldest(self):
+        return self.records[self.start]['time'] if self.size else None
+
+    def newest(self):
+        return self.records[(self.start + self.size - 1) % len(self.records)]['time'] if self.size else None
+
+    def range(self, t0=None, t1=None):
+        """
+        Returns a copy of the records of times in [t0, t1].
+        """
+        parts = []
+        for segment in self._segments():
+            times = segment['time']
+            i0 = 0 if t0 is None else numpy.searchsorted(times, t0, side='left')
+            i1 = len(times) if t1 is None else numpy.searchsorted(times, t1, side='right')
+            parts.append(segment[i0:i1])
+        return numpy.concatenate(parts) if parts else self.records[:0].copy()
+
+    def count(self, t0=None, t1=None):
+        """
+        Returns the number of records of times in [t0, t1].
+        """
+        count = 0
+        for segment in self._segments():
+            times = segment['time']
+            i0 = 0 if t0 is None else numpy.searchsorted(times, t0, side='left')
+            i1 = len(times) if t1 is None else numpy.searchsorted(times, t1, side='right')
+            count += max(i1 - i0, 0)
+        return count
+
+
+class Level(object):
+    """
+    One resolution of a TimeSeriesStore: a ring, the bin being accumulated (aggregated levels) and the on-disk segments.
+    """
+
+    def __init__(self, name, resolution, capacity, segmentLength, directory=None):
+        self.name = name
+        self.resolution = resolution                # None for the raw readings
+        self.dtype = RAW if resolution is None else AGGREGATE
+        self.ring = Ring(capacity, self.dtype)
+        self.segmentLength = segmentLength
+        self.directory = directory
+        self._bin = None                            # [start, sum, min, max, count] of the bin being accumulated
+        self._file = None
+        self._segment = None
+
+    def add(self, t, value):
+        """
+        Adds a reading, and returns the record completed by it (the reading itself for the raw level), or None.
+        """
+        if self.resolution is None:
+            return self.store((t, value))
+        start = math.floor(t / self.resolution) * self.resolution
+        record = None
+        if self._bin is not None and start != self._bin[0]:
+            record = self.store(self.binRecord())
+            self._bin = None
+        if self._bin is None:
+            self._bin = [start, value, value, value, 1]
+        else:
+            self._bin[1] += value
+            self._bin[2] = min(self._bin[2], value)
+            self._bin[3] = max(self._bin[3], value)
+            self._bin[4] += 1
+        return record
+
+    def binRecord(self):
+        """
+        Returns the record of the bin being accumulated (time at the middle of the bin), or None.
+        """
+        if self._bin is None:
+            return None
+        start, total, low, high, count = self._bin
+        return (start + self.resolution / 2., total / count, low, high, count)
+
+    def store(self, record):
+        self.ring.append(record)
+        if self.directory is not None:
+            self._write(record)
+        return record
+
+    def _path(self, segment):
+        return os.path.join(self.directory, '%s-%i.bin' % (self.name, segment))
+
+    def _write(self, record):
+        segment = int(record[0] // self.segmentLength)
+        if segment != self._segment or self._file is None:
+            self.close()
+            if not os.path.isdir(self.directory):
+                os.makedirs(self.directory)
+            self._file = open(self._path(segment), 'ab')
+            self._segment = segment
+        self._file.write(numpy.array([record], dtype=self.dtype).tostring())
+        self._file.flush()
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+        self._file = None
+
+    def segments(self):
+        """
+        Returns the sorted indices of the on-disk segments.
+        """
+        if self.directory is None or not os.path.isdir(self.directory):
+            return []
+        indices = []
+        for filename in os.listdir(self.directory):
+            if filename.startswith(self.name + '-') and filename.endswith('.bin'):
+                try:
+                    indices.append(int(filename[len(self.name) + 1:-4]))
+                except ValueError:
+                    pass
+        return sorted(indices)
+
+    def _readSegment(self, segment):
+        data = open(self._path(segment), 'rb').read()
+        # ignore a record truncated by an interrupted write
+        return numpy.frombuffer(data[:len(data) - len(data) % self.dtype.itemsize], dtype=self.dtype)
+
+    def readDisk(self, t0=None, t1=None):
+        """
+        Returns the records of times in [t0, t1] read from the on-disk segments.
+        """
+        parts = []
+        for segment in self.segments():
+            if (t0 is not None and (segment + 1) * self.segmentLength < t0) or \
+                    (t1 is not None and segment * self.segmentLength > t1):
+                continue
+            records = self._readSegment(segment)
+            times = records['time']
+            selected = numpy.ones(len(records), dtype=bool)
+            if t0 is not None:
+                selected &= times >= t0
+            if t1 is not None:
+                selected &= times <= t1
+            parts.append(records[selected])
+        return numpy.concatenate(parts) if parts else numpy.zeros(0, dtype=self.dtype)
+
+    def restore(self):
+        """
+        Refills the ring with the last records of the on-disk segments.
+        """
+        parts, count = [], 0
+        for segment in reversed(self.segments()):
+            records = self._readSegment(segment)
+            parts.insert(0, records)
+            count += len(records)
+            if count >= len(self.ring.records):
+                break
+        if parts:
+            self.ring.extend(numpy.concatenate(parts))
+
+
+class TimeSeriesStore(object):
+    """
+    Bounded multi-resolution time series of one quantity (see module docstring).
+    """
+
+    def __init__(self, name, directory=None, rawCapacity=10000, minuteCapacity=10080, hourCapacity=8760):
+        self.name = name
+        self.directory = os.path.join(directory, name) if directory is not None else None
+        self.levels = [Level('raw', None, rawCapacity, 86400, self.directory),
+                       Level('minute', 60., minuteCapacity, 30 * 86400, self.directory),
+                       Level('hour', 3600., hourCapacity, 365 * 86400, self.directory)]
+        self._lock = threading.RLock()
+        if self.directory is not None:
+            for level in self.levels:
+                level.restore()
+
+    def __len__(self):
+        return len(self.levels[0].ring)
+
+    def level(self, name):
+        for level in self.levels:
+            if level.name == name:
+                return level
+        raise KeyError('No level %s in time series %s.' % (name, self.name))
+
+    def append(self, value, t=None):
+        """
+        Adds a reading value at time t (now by default). Readings older than the last one are ignored.
+        """
+        if value is None:
+            return
+        t = time.time() if t is None else t
+        with self._lock:
+            newest = self.levels[0].ring.newest()
+            if newest is not None and t < newest:
+                return
+            for level in self.levels:
+                level.add(t, float(value))
+
+    def last(self):
+        """
+        Returns the (time, value) of the last reading, or None.
+        """
+        ring = self.levels[0].ring
+        if not len(ring):
+            return None
+        record = ring.records[(ring.start + ring.size - 1) % len(ring.records)]
+        return record['time'], record['value']
+
+    def _choose(self, t0, t1, maxPoints):
+        """
+        Returns the finest level holding at most maxPoints records in [t0, t1].
+        """
+        for level in self.levels:
+            ring = level.ring
+            if level.resolution is not None:
+                estimate = ((t1 if t1 is not None else time.time()) - t0) / level.resolution if t0 is not None \
+                    else len(ring)
+            elif ring.oldest() is not None and (t0 is None or ring.oldest() <= t0):
+                estimate = ring.count(t0, t1)
+            elif len(ring) > 1:                     # range partly on disk: estimate from the reading rate
+                estimate = ((t1 if t1 is not None else ring.newest()) - t0) * len(ring) / \
+                    max(ring.newest() - ring.oldest(), 1e-9)
+            else:
+                estimate = 0
+            if maxPoints is None or estimate <= maxPoints:
+                return level
+        return self.levels[-1]
+
+    def records(self, t0=None, t1=None, maxPoints=None, level=None):
+        """
+        Returns (levelName, records) of the records of times in [t0, t1] at the given level (name), or at the finest
+        level holding at most maxPoints records in the range. Records older than the ring are read from the disk.
+        The aggregated levels include the bin being accumulated.
+        """
+        with self._lock:
+            level = self.level(level) if level is not None else self._choose(t0, t1, maxPoints)
+            ring = level.ring
+            if self.directory is not None and (ring.oldest() is None or t0 is None or t0 < ring.oldest()) and \
+                    len(level.segments()):
+                records = level.readDisk(t0, t1)
+            else:
+                records = ring.range(t0, t1)
+            current = level.binRecord()
+            if current is not None and (t0 is None or current[0] >= t0) and (t1 is None or current[0] <= t1):
+                records = numpy.concatenate([records, numpy.array([current], dtype=level.dtype)])
+        if maxPoints is not None and len(records) > maxPoints:
+            records = records[::int(math.ceil(len(records) / float(maxPoints)))]
+        return level.name, records
+
+    def query(self, t0=None, t1=None, maxPoints=None, level=None):
+        """
+        Returns the (times, values) arrays of the readings in [t0, t1] (see records()), values being the means of the
+        aggregated levels.
+        """
+        levelName, records = self.records(t0, t1, maxPoints, level)
+        return records['time'], records['value' if levelName == 'raw' else 'mean']
+
+    def close(self):
+        with self._lock:
+            for level in self.levels:
+                level.close()
+
+_stores = dict()
+_storesLock = threading.Lock()
+
+
+def monitoringDirectory():
+    """
+    Returns the directory of the on-disk segments of the stores created by timeSeries() (parameter
+    'directories.monitoring'), or None if the monitoring time series are not saved.
+    """
+    directory = params.get('directories.monitoring')
+    if not directory:
+        return None
+    return os.path.join(params['basePath'], directory)
+
+
+def timeSeries(name, directory=None, **kwargs):
+    """
+    Returns the TimeSeriesStore of the given name shared by all its users, created at the first call with its segments
+    in directory (monitoringDirectory() by default, in memory only if None).
+    """
+    with _storesLock:
+        if name not in _stores:
+            _stores[name] = TimeSeriesStore(name, directory if directory is not None else monitoringDirectory(),
+                                            **kwargs)
+        return _stores[name]
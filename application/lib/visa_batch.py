@@ -0,0 +1,231 @@
+"""
+Batching of the SCPI commands of a VISA instrument.
+
+Within the context
+    with instrument.batch('getSetup'):
+        ...
+the writes of the instrument are queued and sent with the next query (or at the end of the context) as a single
+program message (joined with ';:', see joinCommands()), and the queries are answered:
+  - from the answers prefetched at the start of the context, in as few messages as possible (at most
+    maxMessageLength characters and maxQueriesPerMessage queries per message, class attributes of the instrument),
+    the reply being split back into the individual answers;
+  - or otherwise by a single round trip also carrying the queued writes.
+The queries prefetched are those passed to batch(key, queries) and those asked in the previous contexts of the same key,
+so that existing getters are batched transparently: the first call of a getter learns its queries and the next calls
+prefetch them. Are not learned the common commands ('*...'), and the queries with binary or long answers.
+A write invalidates the prefetched answers of the queries with the same header, and of the settings it invalidates by
+the cacheInvalidations rules of the driver (all the prefetched answers if the driver has no settings cache).
+Queries can also be queued explicitly with batch.query(message), which returns an OperationFuture resolved at the next
+batch.flush() (or at the end of the context).
+The context holds the I/O lock of the instrument (see VisaInstrument.ioLock()), so that the commands of other threads
+are neither queued in the batch nor interleaved with it: do not wait in the context for an operation polled by another
+thread (as instrument.operationComplete()).
+"""
+
+from application.lib.visa_simulation import splitCommands, normalizeHeader
+from application.lib.visa_completion import OperationFuture
+
+maxLearnedAnswerLength = 256
+
+
+def _header(command):
+    """
+    Returns the normalized header of a command or query.
+    """
+    return normalizeHeader(command.split('?')[0].split(None, 1)[0] if command.strip() else '')
+
+
+def joinCommands(commands, maxLength, maxQueries):
+    """
+    Returns the list of the messages grouping the commands in order, with at most maxLength characters (unless a command
+    is longer) and maxQueries queries per message.
+    The commands are joined with ';:', so that each header is read from the root and not relative to the previous one
+    (FREQ:STAR after FREQ:CENT would be FREQ:FREQ:STAR), except the common commands ('*...') joined with ';'.
+    """
+    messages = []
+    current, length, queries = [], 0, 0
+    for command in commands:
+        isQuery = '?' in command
+        if current:
+            separator = ';' if command.lstrip().startswith(('*', ':')) else ';:'
+            if length + len(separator) + len(command) > maxLength or (isQuery and queries >= maxQueries):
+                messages.append(''.join(current))
+                current, length, queries = [], 0, 0
+        if current:
+            command = separator + command
+        current.append(command)
+        length += len(command)
+        queries += isQuery
+    if current:
+        messages.append(''.join(current))
+    return messages
+
+
+class CommandBatch(object):
+    """
+    A batching context of a VisaInstrument (see module docstring), returned by instrument.batch(key, queries).
+    """
+
+    def __init__(self, instrument, key=None, queries=None):
+        self.instrument = instrument
+        self.key = key
+        self.queries = list(queries or [])
+        self._outer = None
+        self._writes = []           # queued writes
+        self._queued = []           # [(query, future)] queued by query()
+        self._answers = dict()      # {query: prefetched answer}
+        self._asked = []            # queries asked in this context, in order
+        self._unlearnable = set()
+
+    def __enter__(self):
+        self.instrument.ioLock().acquire()
+        self._outer = self.instrument._batch
+        self.instrument._batch = self
+        queries = self.queries + self.instrument.learnedBatchQueries(self.key)
+        try:
+            self.prefetch([query for i, query in enumerate(queries) if query not in queries[:i]])
+        except:
+            self.instrument._batch = self._outer
+            self.instrument.ioLock().release()
+            raise
+        return self
+
+    def __exit__(self, type, value, traceback):
+        try:
+            if self._outer is None:
+                self.flush()
+        finally:
+            self.instrument._batch = self._outer
+            if self.key is not None:
+                self.instrument._learnBatchQueries(self.key, [query for query in self._asked
+                                                              if query not in self._unlearnable])
+            self.instrument.ioLock().release()
+        return False
+
+    def _count(self, commands, messages):
+        statistics = self.instrument.batchStatistics()
+        statistics['commands'] += commands
+        statistics['messages'] += messages
+
+    def _send(self, commands):
+        """
+        Private method sending the commands in joined messages, and returning the list of their answers
+        (None if the number of answers does not match the number of queries of a message).
+        """
+        answers = []
+        instrument = self.instrument
+        for message in joinCommands(commands, instrument.maxMessageLength, instrument.maxQueriesPerMessage):
+            nQueries = len([part for part in splitCommands(message) if '?' in part])
+            self._count(0, 1)
+            if nQueries == 0:
+                instrument._write(message)
+                continue
+            reply = instrument._ask(message)
+            messageAnswers = splitCommands(reply, relativeHeaders=True) if nQueries > 1 else [reply]
+            if len(messageAnswers) != nQueries:
+                return None
+            answers.extend(messageAnswers)
+        return answers
+
+    def prefetch(self, queries):
+        """
+        Asks the queries in joined messages and keeps their answers for the next ask() of the same queries
+        (the queries answered by the settings cache of the instrument are not sent).
+        """
+        if self._outer is not None:
+            return self._outer.prefetch(queries)
+        cache = self.instrument.settingsCache()
+        queries = [query for query in queries if query not in self._answers
+                   and (cache is None or cache.cached(query) is None)]
+        if not queries:
+            return
+        answers = self._send(self._takeWrites() + queries)
+        if answers is None:                 # unexpected reply: the queries will be asked one by one
+            return
+        for query, answer in zip(queries, answers):
+            self._answers[query] = answer
+            if cache is not None:
+                cache.answered(query, answer)
+
+    def _takeWrites(self):
+        writes, self._writes = self._writes, []
+        return writes
+
+    def write(self, message):
+        """
+        Queues message to be sent with the next query or at the end of the context.
+        """
+        if self._outer is not None:
+            return self._outer.write(message)
+        commands = splitCommands(message)
+        headers = set([_header(command) for command in commands])
+        cache = self.instrument.settingsCache()
+        for query in self._answers.keys():
+            header = _header(query)
+            if cache is None or header in headers or \
+                    any([cache.invalidates(command, header) for command in commands]):
+                del self._answers[query]
+        self._count(1, 0)
+        self._writes.append(message)
+
+    def ask(self, message):
+        """
+        Returns the prefetched answer to message, or asks it with the queued writes.
+        """
+        self._asked.append(message)
+        if self._outer is not None:
+            answer = self._outer.ask(message)
+        elif message in self._answers:
+            self._count(1, 0)
+            return self._answers.pop(message)
+        elif self._writes or self._queued:
+            # the queued writes and queries are sent in the same messages as message
+            self._count(1, 0)
+            answer = self._flush([message])[-1]
+        else:
+            cache = self.instrument.settingsCache()
+            self._count(1, 1 if cache is None or cache.cached(message) is None else 0)
+            answer = self.instrument._ask(message)
+        if message.lstrip().startswith('*') or len(answer) > maxLearnedAnswerLength or answer.startswith('#'):
+            self._unlearnable.add(message)
+        return answer
+
+    def query(self, message):
+        """
+        Queues the query message and returns an OperationFuture resolved with its answer at the next flush().
+        """
+        if self._outer is not None:
+            return self._outer.query(message)
+        future = OperationFuture(message)
+        self._count(1, 0)
+        self._queued.append((message, future))
+        return future
+
+    def flush(self):
+        """
+        Sends the queued writes and queries.
+        """
+        if self._outer is not None:
+            return self._outer.flush()
+        self._flush()
+
+    def _flush(self, queries=()):
+        """
+        Private method sending the queued writes and queries followed by queries, and returning the answers to queries.
+        """
+        queued, self._queued = self._queued, []
+        queries = [query for query, future in queued] + list(queries)
+        commands = self._takeWrites() + queries
+        if not commands:
+            return []
+        try:
+            answers = self._send(commands)
+            if answers is None:
+                answers = [self.instrument._ask(query) for query in queries]
+        except Exception as error:
+            for query, future in queued:
+                future.setException(error)
+            raise
+        for (query, future), answer in zip(queued, answers):
+            future.setResult(answer)
+        return answers[len(queued):]
@@ -0,0 +1,48 @@
+"""
+IEEE-488.2 definite length blocks '#<n><nBytes><data>' exchanged with VISA instruments:
+  - blockHeader(nBytes): the block header '#<n><nBytes>';
+  - blockLimits(message): the position and length of the data of a block answered by an instrument;
+  - decodeBlock(message, dtype): the numpy array of the values of a block answered by an instrument (traces of the
+    VNA and spectrum analyzer drivers).
+The encoding of the waveforms sent in blocks to arbitrary waveform generators is in application.lib.awg_encoding.
+"""
+
+import numpy
+
+
+def blockHeader(nBytes):
+    """
+    Returns the IEEE-488.2 definite length block header for nBytes bytes of data.
+    """
+    length = "%d" % nBytes
+    return "#%d%s" % (len(length), length)
+
+
+def blockLimits(message):
+    """
+    Returns (offset, nBytes) of the data in the IEEE-488.2 definite length block message '#<n><nBytes><data>',
+    or None if message is not a complete block (characters after the data, as termination characters, are ignored).
+    """
+    if len(message) < 2 or message[0] != '#' or not '1' <= message[1] <= '9':
+        return None
+    offset = 2 + int(message[1])
+    try:
+        nBytes = int(message[2:offset])
+    except ValueError:
+        return None
+    if len(message) < offset + nBytes:
+        return None
+    return offset, nBytes
+
+
+def decodeBlock(message, dtype='<f4'):
+    """
+    Returns the (writable) numpy array of type dtype of the data of the block message, or None if message is not a
+    complete block of items of type dtype.
+    """
+    limits = blockLimits(message)
+    dtype = numpy.dtype(dtype)
+    if limits is None or limits[1] % dtype.itemsize != 0:
+        return None
+    offset, nBytes = limits
+    return numpy.frombuffer(message, dtype=dtype, count=nBytes / dtype.itemsize, offset=offset).copy()
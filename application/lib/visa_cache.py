@@ -0,0 +1,178 @@
+"""
+Write-through cache of the settings of a VISA instrument.
+
+A driver declares the settings to be cached in its class attribute cachedSettings, a list of regular expressions
+matching the headers of the commands as the driver writes them (e.g. r'(SENSE1:)?FREQ(UENCY)?:START', 'FORM').
+Messages written or asked through VisaInstrument.write() and ask() are then processed by the instrument's SettingsCache:
+  - 'HEADER value': the write is skipped if value is the last value written for this setting;
+  - 'HEADER?': the answer is served from the cache if the setting was already read back since its last write;
+  - 'HEADER value;HEADER?' (set and read back in a single query): the cached answer is returned if value is unchanged.
+Settings are identified by their normalized SCPI header (FREQuency:STARt = FREQ:STAR, SENSe root and suffix 1 optional).
+A write matching one of the patterns of the driver's cacheInvalidations list [(command pattern, key pattern or None)]
+drops the cached settings whose normalized header matches key pattern (all settings if None), e.g. after *RST.
+The cache assumes that the instrument is only modified remotely by this driver: call instrument.invalidateCache() after
+using the front panel, and instrument.setCacheEnabled(False) if the instrument is shared.
+"""
+
+import re
+import threading
+
+from application.lib.visa_simulation import splitCommands, normalizeHeader
+
+defaultInvalidations = [(r'\*RST|\*RCL|SYST(EM)?:PRES|MMEM(ORY)?:LOAD|SYST(EM)?:LOC|GTL', None)]
+
+
+class SettingsCache(object):
+    """
+    Cache of the settings of a VISA instrument (see module docstring).
+    """
+
+    _compiled = dict()      # {(cachedSettings, cacheInvalidations): compiled patterns}
+
+    def __init__(self, cachedSettings, cacheInvalidations=None):
+        if cacheInvalidations is None:
+            cacheInvalidations = []
+        key = (tuple(cachedSettings), tuple(cacheInvalidations))
+        if key not in self._compiled:
+            headers = re.compile(r'\s*:?(%s)(?=$|[\s?;+\-.\d"\'#])' % '|'.join(['(?:%s)' % pattern for pattern in cachedSettings]),
+                                 re.IGNORECASE)
+            invalidations = [(re.compile(command, re.IGNORECASE), None if keys is None else re.compile(keys, re.IGNORECASE))
+                             for command, keys in defaultInvalidations + list(cacheInvalidations)]
+            self._compiled[key] = (headers, invalidations)
+        self._headers, self._invalidations = self._compiled[key]
+        self._lock = threading.RLock()
+        self._settings = dict()     # {key: [last written value or None, last answer or None]}
+        self.enabled = True
+        self.hits = 0
+        self.misses = 0
+        self.skippedWrites = 0
+
+    def invalidate(self, keyPattern=None):
+        """
+        Drops the cached settings whose key matches keyPattern (all settings if None).
+        """
+        with self._lock:
+            if keyPattern is None:
+                self._settings.clear()
+            else:
+                if isinstance(keyPattern, basestring):
+                    keyPattern = re.compile(keyPattern, re.IGNORECASE)
+                for key in self._settings.keys():
+                    if keyPattern.match(key):
+                        del self._settings[key]
+
+    def statistics(self):
+        """
+        Returns the dictionary of the cache counters {'hits', 'misses', 'skippedWrites', 'settings'}.
+        """
+        return {'hits': self.hits, 'misses': self.misses, 'skippedWrites': self.skippedWrites,
+                'settings': len(self._settings)}
+
+    def invalidates(self, command, key):
+        """
+        Returns True if writing command drops the setting of normalized header key by the invalidation rules.
+        """
+        command = command.lstrip(':')
+        for pattern, keys in self._invalidations:
+            if pattern.match(command) and (keys is None or keys.match(key)):
+                return True
+        return False
+
+    def cached(self, query):
+        """
+        Returns the cached answer to the query 'HEADER?', or None if it is not cached.
+        """
+        parts = self._parse(query)
+        if parts is None or len(parts) != 1 or not parts[0][1]:
+            return None
+        entry = self._settings.get(parts[0][0])
+        return entry[1] if entry is not None else None
+
+    def answered(self, query, answer):
+        """
+        Stores the answer to the query 'HEADER?' of a cached setting, received outside of ask() (e.g. in a batch).
+        """
+        if not self.enabled:
+            return
+        with self._lock:
+            parts = self._parse(query)
+            if len(parts) == 1 and parts[0][0] is not None and parts[0][1]:
+                self._settings.setdefault(parts[0][0], [None, None])[1] = answer
+
+    def _parse(self, message):
+        """
+        Private method returning the list [(key, isQuery, value, command)] of the commands of message,
+        with key None for the commands that are not cached settings.
+        """
+        parts = []
+        for command in splitCommands(message):
+            command = command.lstrip(':')
+            match = self._headers.match(command)
+            if match is None:
+                parts.append((None, '?' in command, None, command))
+                continue
+            rest = command[match.end():].strip()
+            isQuery = rest.startswith('?')
+            if isQuery:
+                rest = rest[1:].strip()
+            key = normalizeHeader(match.group(1))
+            if isQuery and rest:
+                key += ' ' + rest.upper()
+            parts.append((key, isQuery, rest, command))
+        return parts
+
+    def _written(self, parts):
+        """
+        Private method updating the cache after parts have been sent to the instrument.
+        """
+        for key, isQuery, value, command in parts:
+            if isQuery:
+                continue
+            for pattern, keys in self._invalidations:
+                if pattern.match(command):
+                    self.invalidate(keys)
+            if key is not None:
+                self.invalidate('%s( |$)' % re.escape(key))
+                self._settings[key] = [value, None]
+
+    def write(self, message, send):
+        """
+        Writes message with the function send(message) unless it only contains cached settings already at their values.
+        """
+        if not self.enabled:
+            return send(message)
+        with self._lock:
+            parts = self._parse(message)
+            if parts and all([key is not None and not isQuery and key in self._settings and self._settings[key][0] == value
+                    for key, isQuery, value, command in parts]):
+                self.skippedWrites += 1
+                return None
+            result = send(message)
+            self._written(parts)
+            return result
+
+    def ask(self, message, send):
+        """
+        Asks message with the function send(message) unless its answer is in the cache.
+        """
+        if not self.enabled:
+            return send(message)
+        with self._lock:
+            parts = self._parse(message)
+            queries = [part for part in parts if part[1]]
+            if len(queries) != 1 or queries[0][0] is None:
+                answer = send(message)
+                self._written(parts)
+                return answer
+            key = queries[0][0]
+            writes = [part for part in parts if not part[1]]
+            entry = self._settings.get(key)
+            if entry is not None and entry[1] is not None and \
+                    all([k == key and entry[0] == value for k, isQuery, value, command in writes]):
+                self.hits += 1
+                return entry[1]
+            self.misses += 1
+            answer = send(message)
+            self._written(writes)
+            self._settings.setdefault(key, [None, None])[1] = answer
+            return answer
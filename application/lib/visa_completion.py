@@ -0,0 +1,159 @@
+"""
+Futures for the completion of the overlapped operations of instruments (sweeps, acquisitions, ramps).
+
+An OperationFuture is returned by a method starting an operation (e.g. VisaInstrument.operationComplete()) and is
+completed by a daemon thread waiting for the end of the operation, so that a script can start the operations of several
+instruments and wait for all of them:
+    futures = [vna.startFullSweep(), fsp.startSweep()]
+    waitAll(futures, timeout=60)
+    trace1, trace2 = vna.getTrace(), fsp.getTrace()
+"""
+
+import time
+import threading
+
+
+class OperationTimeoutError(RuntimeError):
+    """
+    Error raised when an operation or the wait for its completion timed out.
+    """
+    pass
+
+
+class OperationCancelledError(RuntimeError):
+    """
+    Error raised when getting the result of a cancelled operation.
+    """
+    pass
+
+
+class OperationFuture(object):
+    """
+    The future result of an operation:
+      - done(), cancelled(), cancel();
+      - result(timeout): waits for the operation and returns its result (or raises its exception);
+      - exception(timeout): waits for the operation and returns its exception (None if it succeeded);
+      - addDoneCallback(function): function(future) is called when the operation is complete, in the waiting thread
+        and before the future is marked as done (e.g. to restore an instrument setting before the script resumes).
+    """
+
+    def __init__(self, name=''):
+        self.name = name
+        self._lock = threading.Lock()
+        self._done = threading.Event()
+        self._cancelled = False
+        self._result = None
+        self._exception = None
+        self._callbacks = []
+
+    def __repr__(self):
+        state = 'cancelled' if self._cancelled else 'done' if self.done() else 'pending'
+        return '<OperationFuture %s (%s)>' % (self.name, state)
+
+    def start(self, function, *args, **kwargs):
+        """
+        Runs function(*args, **kwargs) in a daemon thread and completes the future with its result or exception.
+        Returns the future.
+        """
+        thread = threading.Thread(target=self._run, args=(function, args, kwargs), name='OperationFuture ' + self.name)
+        thread.daemon = True
+        thread.start()
+        return self
+
+    def _run(self, function, args, kwargs):
+        try:
+            result = function(*args, **kwargs)
+        except Exception as exception:
+            self.setException(exception)
+        else:
+            self.setResult(result)
+
+    def done(self):
+        return self._done.isSet()
+
+    def cancelled(self):
+        return self._cancelled
+
+    def cancel(self):
+        """
+        Requests the cancellation of the wait (the waiting function is expected to check cancelled()).
+        Returns False if the operation is already complete.
+        """
+        with self._lock:
+            if self.done():
+                return False
+            self._cancelled = True
+        self.setException(OperationCancelledError('Operation %s cancelled.' % self.name))
+        return True
+
+    def setResult(self, result):
+        self._complete(result, None)
+
+    def setException(self, exception):
+        self._complete(None, exception)
+
+    def _complete(self, result, exception):
+        with self._lock:
+            if self.done():
+                return
+            self._result, self._exception = result, exception
+            callbacks, self._callbacks = self._callbacks, []
+        for callback in callbacks:
+            try:
+                callback(self)
+            except Exception as error:
+                print 'Error in the callback of operation %s: %s' % (self.name, error)
+        self._done.set()
+
+    def addDoneCallback(self, callback):
+        with self._lock:
+            if not self.done():
+                self._callbacks.append(callback)
+                return
+        callback(self)
+
+    def exception(self, timeout=None):
+        if not self._done.wait(timeout):
+            raise OperationTimeoutError('Operation %s not complete after %s s.' % (self.name, timeout))
+        return self._exception
+
+    def result(self, timeout=None):
+        exception = self.exception(timeout)
+        if exception is not None:
+            raise exception
+        return self._result
+
+
+def completedFuture(result=None, name=''):
+    """
+    Returns a future already completed with result.
+    """
+    future = OperationFuture(name)
+    future.setResult(result)
+    return future
+
+
+def waitAll(futures, timeout=None):
+    """
+    Waits for all the futures and returns the list of their results (the first exception met is raised).
+    """
+    deadline = None if timeout is None else time.time() + timeout
+    results = []
+    for future in futures:
+        remaining = None if deadline is None else max(0., deadline - time.time())
+        results.append(future.result(remaining))
+    return results
+
+
+def waitAny(futures, timeout=None, interval=1e-3):
+    """
+    Waits until one of the futures is done and returns it.
+    """
+    deadline = None if timeout is None else time.time() + timeout
+    while True:
+        for future in futures:
+            if future.done():
+                return future
+        if deadline is not None and time.time() > deadline:
+            raise OperationTimeoutError('No operation complete after %s s.' % timeout)
+        time.sleep(interval)
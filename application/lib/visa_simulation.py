@@ -0,0 +1,631 @@
+"""
+Simulated VISA resources, used to run and benchmark the VISA drivers without the hardware.
+
+A simulated resource behaves as the instrument object returned by visa.instrument(address) (write, read, read_raw, ask,
+ask_for_values, clear, trigger, close, timeout, term_chars), and answers the commands with a scriptable SCPI responder.
+VisaInstrument.visaHandle() opens a simulated resource instead of a VISA one when the address is simulated, i.e.:
+  - it was registered with simulate(address, responder, latency);
+  - or it starts with 'SIM::' (a generic ScpiResponder is then created at the first opening).
+
+Example:
+    from application.lib.visa_simulation import *
+    simulate('SIM::VNA', keysightVNAResponder(points=1601), LatencyModel(latency=1e-3, bandwidth=10e6))
+    vna = instrumentManager.loadInstrument('vna', moduleFileOrDir='vna-keysight', kwargs={'visaAddress': 'SIM::VNA'})
+
+The ScpiResponder stores the settings written with 'HEADER value' (or ':HEADER value') and returns them to the 'HEADER?'
+queries, headers being normalized to their short form (FREQuency:STARt and FREQ:STAR are the same setting, SENSe and numeric suffix 1 are optional).
+Particular commands are scripted with responder.on(pattern, response), where response is a string, a numpy array
+(returned as an IEEE-488.2 binary block), or a function(responder, match) returning one of them or None.
+The IEEE-488.2 status registers are modelled: INIT starts an overlapped operation lasting responder.operationTime
+seconds, at the end of which a pending *OPC sets the bit 0 of the event status register (*ESR?), and the status byte
+(*STB? or serial poll) reports it through the ESB and RQS bits according to the *ESE and *SRE masks.
+"""
+
+import re
+import time
+import threading
+import numpy
+
+from application.lib.visa_blocks import blockHeader
+
+
+class SimulatedVisaIOError(IOError):
+    """
+    Error raised by a simulated resource, as a VisaIOError by a VISA resource (e.g. read without pending answer).
+    """
+    pass
+
+
+def binaryBlock(values, dtype='<f4'):
+    """
+    Returns the IEEE-488.2 definite length block '#<n><nBytes><data>' of the values encoded with dtype.
+    """
+    data = numpy.ascontiguousarray(values, dtype=dtype).tostring()
+    return blockHeader(len(data)) + data
+
+
+class LatencyModel(object):
+    """
+    Model of the time taken by the I/O of a simulated resource:
+      - latency: turnaround time in seconds of each command (or query) sent to the instrument;
+      - latencies: optional dictionary {command prefix: latency} overriding latency for particular commands
+        (the longest matching prefix is used);
+      - bandwidth: transfer rate in bytes per second of the written and read data (None for an infinite bandwidth).
+    If sleep is False, the simulated time is only accumulated in elapsed and the I/O returns immediately.
+    """
+
+    def __init__(self, latency=0., bandwidth=None, latencies=None, sleep=True):
+        self.latency = latency
+        self.bandwidth = bandwidth
+        self.latencies = dict(latencies or {})
+        self.sleep = sleep
+        self.elapsed = 0.
+
+    def commandLatency(self, command):
+        """
+        Returns the turnaround time of a command.
+        """
+        command = command.upper()
+        prefixes = [prefix for prefix in self.latencies if command.startswith(prefix.upper())]
+        if prefixes:
+            return self.latencies[max(prefixes, key=len)]
+        return self.latency
+
+    def delay(self, command, nBytes):
+        """
+        Returns the time taken by sending (or reading if command is None) nBytes bytes.
+        """
+        delay = 0.
+        if command is not None:
+            delay += self.commandLatency(command)
+        if self.bandwidth:
+            delay += float(nBytes) / self.bandwidth
+        return delay
+
+    def wait(self, command, nBytes):
+        delay = self.delay(command, nBytes)
+        self.elapsed += delay
+        if self.sleep and delay > 0:
+            time.sleep(delay)
+
+
+_units = {'HZ': 1., 'KHZ': 1e3, 'MHZ': 1e6, 'GHZ': 1e9, 'S': 1., 'MS': 1e-3, 'US': 1e-6, 'NS': 1e-9, 'PS': 1e-12,
+          'V': 1., 'MV': 1e-3, 'A': 1., 'MA': 1e-3, 'DB': 1., 'DBM': 1.}
+_numberWithUnit = re.compile(r'^([-+]?(?:\d+\.?\d*|\.\d+)(?:[eE][-+]?\d+)?)\s*([A-Za-z]+)$')
+_optionalRoots = ['SENS', 'SOUR']
+
+
+def shortMnemonic(mnemonic):
+    """
+    Returns the SCPI short form of a mnemonic, without numeric suffix if it is the default suffix 1.
+    """
+    match = re.match(r'^(\*?[A-Z_]+)(\d*)$', mnemonic.upper())
+    if match is None:
+        return mnemonic.upper()
+    name, suffix = match.groups()
+    if len(name) > 4 and not name.startswith('*'):
+        name = name[:3] if name[3] in 'AEIOU' else name[:4]
+    if suffix == '1':
+        suffix = ''
+    return name + suffix
+
+
+def normalizeHeader(header):
+    """
+    Returns the normalized form of a SCPI header: short mnemonics, optional SENSe or SOURce root node removed.
+    """
+    mnemonics = [shortMnemonic(m) for m in header.strip().strip(':').split(':') if m != '']
+    if len(mnemonics) > 1 and mnemonics[0] in _optionalRoots:
+        mnemonics = mnemonics[1:]
+    return ':'.join(mnemonics)
+
+
+def splitCommands(message, relativeHeaders=False):
+    """
+    Splits a program message into its ';' separated commands, leaving binary blocks and quoted strings untouched.
+    Unless relativeHeaders is True (e.g. to split a reply), a ValueError is raised for a command whose header is relative
+    to the multi-level header of the previous command, as SPAN in 'FREQ:CENT 1e9;SPAN 1e6' (FREQ:SPAN for a SCPI
+    instrument), the headers being taken from the root here: such commands have to be joined with ';:'.
+    """
+    commands = []
+    start = 0
+    i = 0
+    n = len(message)
+    while i < n:
+        char = message[i]
+        if char == '#' and i + 1 < n and message[i + 1] in '123456789':
+            nDigits = int(message[i + 1])
+            i += 2 + nDigits + int(message[i + 2:i + 2 + nDigits])
+            continue
+        elif char in '"\'':
+            end = message.find(char, i + 1)
+            i = n if end == -1 else end + 1
+            continue
+        elif char == ';':
+            commands.append(message[start:i])
+            start = i + 1
+        i += 1
+    commands.append(message[start:])
+    commands = [command.strip() for command in commands if command.strip() != '']
+    if not relativeHeaders:
+        multiLevel = False          # the previous header sets the current path to one of its sub-nodes
+        for command in commands:
+            if command.startswith('*'):
+                continue
+            if multiLevel and not command.startswith(':'):
+                raise ValueError("Relative header '%s' after a multi-level header in '%s'." % (command, message))
+            multiLevel = ':' in re.split(r'[\s?]', command.lstrip(':'), 1)[0]
+    return commands
+
+
+class ScpiResponder(object):
+    """
+    A scriptable SCPI instrument model answering the commands sent to a simulated resource.
+      - settings: dictionary {normalized header: value string} of the current settings;
+      - on(pattern, response): scripts the answer to the commands matching the regular expression pattern;
+      - commands: list of all commands received (if record is True).
+    Unscripted commands 'HEADER value' set settings[HEADER] = value (with unit multipliers applied),
+    and unscripted queries 'HEADER? ...' return settings[HEADER] or default.
+    INIT commands start an overlapped operation of duration operationTime in seconds (a sweep or an acquisition).
+    """
+
+    def __init__(self, identity='SIMULATED,INSTRUMENT,0,1.0', settings=None, default='0', record=False, operationTime=0.):
+        self.settings = dict()
+        self.default = default
+        self.record = record
+        self.operationTime = operationTime
+        self.commands = []
+        self._rules = []
+        self._lock = threading.RLock()
+        self._operationEnd = 0.
+        self._opcPending = False
+        self._esr = 0
+        self._ese = 0
+        self._sre = 0
+        for header, value in (settings or {}).items():
+            self.set(header, value)
+        self.on(r'\*IDN\?', identity)
+        self.on(r'\*(RST|TRG)', None)
+        self.on(r'INIT\d*(:IMM(EDIATE)?)?', lambda r, m: r.startOperation())
+        self.on(r'\*OPC', lambda r, m: r._setOpcPending())
+        self.on(r'\*OPC\?', lambda r, m: (r.waitOperation(), '1')[1])
+        self.on(r'\*WAI', lambda r, m: r.waitOperation())
+        self.on(r'\*CLS', lambda r, m: r._clearStatus())
+        self.on(r'\*ESR\?', lambda r, m: str(r.eventStatus(clear=True)))
+        self.on(r'\*STB\?', lambda r, m: str(r.statusByte()))
+        self.on(r'\*ESE *(\d+)', lambda r, m: setattr(r, '_ese', int(m.group(1))))
+        self.on(r'\*ESE\?', lambda r, m: str(r._ese))
+        self.on(r'\*SRE *(\d+)', lambda r, m: setattr(r, '_sre', int(m.group(1))))
+        self.on(r'\*SRE\?', lambda r, m: str(r._sre))
+
+    def startOperation(self):
+        """
+        Starts an overlapped operation ending operationTime seconds later.
+        """
+        self._operationEnd = time.time() + self.operationTime
+
+    def waitOperation(self):
+        """
+        Blocks until the end of the current overlapped operation (as *WAI and *OPC? do).
+        """
+        remaining = self._operationEnd - time.time()
+        if remaining > 0:
+            time.sleep(remaining)
+
+    def _setOpcPending(self):
+        self._opcPending = True
+
+    def _clearStatus(self):
+        self._esr = 0
+        self._opcPending = False
+
+    def eventStatus(self, clear=False):
+        """
+        Returns the event status register (bit 0 set once the operation pending at *OPC is complete).
+        """
+        with self._lock:
+            if self._opcPending and time.time() >= self._operationEnd:
+                self._esr |= 1
+                self._opcPending = False
+            esr = self._esr
+            if clear:
+                self._esr = 0
+            return esr
+
+    def statusByte(self):
+        """
+        Returns the status byte: ESB (bit 5) if an event enabled by *ESE occurred, RQS (bit 6) if ESB is enabled by *SRE.
+        """
+        stb = 32 if self.eventStatus() & self._ese else 0
+        if stb & self._sre:
+            stb |= 64
+        return stb
+
+    def on(self, pattern, response=None):
+        """
+        Scripts the answer to the commands matching pattern (case insensitive regular expression matching the whole command).
+        The last defined rule has precedence. response can be:
+          - None for a command without answer;
+          - a string or a numpy array (returned as a float32 binary block);
+          - a function(responder, match) returning None, a string or a numpy array.
+        """
+        with self._lock:
+            self._rules.insert(0, (re.compile('(?:' + pattern + r')$', re.IGNORECASE | re.DOTALL), response))
+        return self
+
+    def set(self, header, value):
+        self.settings[normalizeHeader(header)] = str(value)
+
+    def get(self, header, default=None):
+        return self.settings.get(normalizeHeader(header), self.default if default is None else default)
+
+    def float(self, header):
+        return float(self.get(header))
+
+    def reset(self):
+        """
+        Called when *RST is received. Override or script to reset particular settings.
+        """
+        pass
+
+    def respond(self, message):
+        """
+        Processes a program message and returns its answer (None if no command of the message is a query).
+        """
+        answers = []
+        with self._lock:
+            for command in splitCommands(message):
+                if self.record:
+                    self.commands.append(command)
+                answer = self._respond(command.lstrip(':'))
+                if answer is not None:
+                    if isinstance(answer, numpy.ndarray):
+                        answer = binaryBlock(answer)
+                    answers.append(str(answer))
+        if answers:
+            return ';'.join(answers)
+        return None
+
+    def _respond(self, command):
+        for pattern, response in self._rules:
+            match = pattern.match(command)
+            if match is not None:
+                if command.upper() == '*RST':
+                    self.reset()
+                if hasattr(response, '__call__'):
+                    return response(self, match)
+                return response
+        if '?' in command:
+            header = command[:command.index('?')]
+            return self.get(header)
+        parts = command.split(None, 1)
+        value = parts[1].strip() if len(parts) > 1 else ''
+        match = _numberWithUnit.match(value)
+        if match is not None and match.group(2).upper() in _units:
+            value = repr(float(match.group(1)) * _units[match.group(2).upper()])
+        self.set(parts[0], value)
+        return None
+
+
+class SimulatedInstrument(object):
+    """
+    A simulated VISA resource with the interface of the pyvisa instrument objects used by the drivers.
+    Answers are queued at each write and consumed by read, as for a real message-based instrument.
+    """
+
+    def __init__(self, address, responder=None, latency=None):
+        self.address = address
+        self.responder = responder if responder is not None else ScpiResponder()
+        self.latency = latency if latency is not None else LatencyModel()
+        self.timeout = 5
+        self.term_chars = None
+        self.vi = None
+        self._answers = []
+        self._lock = threading.RLock()
+
+    def write(self, message):
+        with self._lock:
+            self.latency.wait(message, len(message))
+            answer = self.responder.respond(message)
+            if answer is not None:
+                self._answers.append(answer)
+
+    def read_raw(self):
+        with self._lock:
+            if not self._answers:
+                raise SimulatedVisaIOError('Timeout expired before operation completed (%s).' % self.address)
+            answer = self._answers.pop(0)
+            self.latency.wait(None, len(answer))
+            return answer
+
+    def read(self):
+        return self.read_raw().rstrip('\r\n')
+
+    def ask(self, message):
+        with self._lock:
+            self.write(message)
+            return self.read()
+
+    def read_values(self):
+        return [float(value) for value in self.read().split(',')]
+
+    def ask_for_values(self, message):
+        with self._lock:
+            self.write(message)
+            return self.read_values()
+
+    def clear(self):
+        with self._lock:
+            self._answers = []
+
+    def trigger(self):
+        self.write('*TRG')
+
+    @property
+    def stb(self):
+        """
+        Status byte read by serial poll (without going through the message queue).
+        """
+        self.latency.wait(None, 1)
+        return self.responder.statusByte()
+
+    def wait_for_srq(self, timeout=25):
+        """
+        Waits for a service request (RQS bit of the status byte), as GpibInstrument.wait_for_srq.
+        """
+        deadline = None if timeout is None else time.time() + timeout
+        while not self.responder.statusByte() & 64:
+            if deadline is not None and time.time() > deadline:
+                raise SimulatedVisaIOError('Timeout expired before operation completed (%s).' % self.address)
+            time.sleep(1e-3)
+
+    def close(self):
+        self.clear()
+
+
+_resources = dict()      # {address: (responder, latency)}
+_lock = threading.RLock()
+
+
+def simulate(address, responder=None, latency=None):
+    """
+    Declares address as simulated, answered by responder (generic ScpiResponder if None) with the latency model latency.
+    Returns the responder.
+    """
+    if responder is None:
+        responder = ScpiResponder()
+    with _lock:
+        _resources[address] = (responder, latency if latency is not None else LatencyModel())
+    return responder
+
+
+def unsimulate(address):
+    """
+    Removes a simulated address.
+    """
+    with _lock:
+        _resources.pop(address, None)
+
+
+def isSimulated(address):
+    """
+    Returns True if the VISA address is simulated.
+    """
+    return isinstance(address, basestring) and (address in _resources or address.upper().startswith('SIM::'))
+
+
+def simulatedResponder(address):
+    """
+    Returns the responder of a simulated address (or None).
+    """
+    with _lock:
+        if address in _resources:
+            return _resources[address][0]
+
+
+def simulatedInstrument(address):
+    """
+    Opens and returns a simulated resource for the address, as visa.instrument(address) for a real one.
+    """
+    with _lock:
+        if address not in _resources:
+            simulate(address)
+        responder, latency = _resources[address]
+    return SimulatedInstrument(address, responder, latency)
+
+
+##########################################################
+#  RESPONDERS FOR THE BUNDLED DRIVERS                    #
+##########################################################
+
+def _frequencies(responder, prefix=''):
+    start, stop = responder.float(prefix + 'FREQ:STAR'), responder.float(prefix + 'FREQ:STOP')
+    return numpy.linspace(start, stop, int(responder.float(prefix + 'SWE:POIN')))
+
+
+def _resonance(frequencies, noise=0.01):
+    """
+    Returns a noisy lorentzian dip centered in the frequency range (in dB) and a linear phase.
+    """
+    center = 0.5 * (frequencies[0] + frequencies[-1])
+    width = max(abs(frequencies[-1] - frequencies[0]) / 50., 1.)
+    mag = -20. / (1 + ((frequencies - center) / width) ** 2) + noise * numpy.random.randn(len(frequencies))
+    phase = numpy.arctan((frequencies - center) / width) * 180 / numpy.pi
+    return mag, phase
+
+
+def keysightVNAResponder(points=1601, start=4e9, stop=8e9):
+    """
+    Returns a responder for the vna-keysight driver: sweep settings, measurements 1 (magnitude) and 2 (phase),
+    binary frequency and data transfers in the FORM REAL,32 or REAL,64 format, operation complete in *ESR?.
+    """
+    responder = ScpiResponder(identity='Keysight Technologies,N5232A,SIMULATED,A.10.00',
+                              settings={'SENS:SWE:POIN': points, 'SENS:FREQ:STAR': start, 'SENS:FREQ:STOP': stop,
+                                        'CALC:PAR:MNUM': 1, 'TRIG:SOUR': 'IMM', 'FORM': 'REAL,32',
+                                        'SENS:SWE:MODE': 'CONT', 'SENS:AVER': 0, 'SENS:AVER:COUN': 1})
+
+    def dtype(responder):
+        return '<f8' if responder.get('FORM').upper().endswith('64') else '<f4'
+
+    def data(responder, match):
+        mag, phase = _resonance(_frequencies(responder))
+        values = mag if responder.get('CALC:PAR:MNUM') == '1' else phase
+        return binaryBlock(values, dtype(responder))
+
+    responder.on(r'SYST:MEAS:CAT\? *\d*', '"1,2"')
+    responder.on(r'CALC\d*:X\?', lambda r, m: binaryBlock(_frequencies(r), dtype(r)))
+    responder.on(r'CALC\d*:DATA\? *(FDATA|FMEM)', data)
+    return responder
+
+
+def fspResponder(points=625, start=1e9, stop=2e9):
+    """
+    Returns a responder for the fsp driver: sweep settings and the trace query TRAC? TRACE<n>
+    answered in ASCII or, after FORM REAL,32, as a binary block.
+    """
+    responder = ScpiResponder(identity='Rohde&Schwarz,FSP-30,SIMULATED,4.3',
+                              settings={'SENS:SWE:POIN': points, 'SENS:FREQ:STAR': start, 'SENS:FREQ:STOP': stop,
+                                        'FREQ:MODE': 'SWE', 'SENS:SWE:TIME': 0.01, 'SWE:COUN': 1, 'FORM': 'ASC',
+                                        'DISP:TRAC:Y:RLEV': -10})
+
+    def trace(responder, match):
+        mag, phase = _resonance(_frequencies(responder), noise=0.5)
+        if responder.get('FORM').upper().startswith('REAL'):
+            return binaryBlock(mag, '<f4')
+        return ','.join(['%.3f' % value for value in mag])
+
+    responder.on(r'TRAC\d*\? *TRACE\d', trace)
+    responder.on(r'MMEM:(STOR|LOAD):STAT.*', None)
+    return responder
+
+
+def sr830Responder():
+    """
+    Returns a responder for the sr830 driver (commands without space between header and value, as PHAS10.0),
+    with a data buffer filling at the SRAT sample rate from STRT, read with TRCL?.
+    """
+    responder = ScpiResponder(identity='Stanford_Research_Systems,SR830,s/n00000,ver1.07',
+                              settings={'PHAS': 0, 'FMOD': 1, 'FREQ': 1000., 'SLVL': 0.004, 'HARM': 1, 'RSLP': 0,
+                                        'ISRC': 0, 'ICPL': 0, 'ILIN': 0, 'SENS': 20, 'OFLT': 8, 'OFSL': 1})
+
+    def setting(responder, match):
+        responder.set(match.group(1), match.group(2))
+
+    def snap(responder, match):
+        codes = [int(code) for code in match.group(1).split(',')]
+        return ','.join(['%.6e' % (1e-6 * code + 1e-8 * numpy.random.randn()) for code in codes])
+
+    def start(responder, match):
+        responder.bufferStart = time.time()
+
+    def storedPoints(responder):
+        if responder.bufferStart is None:
+            return 0
+        rate = 0.0625 * 2 ** int(responder.float('SRAT'))
+        return min(int((time.time() - responder.bufferStart) * rate), 16383)
+
+    def trace(responder, match):
+        count = int(match.group(3))
+        values = 1e-6 * numpy.cos(numpy.arange(int(match.group(2)), int(match.group(2)) + count) * 0.01)
+        mantissa, exponent = numpy.frexp(values)
+        words = numpy.empty((count, 2), dtype='<i2')
+        words[:, 0] = numpy.round(mantissa * 2 ** 14)
+        words[:, 1] = exponent - 14 + 124
+        return words.tostring()
+
+    responder.bufferStart = None
+    responder.on(r'([A-Z]{4}) *([-+]?[\d.]+(?:E[-+]?\d+)?)', setting)
+    responder.on(r'SNAP\? *([\d, ]+)', snap)
+    responder.on(r'OUT[PR] *\? *\d', lambda r, m: '%.6e' % (1e-6 * numpy.random.randn()))
+    responder.on(r'STRT', start)
+    responder.on(r'REST', lambda r, m: setattr(r, 'bufferStart', None))
+    responder.on(r'PAUS', None)
+    responder.on(r'SPTS\?', lambda r, m: str(storedPoints(r)))
+    responder.on(r'TRCL\? *(\d) *, *(\d+) *, *(\d+)', trace)
+    return responder
+
+
+def yokogawaResponder():
+    """
+    Returns a responder for the yokogawa driver (7651 commands: F1/F5 mode, R range, S value, O output, E execute).
+    """
+    responder = ScpiResponder(identity='YOKOGAWA,7651,SIMULATED,1.0')
+    state = {'mode': 'V', 'value': 0., 'output': False}
+
+    def setMode(responder, match):
+        state['mode'] = 'V' if match.group(1) == '1' else 'A'
+
+    def setValue(responder, match):
+        state['value'] = float(match.group(1))
+
+    def setOutput(responder, match):
+        state['output'] = match.group(1) == '1'
+
+    responder.state = state
+    responder.on(r'F([15])', setMode)
+    responder.on(r'R\d', None)
+    responder.on(r'E', None)
+    responder.on(r'S([-+]?[\d.]+(?:E[-+]?\d+)?)', setValue)
+    responder.on(r'O([01])', setOutput)
+    responder.on(r'OD', lambda r, m: 'NDC%s%+.4fE+0' % (state['mode'], state['value']))
+    responder.on(r'OC', lambda r, m: 'STS1=%d' % (16 if state['output'] else 0))
+    return responder
+
+
+def awgResponder():
+    """
+    Returns a responder for the awgv2 driver (Tektronix AWG5000): waveform list with binary uploads and downloads.
+    """
+    responder = ScpiResponder(identity='TEKTRONIX,AWG5014,SIMULATED,3.1',
+                              settings={'AWGC:RMOD': 'TRIG', 'AWGC:RRAT': 1e5, 'AWGC:CLOC:SOUR': 'INT',
+                                        'AWGC:CONF:CNUM': 4, 'TRIG:TIM': 1e-4})
+    waveforms = dict()     # {name: [size, type, data, markers]}
+
+    def new(responder, match):
+        waveforms[match.group(1)] = [int(match.group(2)), match.group(3).upper(), '', '']
+
+    def upload(index):
+        def write(responder, match):
+            block = match.group(2)
+            waveforms.setdefault(match.group(1), [0, 'INT', '', ''])[index] = block[2 + int(block[1]):]
+        return write
+
+    def delete(responder, match):
+        if match.group(1).upper() == 'ALL':
+            waveforms.clear()
+        else:
+            waveforms.pop(match.group(1).strip('"'), None)
+
+    def get(index):
+        def answer(responder, match):
+            data = waveforms.get(match.group(1), [0, 'INT', '', ''])[index]
+            return blockHeader(len(data)) + data
+        return answer
+
+    responder.waveforms = waveforms
+    responder.on(r'WLIS\w*:WAV\w*:NEW +"([^"]*)",(\d+),(\w+)', new)
+    responder.on(r'WLIS\w*:WAV\w*:DATA +"([^"]*)",\d+,\d+,(#.*)', upload(2))
+    responder.on(r'WLIS\w*:WAV\w*:MARK\w*:DATA +"([^"]*)",\d+,\d+,(#.*)', upload(3))
+    responder.on(r'WLIS\w*:WAV\w*:DEL\w* +(ALL|"[^"]*")', delete)
+    responder.on(r'WLIS\w*:WAV\w*:DATA\? +"([^"]*)"', get(2))
+    responder.on(r'WLIS\w*:WAV\w*:MARK\w*:DATA\? +"([^"]*)"', get(3))
+    responder.on(r'WLIS\w*:WAV\w*:TYPE?\? +"([^"]*)"', lambda r, m: waveforms.get(m.group(1), [0, 'INT'])[1])
+    responder.on(r'WLIS\w*:SIZE\?', lambda r, m: str(len(waveforms)))
+    responder.on(r'WLIS\w*:NAME\? +(\d+)', lambda r, m: '"%s"' % sorted(waveforms.keys())[int(m.group(1))])
+    return responder
+
+
+def lecroyResponder(points=10002):
+    """
+    Returns a responder for the lecroy drivers: communication settings and C<n>:WaveForm? DAT1 answered as a block of
+    16-bit samples.
+    """
+    responder = ScpiResponder(identity='LECROY,WAVERUNNER,SIMULATED,6.1',
+                              settings={'COMM_FORMAT': 'DEF9,WORD,BIN', 'COMM_HEADER': 'OFF', 'COMM_ORDER': 'LO'})
+
+    def waveform(responder, match):
+        samples = (8000 * numpy.sin(numpy.arange(points) * 0.01) + 100 * numpy.random.randn(points)).astype('<i2')
+        return binaryBlock(samples, '<i2')
+
+    responder.on(r'(C\d|T[A-D]|M\d):(WF|WAVEFORM)\? *(DAT1|ALL)?', waveform)
+    return responder
@@ -0,0 +1,134 @@
+"""
+Statistics of the I/O of VISA instruments.
+
+A VisaIOStatistics object is attached to a VisaInstrument by instrument.enableIOStatistics() and records, for each
+command prefix ('ask FREQ:START?', 'write SENS1:SWEEP:POINTS', 'read',...) executed through executeVisaCommand:
+  - the number of calls, the number of bytes written and read, the total and maximum latencies;
+  - a latency histogram with logarithmic bins (binsPerDecade bins per decade from minLatency to maxLatency).
+The command prefix is the method name followed by the header of the first command of the message (values are removed,
+including the numeric arguments appended without space to the header, as in the sr830 commands OFLT8 or SENS12).
+"""
+
+import re
+import math
+import time
+import threading
+
+_value = re.compile(r'[-+]?(?:\d+\.?\d*|\.\d+)(?:[eE][-+]?\d+)?$')
+
+
+def commandPrefix(methodName, args):
+    """
+    Returns the prefix under which a call of a VISA method with arguments args is recorded.
+    """
+    if not args or not isinstance(args[0], basestring):
+        return methodName
+    words = args[0][:80].split(';', 1)[0].split(None, 1)
+    if not words:
+        return methodName
+    header = words[0]
+    if '?' in header:                   # query arguments appended without space, as SNAP?1,2
+        header = header[:header.index('?') + 1]
+    return methodName + ' ' + _value.sub('', header).upper()
+
+
+class VisaIOStatistics(object):
+    """
+    I/O statistics of a VISA instrument, per command prefix.
+    """
+
+    binsPerDecade = 5
+    minLatency = 1e-6
+    maxLatency = 1e3
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._nBins = int(round(math.log10(self.maxLatency / self.minLatency) * self.binsPerDecade)) + 2
+        self.clear()
+
+    def clear(self):
+        """
+        Clears all the recorded statistics.
+        """
+        with self._lock:
+            self._commands = dict()     # {prefix: [calls, bytesOut, bytesIn, totalTime, maxTime, histogram]}
+            self._since = time.time()
+
+    def latencyBins(self):
+        """
+        Returns the list of the lower edges of the histogram bins in seconds (the first bin collects the latencies
+        below minLatency and the last one those above maxLatency).
+        """
+        edges = [self.minLatency * 10 ** (float(i) / self.binsPerDecade) for i in range(self._nBins - 1)]
+        return [0.] + edges
+
+    def _bin(self, latency):
+        if latency <= self.minLatency:
+            return 0
+        index = int(math.log10(latency / self.minLatency) * self.binsPerDecade) + 1
+        return index if index < self._nBins else self._nBins - 1
+
+    def record(self, methodName, args, result, latency):
+        """
+        Records a call of the VISA method methodName with arguments args, that returned result after latency seconds.
+        """
+        prefix = commandPrefix(methodName, args)
+        bytesOut = len(args[0]) if args and isinstance(args[0], basestring) else 0
+        bytesIn = len(result) if isinstance(result, basestring) else 0
+        with self._lock:
+            entry = self._commands.get(prefix)
+            if entry is None:
+                entry = self._commands[prefix] = [0, 0, 0, 0., 0., [0] * self._nBins]
+            entry[0] += 1
+            entry[1] += bytesOut
+            entry[2] += bytesIn
+            entry[3] += latency
+            if latency > entry[4]:
+                entry[4] = latency
+            entry[5][self._bin(latency)] += 1
+
+    def statistics(self):
+        """
+        Returns the dictionary {command prefix: {'calls', 'bytesOut', 'bytesIn', 'totalTime', 'meanTime', 'maxTime',
+        'histogram'}} of the recorded statistics (times in seconds, histogram over the bins of latencyBins()).
+        """
+        with self._lock:
+            statistics = dict()
+            for prefix, (calls, bytesOut, bytesIn, totalTime, maxTime, histogram) in self._commands.items():
+                statistics[prefix] = {'calls': calls, 'bytesOut': bytesOut, 'bytesIn': bytesIn, 'totalTime': totalTime,
+                                      'meanTime': totalTime / calls, 'maxTime': maxTime, 'histogram': list(histogram)}
+            return statistics
+
+    def summary(self, sortBy='totalTime'):
+        """
+        Returns a printable table of the statistics, sorted by decreasing sortBy.
+        """
+        statistics = self.statistics()
+        prefixes = sorted(statistics, key=lambda prefix: statistics[prefix][sortBy], reverse=True)
+        lines = ['%-40s %8s %10s %10s %10s %10s' % ('command', 'calls', 'out (B)', 'in (B)', 'total (s)', 'mean (ms)')]
+        for prefix in prefixes:
+            s = statistics[prefix]
+            lines.append('%-40s %8i %10i %10i %10.4f %10.3f' % (prefix[:40], s['calls'], s['bytesOut'], s['bytesIn'],
+                                                               s['totalTime'], s['meanTime'] * 1e3))
+        return '\n'.join(lines)
+
+    def toDatacube(self, name='VISA I/O statistics'):
+        """
+        Returns the statistics as a datacube with one row per command prefix (columns calls, bytesOut, bytesIn,
+        totalTime, meanTime, maxTime), and for each row a child cube 'histogram' (columns latency_s, count)
+        with attribute command = prefix.
+        """
+        from application.lib.datacube import Datacube
+        statistics = self.statistics()
+        prefixes = sorted(statistics)
+        cube = Datacube(name)
+        cube.setParameters({'commands': prefixes, 'since': time.asctime(time.localtime(self._since))})
+        for column in ['calls', 'bytesOut', 'bytesIn', 'totalTime', 'meanTime', 'maxTime']:
+            cube.createCol(name=column, values=[statistics[prefix][column] for prefix in prefixes], notify=False)
+        bins = self.latencyBins()
+        for row, prefix in enumerate(prefixes):
+            histogram = Datacube('histogram')
+            histogram.createCol(name='latency_s', values=bins, notify=False)
+            histogram.createCol(name='count', values=statistics[prefix]['histogram'], notify=False)
+            cube.addChild(histogram, row=row, command=prefix)
+        return cube
@@ -0,0 +1,145 @@
+"""
+Vectorized post-processing of the traces of vector network analyzers, in numpy.
+
+All the functions work on whole arrays of a trace (frequencies in Hz or GHz, magnitudes in dB or linear units, phases
+in degrees or radians), and are shared by the Keysight and Anritsu VNA drivers:
+  - dB and linear conversions: dBToLinear(), linearToDB();
+  - complex conversions: toComplex(), magPhase();
+  - phase unwrapping: unwrapPhase() (vectorized version of the former list-based unwind());
+  - delay and phase removal: removeDelay(), removeSlope(), imposeDeltaPhase(), estimateDelay();
+  - smoothing: smooth() (moving average);
+  - the corrections of getFreqMagPhase() in a single call: correctPhase().
+Results are meant to be pushed into a Datacube as whole columns (see Datacube.createCols()).
+"""
+
+import numpy
+
+
+def dBToLinear(values, power=False):
+    """
+    Converts values in dB to linear amplitudes (10**(dB/20)), or powers if power is True (10**(dB/10)).
+    """
+    return 10 ** (numpy.asarray(values, dtype=float) / (10. if power else 20.))
+
+
+def linearToDB(values, power=False):
+    """
+    Converts linear amplitudes (or powers if power is True) to dB.
+    """
+    return (10. if power else 20.) * numpy.log10(numpy.abs(values))
+
+
+def toComplex(mag, phase, dB=True, degrees=True):
+    """
+    Returns the complex array of magnitudes mag (in dB if dB is True) and phases phase (in degrees if degrees is True).
+    """
+    amplitude = dBToLinear(mag) if dB else numpy.asarray(mag, dtype=float)
+    phase = numpy.asarray(phase, dtype=float)
+    return amplitude * numpy.exp(1j * (numpy.deg2rad(phase) if degrees else phase))
+
+
+def magPhase(values, dB=True, degrees=True):
+    """
+    Returns the (magnitudes, phases) of the complex array values, in dB and degrees by default.
+    """
+    values = numpy.asarray(values)
+    return (linearToDB(values) if dB else numpy.abs(values)), numpy.angle(values, deg=degrees)
+
+
+def unwrapPhase(phase, period=360.):
+    """
+    Unwraps an array of phases defined on a circle of period period, by removing the jumps larger than period / 2.
+    """
+    phase = numpy.asarray(phase, dtype=float)
+    if len(phase) < 2:
+        return phase.copy()
+    jumps = numpy.round(numpy.diff(phase) / period)
+    return phase - period * numpy.concatenate([[0.], numpy.cumsum(jumps)])
+
+
+def removeSlope(freq, phase, slope, reference=None):
+    """
+    Subtracts slope * (freq - reference) from phase, reference being the first frequency by default.
+    """
+    freq = numpy.asarray(freq, dtype=float)
+    if reference is None:
+        reference = freq[0]
+    return numpy.asarray(phase, dtype=float) - slope * (freq - reference)
+
+
+def removeDelay(freq, phase, delay, degrees=True, reference=None):
+    """
+    Removes from phase the phase shift -2 pi freq delay of an electrical delay delay (in the inverse unit of freq),
+    relative to the frequency reference (first frequency by default).
+    """
+    period = 360. if degrees else 2 * numpy.pi
+    return removeSlope(freq, phase, -period * delay, reference)
+
+
+def estimateDelay(freq, phase, degrees=True):
+    """
+    Returns the electrical delay (in the inverse unit of freq) given by the least-squares slope of the unwrapped phase.
+    """
+    period = 360. if degrees else 2 * numpy.pi
+    slope = numpy.polyfit(numpy.asarray(freq, dtype=float), unwrapPhase(phase, period), 1)[0]
+    return -slope / period
+
+
+def imposeDeltaPhase(phase, deltaPhase):
+    """
+    Subtracts from phase a linear ramp such that the difference between the last and first points becomes deltaPhase
+    (as the former correctPhase() of the VNA drivers).
+    """
+    phase = numpy.asarray(phase, dtype=float)
+    return phase - (phase[-1] - phase[0] - deltaPhase) / len(phase) * numpy.arange(len(phase))
+
+
+def smooth(values, window=5):
+    """
+    Returns the moving average of values over window points (centered, on fewer points at the edges), of the same
+    length as values. Works on real or complex arrays.
+    """
+    values = numpy.asarray(values)
+    window = int(window)
+    if window <= 1 or len(values) == 0:
+        return values.copy()
+    cumulative = numpy.concatenate([numpy.zeros(1, dtype=values.dtype), numpy.cumsum(values)])
+    indices = numpy.arange(len(values))
+    lower = numpy.maximum(indices - window // 2, 0)
+    upper = numpy.minimum(indices - window // 2 + window, len(values))
+    return (cumulative[upper] - cumulative[lower]) / (upper - lower)
+
+
+def correctPhase(freq, phase, unwindPhase=False, subtractedSlope=None, deltaPhase=None, electricalDelay=None,
+                 phaseOffset=None, phaseStart=None, phaseStop=None, period=360.):
+    """
+    Applies in order, if requested, the corrections of the VNA drivers' getFreqMagPhase() to the phase array:
+    unwrapping, subtraction of a slope (or else imposition of a total phase difference deltaPhase), removal of an
+    electrical delay, and addition of an offset (or of the offset giving phaseStart at the first point or phaseStop at
+    the last point).
+    Returns (phase, parameters) where parameters is the dictionary of the applied corrections.
+    """
+    phase = numpy.asarray(phase, dtype=float)
+    parameters = {'unwind': False, 'subtractedSlope': None, 'deltaPhase': None, 'electricalDelay': None,
+                  'phaseOffset': None}
+    if unwindPhase:
+        phase = unwrapPhase(phase, period)
+        parameters['unwind'] = True
+    # slope subtraction has priority over imposing the total delta jump
+    if subtractedSlope is not None:
+        phase = removeSlope(freq, phase, subtractedSlope)
+        parameters['subtractedSlope'] = subtractedSlope
+    elif deltaPhase is not None:
+        phase = imposeDeltaPhase(phase, deltaPhase)
+        parameters['deltaPhase'] = deltaPhase
+    if electricalDelay is not None:
+        phase = removeDelay(freq, phase, electricalDelay, degrees=period == 360.)
+        parameters['electricalDelay'] = electricalDelay
+    if phaseStart is not None:
+        phaseOffset = phaseStart - phase[0]
+    elif phaseStop is not None:
+        phaseOffset = phaseStop - phase[-1]
+    if phaseOffset is not None:
+        phase = phase + phaseOffset
+        parameters['phaseOffset'] = phaseOffset
+    return phase, parameters
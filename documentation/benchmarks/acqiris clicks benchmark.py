@@ -0,0 +1,60 @@
+#################################################################
+## BENCHMARK OF THE VECTORIZED CLICK COUNTING OF THE JBA READOUTS ##
+#################################################################
+
+# Compares the rotation, click counting and joint probabilities of acqiris_clicks.countClicks with the former
+# frequenciesAnalyse post-processing (rotation per readout, then a double Python loop packing the clicks and
+# accumulating the joint probabilities segment by segment), checks that both give the same probabilities,
+# and times countClicks for 10^5 to 10^6 segments and 2 to 8 readouts.
+import sys
+import time
+import math
+import numpy
+
+sys.path.append('lab/instruments/digitizers_scopes/acqiris')
+from acqiris_clicks import *
+
+
+def formerCounting(components, corrections):
+    nJBA, nbSegments = components.shape[0], components.shape[2]
+    clicks = numpy.zeros((nJBA, nbSegments))
+    for i in range(nJBA):
+        xOffset, yOffset, angle = corrections[i]
+        U = (components[i, 0] - xOffset) * math.cos(angle) + (components[i, 1] - yOffset) * math.sin(angle)
+        clicks[i] = U > 0
+    proba = numpy.zeros(2 ** nJBA)
+    tempArray = numpy.zeros(nbSegments, dtype=int)
+    for i in range(0, nJBA):
+        for j in range(0, nbSegments):
+            tempArray[j] += clicks[i, j] * 2 ** i
+    for j in range(0, nbSegments):
+        proba[tempArray[j]] += 1. / nbSegments
+    return clicks, proba
+
+
+def readouts(nbrReadouts, nbrSegments):
+    random = numpy.random.RandomState(0)
+    components = random.normal(0, 1, (nbrReadouts, 2, nbrSegments))
+    corrections = numpy.transpose([random.normal(0, 0.5, nbrReadouts), random.normal(0, 0.5, nbrReadouts),
+                                   random.uniform(0, 2 * math.pi, nbrReadouts)])
+    return components, corrections
+
+components, corrections = readouts(4, 100000)
+t0 = time.time()
+clicks1, proba1 = formerCounting(components, corrections)
+former = time.time() - t0
+t0 = time.time()
+rotated, clicks2, probabilities, proba2, correlations = countClicks(components, corrections)
+current = time.time() - t0
+print '4 readouts, 10^5 segments: former %.3f s, countClicks %.4f s (x%.0f), max probability difference %.1e' % (
+    former, current, former / current, abs(proba1 - proba2).max())
+print 'clicks identical:', numpy.array_equal(clicks1, clicks2)
+
+print '%-10s %-10s %12s %18s' % ('readouts', 'segments', 'time (ms)', 'segments/s')
+for nbrReadouts in [2, 4, 8]:
+    for nbrSegments in [100000, 1000000]:
+        components, corrections = readouts(nbrReadouts, nbrSegments)
+        t0 = time.time()
+        countClicks(components, corrections)
+        elapsed = time.time() - t0
+        print '%-10i %-10i %12.1f %18.0f' % (nbrReadouts, nbrSegments, elapsed * 1e3, nbrSegments / elapsed)
@@ -0,0 +1,79 @@
+###############################################################
+## BENCHMARK OF THE NUMPY MULTI-FREQUENCY ACQIRIS DEMODULATION ##
+###############################################################
+
+# Demodulates synthetic sequences of 4 tones (I and Q channels, random trigger positions) with the numpy engine of
+# acqiris_demodulation, checks it against a direct per-segment evaluation of the demodulation formula, and gives the
+# number of segments demodulated per second versus the number of tones, for the single pass over all the tones and for
+# one call per tone (as frequenciesAnalyse formerly did with the DLL).
+# On Windows, when the demodulation DLL can be loaded, the numpy results are also compared with ModuleDLL2.demodulate2ChIQ.
+import sys
+import time
+import math
+import numpy
+
+acqirisDir = 'lab/instruments/digitizers_scopes/acqiris'
+sys.path.append(acqirisDir)
+from acqiris_demodulation import *
+
+samplingTime = 1e-9
+nbrSamplesPerSegment = 500
+nbrSegments = 10000
+tones = [0.0613e9, 0.0837e9, 0.1052e9, 0.1291e9, 0.1474e9, 0.1718e9, 0.1902e9, 0.2133e9]
+amplitudes = [0.1, 0.05, 0.08, 0.02, 0.06, 0.03, 0.07, 0.04]
+
+random = numpy.random.RandomState(0)
+horPos = -random.uniform(0, samplingTime, nbrSegments)
+t = horPos[:, numpy.newaxis] + samplingTime * numpy.arange(nbrSamplesPerSegment)
+phases = random.uniform(0, 2 * math.pi, (len(tones), nbrSegments, 1))
+signal = sum([a * numpy.exp(1j * (2 * math.pi * f * t + phi)) for f, a, phi in zip(tones, amplitudes, phases)])
+signal += random.normal(0, 0.01, signal.shape) + 1j * random.normal(0, 0.01, signal.shape)
+chA, chB = signal.real.ravel(), signal.imag.ravel()
+
+
+def direct(frequency, segment, start, length):
+    samples = slice(segment * nbrSamplesPerSegment + start, segment * nbrSamplesPerSegment + start + length)
+    times = horPos[segment] + samplingTime * numpy.arange(start, start + length)
+    z = numpy.mean((chA[samples] + 1j * chB[samples]) * numpy.exp(-2j * math.pi * frequency * times))
+    return z.real, z.imag
+
+demodulator = MultiFrequencyDemodulator()
+print 'check against the direct formula (max abs error over 20 segments):'
+for intervalMode in [-1, 0, 4]:
+    results = demodulator.demodulate(chA, chB, horPos, nbrSegments, nbrSamplesPerSegment, samplingTime, tones[:4],
+                                     intervalMode=intervalMode)
+    error = 0.
+    for frequency, (I, Q) in zip(tones[:4], results):
+        length, nbrIntervals = demodulationIntervals(nbrSamplesPerSegment, samplingTime, frequency, intervalMode)
+        for segment in range(20):
+            for j in range(nbrIntervals):
+                Id, Qd = direct(frequency, segment, j * length, length)
+                error = max(error, abs(I[segment, j] - Id), abs(Q[segment, j] - Qd))
+    print '  intervalMode %2i: %.2e' % (intervalMode, error)
+
+try:
+    import acqiris_ModuleDLL2
+    module = acqiris_ModuleDLL2.ModuleDLL2()
+    module.demodulator.version()
+except Exception:
+    print 'demodulation DLL not available: no comparison with demodulate2ChIQ'
+else:
+    for frequency in tones[:4]:
+        dll = module.demodulate2ChIQ(chA, chB, horPos, nbrSegments, nbrSamplesPerSegment, samplingTime, frequency)
+        ours = demodulator.demodulate2ChIQ(chA, chB, horPos, nbrSegments, nbrSamplesPerSegment, samplingTime, frequency)
+        print 'DLL comparison at %.4f GHz: max abs difference I %.2e, Q %.2e' % (
+            frequency / 1e9, abs(dll[2] - ours[2]).max(), abs(dll[3] - ours[3]).max())
+
+print '%-8s %22s %22s' % ('tones', 'one pass (segments/s)', 'per tone (segments/s)')
+for nbrTones in [1, 2, 4, 8]:
+    frequencies = tones[:nbrTones]
+    demodulator.demodulate(chA, chB, horPos, nbrSegments, nbrSamplesPerSegment, samplingTime, frequencies)
+    t0 = time.time()
+    demodulator.demodulate(chA, chB, horPos, nbrSegments, nbrSamplesPerSegment, samplingTime, frequencies)
+    onePass = time.time() - t0
+    t0 = time.time()
+    for frequency in frequencies:
+        MultiFrequencyDemodulator().demodulate(chA, chB, horPos, nbrSegments, nbrSamplesPerSegment, samplingTime,
+                                               [frequency])
+    perTone = time.time() - t0
+    print '%-8i %22.0f %22.0f' % (nbrTones, nbrSegments / onePass, nbrSegments / perTone)
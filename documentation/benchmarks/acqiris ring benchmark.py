@@ -0,0 +1,82 @@
+##########################################################
+## BENCHMARK OF THE DOUBLE-BUFFERED ACQIRIS ACQUISITIONS ##
+##########################################################
+
+# A simulated digitizer acquires sequences of 2000 segments of 500 samples at a 20 kHz trigger rate (100 ms per
+# sequence) and transfers them into the arrays it is given. Each sequence is demodulated at 4 frequencies and its
+# clicks counted (acqiris_demodulation and acqiris_clicks).
+# The throughput is given for the former serial scheme (new arrays at each acquisition, then processing) and for an
+# AcquisitionRing of 2 and 3 preallocated buffers, with the overlap ratio of acquisition and processing.
+import sys
+import time
+import math
+import numpy
+
+sys.path.append('lab/instruments/digitizers_scopes/acqiris')
+from acqiris_ring import *
+from acqiris_demodulation import MultiFrequencyDemodulator
+from acqiris_clicks import countClicks
+
+
+class SimulatedDigitizer(object):
+    """
+    A digitizer acquiring numberOfSegments segments of numberOfPoints samples at triggerRate.
+    """
+
+    def __init__(self, numberOfSegments=2000, numberOfPoints=500, triggerRate=20e3, samplingTime=1e-9):
+        self._params = {'numberOfSegments': numberOfSegments, 'numberOfPoints': numberOfPoints}
+        self.triggerRate = triggerRate
+        self.samplingTime = samplingTime
+        t = samplingTime * numpy.arange(numberOfPoints)
+        random = numpy.random.RandomState(0)
+        phases = random.uniform(0, 2 * math.pi, (numberOfSegments, 1))
+        signal = sum([numpy.exp(1j * (2 * math.pi * f * t + phases)) for f in [0.05e9, 0.07e9, 0.11e9, 0.13e9]])
+        self.data = [signal.real.ravel(), signal.imag.ravel()]
+
+    def sizes(self):
+        size = self._params['numberOfSegments'] * self._params['numberOfPoints']
+        return [1, 1, size, size], self._params['numberOfSegments'], 0
+
+    def fill(self, buffer):
+        time.sleep(self._params['numberOfSegments'] / self.triggerRate)     # acquisition
+        buffer.waves[2][:] = self.data[0]                                      # transfer
+        buffer.waves[3][:] = self.data[1]
+        buffer.horPos[:] = 0.
+        buffer.nbrSegmentsArray[:] = self._params['numberOfSegments']
+        buffer.info.update({'samplingTime': self.samplingTime, 'nbrSamplesPerSeg': self._params['numberOfPoints']})
+
+digitizer = SimulatedDigitizer()
+demodulator = MultiFrequencyDemodulator()
+frequencies = [0.05e9, 0.07e9, 0.11e9, 0.13e9]
+
+
+def process(wave):
+    nbrSegments = wave['nbrSegmentArray'][0]
+    demodulated = demodulator.demodulate(wave['wave'][2], wave['wave'][3], wave['horPos'], nbrSegments,
+                                         wave['nbrSamplesPerSeg'], wave['samplingTime'], frequencies)
+    components = numpy.array([[I[:, 0], Q[:, 0]] for I, Q in demodulated])
+    return countClicks(components, numpy.zeros((len(frequencies), 3)))[3]
+
+nbrAcquisitions = 20
+acquisitionTime = processingTime = 0.
+t0 = time.time()
+for i in range(nbrAcquisitions):
+    t = time.time()
+    buffer = AcquisitionBuffer(*digitizer.sizes())      # new arrays at each acquisition
+    digitizer.fill(buffer)
+    acquisitionTime += time.time() - t
+    t = time.time()
+    process(buffer.view())
+    processingTime += time.time() - t
+elapsed = time.time() - t0
+print '%-22s %8s %14s %14s %10s' % ('scheme', 'seq/s', 'acquisition s', 'processing s', 'overlap')
+print '%-22s %8.2f %14.2f %14.2f %10.2f' % ('serial', nbrAcquisitions / elapsed, acquisitionTime, processingTime, 0.)
+
+for nbrBuffers in [2, 3]:
+    ring = AcquisitionRing(digitizer.fill, [AcquisitionBuffer(*digitizer.sizes()) for i in range(nbrBuffers)])
+    for wave in ring.acquisitions(nbrAcquisitions):
+        process(wave)
+    statistics = ring.statistics()
+    print '%-22s %8.2f %14.2f %14.2f %10.2f' % ('ring of %i buffers' % nbrBuffers, statistics['throughput'],
+                                                statistics['acquisitionTime'], statistics['processingTime'],
+                                                statistics['overlap'])
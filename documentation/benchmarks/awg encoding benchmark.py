@@ -0,0 +1,54 @@
+#########################################################
+## BENCHMARK OF THE VECTORIZED AWG WAVEFORM ENCODING  ##
+#########################################################
+
+# Compares the numpy encoding of application.lib.awg_encoding with the former per-sample struct.pack loops
+# of the awgv2 driver, checks that both give the same bytes, and times the upload string of an 8M-point waveform.
+import time
+import struct
+import numpy
+from application.lib.awg_encoding import *
+
+
+def oldIntData(values, markers):
+    output = ""
+    for i in range(0, len(values)):
+        marker = int(markers[i])
+        value = int(values[i])
+        output += struct.pack("<H", ((marker & 3) << 14) + (value & (0xFFFF >> 2)))
+    return output
+
+
+def oldRealData(values, markers):
+    output = ""
+    for i in range(0, len(values)):
+        output += struct.pack("<f", values[i]) + struct.pack("B", (int(markers[i]) & 3) << 6)
+    return output
+
+## same bytes on a short waveform
+n = 20000
+waveform = numpy.sin(numpy.linspace(0, 200 * numpy.pi, n)) * 1.2
+markers = numpy.random.randint(0, 4, n)
+clipped, wasClipped = clipWaveform(waveform)
+t0 = time.time()
+old = oldIntData(toInt14(clipped), markers)
+tOld = time.time() - t0
+t0 = time.time()
+new = encodeIntData(toInt14(clipped), markers)
+tNew = time.time() - t0
+print 'INT encoding of %i points: identical bytes = %s, loop %.3f s, numpy %.5f s' % (n, old == new, tOld, tNew)
+print 'REAL encoding of %i points: identical bytes = %s' % (n, oldRealData(clipped, markers) == encodeRealData(clipped, markers))
+
+## 8M points
+n = 8 * 1024 * 1024
+waveform = numpy.sin(numpy.linspace(0, 2000 * numpy.pi, n)) * 1.2
+markers = numpy.zeros(n, dtype=numpy.int8)
+markers[:10000] = 3
+t0 = time.time()
+clipped, wasClipped = clipWaveform(waveform)
+data = encodeIntData(toInt14(clipped), markers)
+command = encodeBlock('WLIST:WAVEFORM:DATA "ch1",0,%d,' % n, data)
+print 'INT upload string of %i points (%i bytes) built in %.3f s' % (n, len(command), time.time() - t0)
+t0 = time.time()
+command = encodeBlock('WLIST:WAVEFORM:DATA "ch1",0,%d,' % n, encodeRealData(clipped, markers))
+print 'REAL upload string of %i points (%i bytes) built in %.3f s' % (n, len(command), time.time() - t0)
@@ -0,0 +1,113 @@
+###############################################
+## BENCHMARK OF THE CODE EDITOR BLOCK INDEX ##
+###############################################
+
+# A 20000-line measurement script (cells of 50 lines beginning with '##', loops and functions with nested indentation,
+# comments and blank lines) is emulated by its list of lines, Qt not being needed:
+#  - former editor: the current cell is found by copying the whole text (toPlainText()) and searching '\n##' with
+#    rfind/find, twice per cursor move; the fold markers of the ~50 visible lines are found with the regexes of the
+#    former NumberBar.isBeginningOfBlock();
+#  - block index: application.ide.editor.codeblocks.CodeBlockIndex, updated from each edit.
+# The times per cursor move and per repaint of the number bar are given, as well as the cost of updating the index
+# after typing a character, inserting a line and inserting a cell, compared to rebuilding it.
+import re
+import time
+import random
+
+from application.ide.editor.codeblocks import CodeBlockIndex
+
+random.seed(0)
+cell = ['## cell %i', '', 'import numpy', 'from application.lib.datacube import Datacube', '',
+        'def measure(frequencies):', '    """', '    Measures the transmission.', '    """',
+        '    data = Datacube("transmission")', '    for f in frequencies:', '        # set the frequency',
+        '        vna.setFrequency(f)', '        if f > 5e9:', '            data.set(f=f, mag=vna.mag())',
+        '            data.commit()', '        else:', '            pass', '', '    return data', '']
+cell = cell * 3
+lines = []
+while len(lines) < 20000:
+    lines.extend([line % (len(lines) / 50) if '%' in line else line for line in cell[:50]])
+lines = lines[:20000]
+
+
+def formerCurrentCell(lines, position, delimiter='\n##'):
+    text = u'\n'.join(lines)
+    blockStart = text.rfind(delimiter, 0, max(0, position - 1)) + 1
+    blockEnd = text.find(delimiter, position)
+    return blockStart, blockEnd if blockEnd != -1 else len(text)
+
+
+def formerIsBeginningOfBlock(lines, i):
+    if lines[i][:2] == "##":
+        return True
+    if re.match("^\s*$", lines[i]):
+        return False
+    matchBlock = re.search("^(\s+)", lines[i])
+    indentation = "" if matchBlock is None else matchBlock.group(1)
+    next = i + 1
+    while next < len(lines) and re.match("(^\s*$)|(^\s*\#.*$)", lines[next]):
+        next += 1
+    matchNextBlock = re.search("^(\s+)", lines[next]) if next < len(lines) else None
+    nextIndentation = "" if matchNextBlock is None else matchNextBlock.group(1)
+    return len(nextIndentation) > len(indentation)
+
+starts = [0]
+for line in lines[:-1]:
+    starts.append(starts[-1] + len(line) + 1)
+t0 = time.time()
+index = CodeBlockIndex(lines)
+resetTime = time.time() - t0
+
+# consistency with the former editor, for cursors at the end of lines (the former search also returned the previous
+# cell for a cursor in the first two characters of a '##' line)
+for i in random.sample(range(len(lines)), 200):
+    first, last = index.cellRange(i)
+    position = starts[i] + len(lines[i])
+    assert formerCurrentCell(lines, position) == (starts[first], starts[last] + len(lines[last]))
+    assert bool(formerIsBeginningOfBlock(lines, i)) == index.isFoldStart(i)
+
+moves = random.sample(range(len(lines)), 100)
+t0 = time.time()
+for i in moves:
+    formerCurrentCell(lines, starts[i] + len(lines[i]))
+    formerCurrentCell(lines, starts[i] + len(lines[i]))
+formerMove = (time.time() - t0) / len(moves)
+t0 = time.time()
+for i in moves:
+    index.cellRange(i)
+indexMove = (time.time() - t0) / len(moves)
+
+t0 = time.time()
+for i in moves:
+    [formerIsBeginningOfBlock(lines, j) for j in range(i, min(i + 50, len(lines)))]
+formerPaint = (time.time() - t0) / len(moves)
+t0 = time.time()
+for i in moves:
+    [index.isFoldStart(j) for j in range(i, min(i + 50, len(lines)))]
+indexPaint = (time.time() - t0) / len(moves)
+
+print '%-30s %16s %16s' % ('operation', 'former (ms)', 'index (ms)')
+print '%-30s %16.3f %16.4f' % ('cursor move', formerMove * 1e3, indexMove * 1e3)
+print '%-30s %16.3f %16.4f' % ('number bar repaint', formerPaint * 1e3, indexPaint * 1e3)
+print
+
+edits = [('type a character', lambda i: (i, 1, [lines[i] + 'x'])),
+         ('insert a line', lambda i: (i, 1, [lines[i], '    x = 1'])),
+         ('insert a cell', lambda i: (i, 1, [lines[i], '## new cell'])),
+         ('delete a line', lambda i: (i, 2, [lines[i]]))]
+print '%-30s %16s %16s' % ('edit', 'update (ms)', 'rebuild (ms)')
+for label, edit in edits:
+    t0 = time.time()
+    for i in moves:
+        index.update(*edit(i))
+    updateTime = (time.time() - t0) / len(moves)
+    print '%-30s %16.4f %16.3f' % (label, updateTime * 1e3, resetTime * 1e3)
+
+edited = list(lines)
+check = CodeBlockIndex(edited)
+for i in moves:
+    firstLine, nbrRemovedLines, newLines = random.choice(edits)[1](min(i, len(edited) - 2))
+    edited[firstLine:firstLine + nbrRemovedLines] = newLines
+    check.update(firstLine, nbrRemovedLines, newLines)
+assert check.cellStarts() == CodeBlockIndex(edited).cellStarts()
+rebuilt = CodeBlockIndex(edited)
+assert [check.indentation(i) for i in range(len(edited))] == [rebuilt.indentation(i) for i in range(len(edited))]
@@ -0,0 +1,54 @@
+###############################################################
+## BENCHMARK OF THE ATTRIBUTE ACCESS ON THE BUNDLED INSTRUMENTS ##
+###############################################################
+
+# Instrument formerly overrode __getattribute__ in Python to wrap initialize at each lookup, so that every attribute
+# access of every instrument went through an extra Python frame. initialize is now wrapped once at class creation
+# by the InstrumentType metaclass.
+# For each driver, the per-access time is given for the current class and for a subclass restoring the former
+# __getattribute__ override, on a simulated VISA resource. The drivers that cannot be loaded in the current environment
+# (missing optional module) are skipped.
+import imp
+import time
+from application.lib.visa_simulation import *
+
+instrumentsDir = 'lab/instruments/'
+drivers = [('yokogawa', 'dc_sources/yokogawa.py'), ('bilt', 'dc_sources/bilt.py'), ('sr830', 'lockins/sr830.py'),
+           ('fsp', 'spectrum_analyzers/fsp.py'), ('vna-keysight', 'spectrum_analyzers/vna-keysight.py'),
+           ('awgv2', 'awgs_afgs/awgv2.py'), ('lecroy', 'digitizers_scopes/lecroy_waverunner_scope.py')]
+
+
+def formerGetattribute(self, attributeName):
+    attr = object.__getattribute__(self, attributeName)
+    if attributeName == 'initialize':
+        def initialize2(*args, **kwargs):
+            self.initialized = False
+            result = attr(*args, **kwargs)
+            self.loadInfo.update({'args': args, 'kwargs': kwargs})
+            self.initialized = True
+            return result
+        return initialize2
+    else:
+        return attr
+
+
+def perAccess(instrument, repeat=100000):
+    t0 = time.time()
+    for i in xrange(repeat):
+        instrument._params
+        instrument.debugPrint
+        instrument.name()
+    return (time.time() - t0) / (3 * repeat)
+
+print '%-15s %14s %14s %8s' % ('driver', 'former (ns)', 'current (ns)', 'ratio')
+for name, path in drivers:
+    try:
+        module = imp.load_source(name.replace('-', '_'), instrumentsDir + path)
+    except ImportError as error:
+        print '%-15s skipped (%s)' % (name, error)
+        continue
+    Former = type('Former', (module.Instr,), {'__getattribute__': formerGetattribute})
+    current = module.Instr(name=name, visaAddress='SIM::' + name)
+    former = Former(name=name, visaAddress='SIM::' + name)
+    tFormer, tCurrent = perAccess(former), perAccess(current)
+    print '%-15s %14.1f %14.1f %8.2f' % (name, tFormer * 1e9, tCurrent * 1e9, tFormer / tCurrent)
@@ -0,0 +1,89 @@
+####################################################
+## BENCHMARK OF THE IQ MIXER CALIBRATION OPTIMIZER ##
+####################################################
+
+# A simulated mixer has a known leakage landscape: at each point of a calibration map (LO, IF), the leakage power is
+#   P = 10 log10(|M (x - xOpt)|^2 + floor) + noise     (dBm)
+# where x are the two calibration parameters (absC, argC_rad), xOpt and the mixing matrix M drift smoothly over the
+# map, floor is the noise floor of the spectrum analyzer (-90 dBm) and noise a 0.1 dB gaussian noise.
+# A map of 5 LO x 11 IF frequencies is calibrated:
+#  - as iqmixer.Instr.calibrateSideband() with method "scipy.optimize.fmin" (Powell from [0, 0] at each point);
+#  - with a CalibrationSweep (quadratic model, warm start from the previous point).
+# The number of evaluations (each one being a AWG load and spectrum analyzer measurement of about 1 s on the real
+# setup), the mean error on the parameters and the mean residual leakage above the floor are given.
+# The sweep is then interrupted after 20 points and resumed from its checkpoints.
+import numpy
+import scipy.optimize
+
+from application.lib.iq_calibration_optimizer import *
+
+
+class SimulatedMixer(object):
+    """
+    A mixer whose sideband leakage at (LO, IF) is known (see header).
+    """
+
+    def __init__(self, floor=-90., noise=0.1, seed=0):
+        self.floor = floor
+        self.noise = noise
+        self.random = numpy.random.RandomState(seed)
+        self.evaluations = 0
+
+    def optimum(self, point):
+        LO, IF = point
+        return numpy.array([0.05 + 0.03 * IF + 0.01 * (LO - 6.), 0.2 - 0.15 * IF + 0.05 * (LO - 6.)])
+
+    def matrix(self, point):
+        LO, IF = point
+        return numpy.array([[1. + 0.1 * IF, 0.2], [0., 0.6 + 0.05 * (LO - 6.)]])
+
+    def power(self, x, point):
+        self.evaluations += 1
+        d = self.matrix(point).dot(numpy.asarray(x) - self.optimum(point))
+        return 10 * numpy.log10(d.dot(d) * 1e-3 + 10 ** (self.floor / 10.)) + self.noise * self.random.randn()
+
+    def residual(self, x, point):
+        d = self.matrix(point).dot(numpy.asarray(x) - self.optimum(point))
+        return 10 * numpy.log10(1 + d.dot(d) * 1e-3 / 10 ** (self.floor / 10.))
+
+points = [(LO, IF) for LO in numpy.linspace(5., 7., 5) for IF in numpy.linspace(-0.5, 0.5, 11)]
+
+
+def report(name, mixer, optima):
+    errors = [numpy.sqrt(((x - mixer.optimum(point)) ** 2).sum()) for point, x in zip(points, optima)]
+    residuals = [mixer.residual(x, point) for point, x in zip(points, optima)]
+    print '%-30s %12i %14.2f %12.5f %14.3f' % (name, mixer.evaluations, mixer.evaluations / float(len(points)),
+                                               numpy.mean(errors), numpy.mean(residuals))
+
+print '%-30s %12s %14s %12s %14s' % ('method', 'evaluations', 'per point', 'error', 'residual dB')
+
+mixer = SimulatedMixer()
+optima = []
+for point in points:
+    direc = numpy.eye(2, dtype=float) * 0.1
+    result = scipy.optimize.fmin_powell(mixer.power, [0, 0], args=(point,), direc=direc, full_output=1, xtol=0.001,
+                                        ftol=1e-2, maxiter=50, maxfun=50, disp=False)
+    optima.append(result[0])
+report('Powell per point', mixer, optima)
+
+mixer = SimulatedMixer()
+sweep = CalibrationSweep(mixer.power, [0, 0], [0.1, 0.1], xtol=0.0005)
+report('quadratic sweep', mixer, [x for point, x, value, evaluations in sweep.run(points)])
+
+mixer = SimulatedMixer()
+checkpoints = {}
+
+
+def store(point, x, value, evaluations):
+    checkpoints[point] = x
+    if len(checkpoints) == 20:
+        raise KeyboardInterrupt
+
+sweep = CalibrationSweep(mixer.power, [0, 0], [0.1, 0.1], xtol=0.0005, done=checkpoints.get, store=store)
+try:
+    sweep.run(points)
+except KeyboardInterrupt:
+    print 'interrupted after %i points' % len(checkpoints)
+results = sweep.run(points)
+print 'resumed: %i points skipped' % len([1 for result in results if result[2] is None])
+report('quadratic sweep, resumed', mixer, [x for point, x, value, evaluations in results])
@@ -0,0 +1,74 @@
+#################################################
+## BENCHMARK OF THE IQ MIXER CALIBRATION TABLE ##
+#################################################
+
+# Offset and sideband calibration cubes are built for 11 LO frequencies and 21 IF frequencies per LO, as written by
+# iqmixer.Instr.calibrateIQOffset() and calibrateSideband().
+# The time per lookup of the offsets and of the (c, phi) corrections at an (LO, IF) pair is given for:
+#  - the former lookup of iqmixer.Instr.sidebandCorrection() (search in the child cube of the LO and scipy interp1d
+#    rebuilt at each call) and the former interp1d offset interpolation functions;
+#  - an IQCalibrationTable, compiled once, queried pair by pair and for all the pairs at once.
+# The compilation time of the table and the largest difference between the two lookups are also given.
+import time
+import numpy
+import scipy.interpolate
+
+from application.lib.datacube import Datacube
+from application.lib.iq_calibration_table import IQCalibrationTable
+
+LOs = numpy.round(numpy.linspace(5., 7., 11), 3)
+IFs = numpy.round(numpy.linspace(-0.5, 0.5, 21), 3)
+offsetCube = Datacube('mixer_offsetCal')
+sidebandCube = Datacube('mixer_SBCal')
+for LO in LOs:
+    offsetCube.set(LO_GHz=LO, lowI=0.01 * numpy.sin(LO), lowQ=0.02 * numpy.cos(LO), commit=True)
+    sidebandCube.set(LO_GHz=LO, commit=True)
+    child = Datacube('LO_GHz=%g' % LO)
+    sidebandCube.addChild(child, LO_GHz=LO)
+    for IF in IFs:
+        child.set(LO_GHz=LO, IF_GHz=IF, absC=0.05 + 0.02 * IF * LO, argC_rad=0.3 - 0.1 * IF, commit=True)
+
+
+def formerSidebandCorrection(LO, IF):
+    calibrationData = sidebandCube.children(LO_GHz=LO)[-1]
+    rows = calibrationData.search(IF_GHz=IF)
+    if rows != []:
+        return calibrationData.column("absC")[rows[-1]], calibrationData.column("argC_rad")[rows[-1]]
+    calibrationData.sortBy('IF_GHz')
+    IFList = calibrationData.column("IF_GHz")
+    c = scipy.interpolate.interp1d(IFList, calibrationData.column("absC"))(IF)
+    phi = scipy.interpolate.interp1d(IFList, calibrationData.column("argC_rad"))(IF)
+    return c, phi
+
+iOffsetInterpolation = scipy.interpolate.interp1d(offsetCube.column('LO_GHz'), offsetCube.column('lowI'))
+qOffsetInterpolation = scipy.interpolate.interp1d(offsetCube.column('LO_GHz'), offsetCube.column('lowQ'))
+
+random = numpy.random.RandomState(0)
+nbrPairs = 2000
+pairLOs = LOs[random.randint(0, len(LOs), nbrPairs)]
+pairIFs = numpy.round(random.uniform(-0.5, 0.5, nbrPairs), 4)
+
+t0 = time.time()
+former = numpy.array([formerSidebandCorrection(LO, IF) + (iOffsetInterpolation(LO), qOffsetInterpolation(LO))
+                      for LO, IF in zip(pairLOs, pairIFs)], dtype=float)
+formerTime = time.time() - t0
+
+t0 = time.time()
+table = IQCalibrationTable(offsetCube, sidebandCube)
+compileTime = time.time() - t0
+
+t0 = time.time()
+single = numpy.array([table.sideband(LO, IF) + table.offsets(LO) for LO, IF in zip(pairLOs, pairIFs)])
+singleTime = time.time() - t0
+
+t0 = time.time()
+corrections = table.corrections(pairLOs, pairIFs)
+batchTime = time.time() - t0
+batch = numpy.array([corrections['c'], corrections['phi'], corrections['i0'], corrections['q0']]).T
+
+print 'table compiled in %.2f ms' % (compileTime * 1e3)
+print '%-34s %14s' % ('lookup', 'us per pair')
+print '%-34s %14.2f' % ('former search and interp1d', formerTime / nbrPairs * 1e6)
+print '%-34s %14.2f' % ('table, pair by pair', singleTime / nbrPairs * 1e6)
+print '%-34s %14.3f' % ('table, %i pairs at once' % nbrPairs, batchTime / nbrPairs * 1e6)
+print 'largest difference with the former lookup: %g' % max(abs(single - former).max(), abs(batch - former).max())
@@ -0,0 +1,67 @@
+###################################################
+## BENCHMARK OF THE IQ MIXTURE DISCRIMINATION ##
+###################################################
+
+# Synthetic bimodal IQ clouds are generated for the points of an amplitude sweep of a bifurcation readout, the weight
+# of the upper state going from 0.05 to 0.95 while the centers drift slowly, for 40 points of 4000 samples and for
+# 200 points of 500 samples.
+# The time, total number of expectation-maximization iterations and mean fidelity are given for:
+#  - the former per-point fit with sklearn mixture.GMM (as jba_sb.multiGaussianClusters), if sklearn is importable;
+#  - per-point fits with iq_discrimination.fitDistribution, started from the principal split of each point;
+#  - the same per-point fits, each one warm-started from the previous point (as jba_sb._findAmplitude);
+#  - a single batched iq_discrimination.fitSweep of all the points (as jba_sb.discriminateSweep).
+import time
+import numpy
+
+from application.lib.iq_discrimination import *
+
+
+def sweep(nbrPoints, nbrSamples):
+    random = numpy.random.RandomState(0)
+    distributions = []
+    for i, w in enumerate(numpy.linspace(0.05, 0.95, nbrPoints)):
+        drift = 0.08 * i / nbrPoints
+        n2 = random.binomial(nbrSamples, w)
+        c1, c2 = numpy.array([0.1 + drift, 0.2]), numpy.array([0.5 + drift, 0.45 - drift])
+        s1 = random.multivariate_normal(c1, [[0.006, 0.001], [0.001, 0.004]], nbrSamples - n2)
+        s2 = random.multivariate_normal(c2, [[0.005, -0.001], [-0.001, 0.006]], n2)
+        distributions.append(numpy.concatenate([s1, s2]))
+    return distributions
+
+for nbrPoints, nbrSamples in [(40, 4000), (200, 500)]:
+    distributions = sweep(nbrPoints, nbrSamples)
+    print '\n%i points of %i samples' % (nbrPoints, nbrSamples)
+    print '%-28s %10s %12s %10s' % ('method', 'time s', 'iterations', 'fidelity')
+
+    try:
+        from sklearn import mixture
+        t0 = time.time()
+        for distribution in distributions:
+            gmm = mixture.GMM(n_components=2, covariance_type='full')
+            gmm.fit(distribution)
+        print '%-28s %10.3f %12s %10s' % ('sklearn GMM per point', time.time() - t0, '-', '-')
+    except ImportError:
+        print '%-28s %10s' % ('sklearn GMM per point', 'sklearn not available')
+
+    t0 = time.time()
+    fits = [fitDistribution(distribution) for distribution in distributions]
+    elapsed = time.time() - t0
+    print '%-28s %10.3f %12i %10.4f' % ('per point', elapsed, sum([fit.iterations[0] for fit in fits]),
+                                        numpy.mean([separatrices(fit)['fidelity'][0] for fit in fits]))
+
+    t0 = time.time()
+    fits, fit = [], None
+    for distribution in distributions:
+        fit = fitDistribution(distribution, init=fit)
+        fits.append(fit)
+    elapsed = time.time() - t0
+    print '%-28s %10.3f %12i %10.4f' % ('per point, warm-started', elapsed, sum([fit.iterations[0] for fit in fits]),
+                                        numpy.mean([separatrices(fit)['fidelity'][0] for fit in fits]))
+
+    t0 = time.time()
+    fit = fitSweep(distributions)
+    sweepSeparatrices = separatrices(fit)
+    elapsed = time.time() - t0
+    print '%-28s %10.3f %12i %10.4f' % ('batched sweep', elapsed, fit.iterations.sum(),
+                                        sweepSeparatrices['fidelity'].mean())
+    print 'separatrix line:', separatrixLine(sweepSeparatrices, 0.1, 0.9)
@@ -0,0 +1,67 @@
+#####################################################################
+## BENCHMARK OF THE PERSISTENT REGISTER AGAINST A SHELVE REGISTER ##
+#####################################################################
+
+# Compares the write and read throughputs of the sqlite (WAL) register instrument
+# with those of the shelve register it replaces (one sync per write).
+import os
+import imp
+import time
+import shelve
+import tempfile
+
+register = imp.load_source('register', os.path.join(os.getcwd(), 'lab', 'instruments', 'composite', 'register.py'))
+
+n = 2000
+directory = tempfile.mkdtemp()
+
+
+def timeIt(function, *args):
+    t0 = time.time()
+    function(*args)
+    return time.time() - t0
+
+## shelve register with one sync per write, and full copy to read a key (as register.parameters()[key])
+shelf = shelve.open(os.path.join(directory, 'shelveRegister'))
+
+
+def shelveWrites():
+    for i in range(n):
+        shelf['key%i' % i] = {'value': i, 'name': 'parameter %i' % i}
+        shelf.sync()
+
+
+def shelveReads():
+    for i in range(0, n, 10):
+        dict(shelf)['key%i' % i]
+
+shelveWrite = timeIt(shelveWrites)
+shelveRead = timeIt(shelveReads)
+shelf.close()
+
+## sqlite register with one commit per write, with a single transaction, and key-level reads
+reg = register.Instr(name='sqliteRegister')
+reg.initialize(os.path.join(directory, 'sqliteRegister'))
+
+
+def registerWrites():
+    for i in range(n):
+        reg['key%i' % i] = {'value': i, 'name': 'parameter %i' % i}
+
+
+def registerTransaction():
+    with reg.transaction():
+        registerWrites()
+
+
+def registerReads():
+    for i in range(0, n, 10):
+        reg['key%i' % i]
+
+registerWrite = timeIt(registerWrites)
+registerBatch = timeIt(registerTransaction)
+registerRead = timeIt(registerReads)
+
+## results
+print 'writes/s: shelve %.0f, register %.0f, register in transaction %.0f' % (n / shelveWrite, n / registerWrite, n / registerBatch)
+print 'reads/s:  shelve (full copy) %.0f, register %.0f' % (n / 10 / shelveRead, n / 10 / registerRead)
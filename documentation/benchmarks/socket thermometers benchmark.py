@@ -0,0 +1,126 @@
+################################################
+## BENCHMARK OF THE SOCKET THERMOMETER QUERIES ##
+################################################
+
+# A local fake MMR3 server answers the variable requests '2;7;<index>\n' of mmr3_module with a header line whose last
+# field is the length of the data, followed by the data '<...>;<index>;<value>;...'. It keeps the connections open and
+# answers pipelined requests; with closeAfterReply it closes each connection after one reply, as a server without
+# persistent connections would. The server disables Nagle's algorithm (TCP_NODELAY): a server delaying its small
+# replies would hold the pipelined replies of temperatures() until the client acknowledges the first one.
+# The number of temperatures read per second is given for:
+#  - the former getVar (new connection per variable, reply read with recv(1) per byte);
+#  - mmr3_module.getVar on the persistent connection of application.lib.socket_pool;
+#  - mmr3_module.temperatures (the 3 thermometers in a single request);
+#  - the same two against the server closing each connection after one reply (reconnection path).
+# Then a fake temperature server pushing a value on each new connection (as read by temperature_room112 with
+# readOnConnect) keeps the connection open after the value line: the time per reading is given with the value returned
+# as soon as its line is terminated, and with the former read until the server closes the connection or the timeout.
+import sys
+import time
+import socket
+import threading
+import SocketServer
+
+sys.path.append('lab/instruments/thermometers')
+import mmr3_module
+from application.lib.socket_pool import socketPool, readOnConnect
+
+
+class FakeMMR3Handler(SocketServer.StreamRequestHandler):
+
+    def handle(self):
+        self.connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            varIndex = int(line.strip().split(';')[2])
+            data = '2;%i;%.6f;K;0' % (varIndex, 0.01 * varIndex + 0.001)
+            self.wfile.write('2;7;%i;%i\r\n%s' % (varIndex, len(data), data))
+            self.wfile.flush()
+            if self.server.closeAfterReply:
+                return
+
+
+class FakeMMR3Server(SocketServer.ThreadingMixIn, SocketServer.TCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, closeAfterReply=False):
+        SocketServer.TCPServer.__init__(self, ('127.0.0.1', 0), FakeMMR3Handler)
+        self.closeAfterReply = closeAfterReply
+        thread = threading.Thread(target=self.serve_forever)
+        thread.daemon = True
+        thread.start()
+
+
+def formerGetVar(address, port, varIndex):
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.settimeout(2.0)
+    sock.connect((address, port))
+    sock.send('2;7;' + str(varIndex) + '\n')
+    string = ''
+    while True:
+        char = sock.recv(1)
+        if char == '\n':
+            break
+        elif char == ';':
+            string = ''
+        elif char != '\r':
+            string += char
+    value = float(sock.recv(int(string)).split(';')[2])
+    sock.close()
+    return value
+
+
+def rate(function, duration=1.):
+    count, t0 = 0, time.time()
+    while time.time() - t0 < duration:
+        count += function()
+    return count / (time.time() - t0)
+
+print '%-40s %16s' % ('method', 'temperatures/s')
+for closeAfterReply in [False, True]:
+    server = FakeMMR3Server(closeAfterReply)
+    port = server.server_address[1]
+    mmr3 = mmr3_module.Instr('mmr3')
+    mmr3.initialize(address='127.0.0.1', port=port, thermoVarIndices=[5, 16, 22])
+    suffix = ', closing server' if closeAfterReply else ''
+    assert mmr3.temperatures() == [formerGetVar('127.0.0.1', port, i) for i in [5, 16, 22]]
+    if not closeAfterReply:
+        print '%-40s %16.0f' % ('former getVar', rate(lambda: formerGetVar('127.0.0.1', port, 5) and 1))
+    print '%-40s %16.0f' % ('getVar' + suffix, rate(lambda: mmr3.temperature(1) and 1))
+    print '%-40s %16.0f' % ('temperatures' + suffix, rate(lambda: len(mmr3.temperatures())))
+    server.shutdown()
+    socketPool.close()
+print socketPool.statistics()
+
+
+class FakePushHandler(SocketServer.BaseRequestHandler):
+
+    def handle(self):
+        self.request.sendall(self.server.reply)
+        time.sleep(self.server.holdTime)
+
+
+class FakePushServer(SocketServer.ThreadingMixIn, SocketServer.TCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, reply, holdTime):
+        SocketServer.TCPServer.__init__(self, ('127.0.0.1', 0), FakePushHandler)
+        self.reply = reply
+        self.holdTime = holdTime
+        thread = threading.Thread(target=self.serve_forever)
+        thread.daemon = True
+        thread.start()
+
+print
+print '%-40s %16s' % ('readOnConnect', 'ms/reading')
+for label, reply, terminator in [('terminated line', '12.345\r\n', '\n'), ('former read until timeout', '12.345\r\n', None),
+                                 ('no terminator (timeout)', '12.345', '\n')]:
+    server = FakePushServer(reply, holdTime=1.)
+    t0 = time.time()
+    assert float(readOnConnect('127.0.0.1', server.server_address[1], timeout=0.5, terminator=terminator)) == 12.345
+    print '%-40s %16.1f' % (label, (time.time() - t0) * 1e3)
+    server.shutdown()
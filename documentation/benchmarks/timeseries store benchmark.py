@@ -0,0 +1,73 @@
+##############################################
+## BENCHMARK OF THE MONITORING TIME SERIES ##
+##############################################
+
+# Three days of readings every 10 s (25920 readings of a slowly drifting fridge temperature) are recorded:
+#  - in the former lists of the temperature panel (append then pop(0) beyond 200 readings), which keep only the last
+#    ~33 minutes;
+#  - in an application.lib.timeseries_store.TimeSeriesStore saving its segments in a temporary directory.
+# The table gives the cost per reading, the number of readings covered, and the bytes held in memory. Then the time
+# of the range queries of the last hour, day and 3 days at maxPoints=500 (with the resolution used and the number of
+# points returned), and the time to restore a store from its segments, as after a restart of the panel.
+import sys
+import time
+import shutil
+import tempfile
+
+import numpy
+
+from application.lib.timeseries_store import TimeSeriesStore
+
+period = 10.
+nbrReadings = 3 * 86400 / int(period)
+end = time.time()
+times = end - period * numpy.arange(nbrReadings)[::-1]
+values = 0.012 + 0.002 * numpy.sin(times / 7200.) + 1e-4 * numpy.random.randn(nbrReadings)
+
+directory = tempfile.mkdtemp()
+try:
+    temperatures, readingTimes = [], []
+    t0 = time.time()
+    for t, value in zip(times, values):
+        temperatures.append(value * 1000)
+        readingTimes.append(t)
+        while len(temperatures) > 200:
+            temperatures.pop(0)
+            readingTimes.pop(0)
+    listCost = (time.time() - t0) / nbrReadings
+    listBytes = sum(sys.getsizeof(l) + sum(sys.getsizeof(x) for x in l) for l in [temperatures, readingTimes])
+
+    store = TimeSeriesStore('fridge', directory)
+    t0 = time.time()
+    for t, value in zip(times, values):
+        store.append(value, t)
+    storeCost = (time.time() - t0) / nbrReadings
+    storeBytes = sum(level.ring.records.nbytes for level in store.levels)
+
+    print '%-20s %16s %16s %16s' % ('method', 'us/reading', 'history (h)', 'memory (kB)')
+    print '%-20s %16.1f %16.1f %16.0f' % ('former lists', listCost * 1e6, (readingTimes[-1] - readingTimes[0]) / 3600.,
+                                          listBytes / 1024.)
+    stored = store.records(level='hour')[1]
+    print '%-20s %16.1f %16.1f %16.0f' % ('store', storeCost * 1e6, (times[-1] - stored['time'][0]) / 3600.,
+                                          storeBytes / 1024.)
+    print
+
+    print '%-20s %16s %16s %16s' % ('range', 'ms/query', 'resolution', 'points')
+    for label, duration in [('last hour', 3600), ('last day', 86400), ('last 3 days', 3 * 86400)]:
+        repetitions = 100
+        t0 = time.time()
+        for i in range(repetitions):
+            levelName, records = store.records(end - duration, maxPoints=500)
+        print '%-20s %16.3f %16s %16i' % (label, (time.time() - t0) / repetitions * 1e3, levelName, len(records))
+    print
+
+    store.close()
+    t0 = time.time()
+    restored = TimeSeriesStore('fridge', directory)
+    restoreTime = time.time() - t0
+    assert restored.last() == store.last()
+    print 'restore from segments: %.1f ms (%s records in the rings)' % (
+        restoreTime * 1e3, '/'.join(str(len(level.ring)) for level in restored.levels))
+    restored.close()
+finally:
+    shutil.rmtree(directory)
@@ -0,0 +1,118 @@
+#########################################################
+## BENCHMARK OF THE VISA DRIVERS ON SIMULATED RESOURCES ##
+#########################################################
+
+# Times the common operations of the VISA drivers (trace fetch, waveform upload, ramp, state save) without hardware,
+# each instrument being replaced by a simulated resource of application.lib.visa_simulation with a latency model
+# typical of its bus (LAN or GPIB).
+# For each operation, the mean time per call is given with the part of it spent in the simulated I/O,
+# the difference being the time spent in the driver itself.
+import imp
+import time
+from application.lib.visa_simulation import *
+
+instrumentsDir = 'lab/instruments/'
+lan = dict(latency=1e-3, bandwidth=10e6)      # VXI-11 over ethernet
+gpib = dict(latency=3e-3, bandwidth=500e3)    # GPIB
+
+
+def load(name, path, address, responder, bus):
+    latency = LatencyModel(**bus)
+    simulate(address, responder, latency)
+    module = imp.load_source(name.replace('-', '_'), instrumentsDir + path)
+    instrument = module.Instr(name=name, visaAddress=address)
+    instrument.initialize(visaAddress=address)
+    return instrument, latency
+
+
+def timeIt(label, latency, function, repeat=10):
+    function()                                  # warm-up
+    elapsed0 = latency.elapsed
+    t0 = time.time()
+    for i in range(repeat):
+        function()
+    total = (time.time() - t0) / repeat
+    io = (latency.elapsed - elapsed0) / repeat
+    print '%-40s %9.2f ms per call (I/O %8.2f ms, driver %7.2f ms)' % (label, total * 1e3, io * 1e3, (total - io) * 1e3)
+
+## Keysight VNA: 1601-point trace fetch and setup save
+vna, latency = load('vna-keysight', 'spectrum_analyzers/vna-keysight.py', 'SIM::VNA', keysightVNAResponder(points=1601), lan)
+timeIt('vna-keysight getTrace (1601 points)', latency, lambda: vna.getTrace(channel=1, trace=1))
+timeIt('vna-keysight getSetup', latency, vna.getSetup)
+
+## R&S FSP: trace fetch (REAL,32 binary block) and setup save
+fsp, latency = load('fsp', 'spectrum_analyzers/fsp.py', 'SIM::FSP', fspResponder(points=625), lan)
+timeIt('fsp getTrace (625 points)', latency, fsp.getTrace)
+timeIt('fsp getTrace(waitFullSweep=True)', latency, lambda: fsp.getTrace(waitFullSweep=True))
+timeIt('fsp getSetup', latency, fsp.getSetup)
+
+## Tektronix AWG: 20000-point waveform upload and parameters save
+import numpy
+awg, latency = load('awgv2', 'awgs_afgs/awgv2.py', 'SIM::AWG', awgResponder(), lan)
+waveform = numpy.sin(numpy.arange(20000) * 0.01)
+timeIt('awgv2 loadRealWaveform (20000 points)', latency, lambda: awg.loadRealWaveform(waveform, channel=1))
+timeIt('awgv2 parameters', latency, awg.parameters, repeat=3)
+
+## Lecroy scope: 10002-point waveform fetch
+scope, latency = load('lecroy', 'digitizers_scopes/lecroy_waverunner_scope.py', 'SIM::SCOPE', lecroyResponder(), lan)
+timeIt('lecroy getWaveforms DAT1 (10002 points)', latency, lambda: scope.getWaveforms(trace='C1', block='DAT1'))
+
+## Yokogawa source (GPIB): ramp and state save
+yoko, latency = load('yokogawa', 'dc_sources/yokogawa.py', 'SIM::YOKO', yokogawaResponder(), gpib)
+timeIt('yokogawa setVoltage (no ramp)', latency, lambda: yoko.setVoltage(0.))
+timeIt('yokogawa setVoltage ramp 0->0.3V at 1V/s', latency,
+       lambda: (yoko.setVoltage(0.3, slewrate=1.), yoko.setVoltage(0.)), repeat=2)
+timeIt('yokogawa parameters', latency, yoko.parameters)
+
+## SR830 lock-in (GPIB): single point measurements
+lockin, latency = load('sr830', 'lockins/sr830.py', 'SIM::SR830', sr830Responder(), gpib)
+timeIt('sr830 measureXY', latency, lockin.measureXY, repeat=100)
+timeIt('sr830 setTimeConstant', latency, lambda: lockin.setTimeConstant(0.1), repeat=100)
+
+## Sweeps of 50 ms (VNA) and 80 ms (FSP): sequential waits versus overlapped operation complete futures
+# (the total time per call is the figure of merit here, the I/O column only counts the sr830 resource)
+from application.lib.visa_completion import waitAll
+simulatedResponder('SIM::VNA').operationTime = 0.05
+simulatedResponder('SIM::FSP').operationTime = 0.08
+timeIt('vna + fsp sequential sweeps', latency, lambda: (vna.waitFullSweep(), fsp.getTrace(waitFullSweep=True)), repeat=5)
+timeIt('vna + fsp overlapped sweeps', latency, lambda: waitAll([vna.startFullSweep(), fsp.startSweep()]), repeat=5)
+
+## SR830 lock-in (GPIB): 512 points at 512 Hz, SNAP? per point versus the data buffer
+timeIt('sr830 512 x measureXY', latency, lambda: [lockin.measureXY() for i in range(512)], repeat=1)
+timeIt('sr830 acquireBuffered 512 points', latency, lambda: lockin.acquireBuffered(points=512, sampleRate=512), repeat=1)
+
+## Batched getters: round trips saved by joining the queries of getSetup and parameters in single messages
+# (the queries asked by a getter are learned at its first call and prefetched at the next ones, see VisaInstrument.batch)
+for instrument, getter in [(vna, vna.getSetup), (fsp, fsp.getSetup), (awg, awg.parameters)]:
+    instrument._batchStatistics = None
+    getter()
+    statistics = instrument.batchStatistics()
+    print '%-40s %4i commands in %3i messages (%i round trips saved)' % (instrument.name() + ' ' + getter.__name__,
+                                                                          statistics['commands'], statistics['messages'],
+                                                                          statistics['commands'] - statistics['messages'])
+
+## Batch consistency: a write is sent with the next query in a single message joined with ';:' (the simulated resources
+# reject a header relative to a previous multi-level one), and drops the prefetched answers of the settings it
+# invalidates (FREQ:CENT changes FREQ:STAR, see the cacheInvalidations of fsp)
+from application.lib.instrum_classes import VisaInstrument
+
+
+def recordMessages(instrument):
+    messages = []
+    ask = instrument._ask
+    instrument._ask = lambda message: (messages.append(message), ask(message))[1]
+    return messages
+
+simulate('SIM::BATCH', ScpiResponder(settings={'FREQ': 1}))
+generic = VisaInstrument(name='batch', visaAddress='SIM::BATCH')
+messages = recordMessages(generic)
+with generic.batch():
+    generic.write('FREQ 5')
+    assert generic.ask('FREQ?') == '5'
+assert messages == ['FREQ 5;:FREQ?'] and generic.batchStatistics() == {'commands': 2, 'messages': 1}
+messages = recordMessages(fsp)
+with fsp.batch(queries=['FREQ:STAR?']):
+    fsp.write('FREQ:CENT 1.5e9')
+    fsp.ask('FREQ:STAR?')
+assert messages[-1] == 'FREQ:CENT 1.5e9;:FREQ:STAR?'
+print 'batch consistency checks passed'
@@ -0,0 +1,89 @@
+###################################################
+## BENCHMARK OF THE VNA TRACE POST-PROCESSING ##
+###################################################
+
+# Traces of 10^4 and 10^5 points (frequencies, magnitudes and wrapped phases with an electrical delay) are
+# post-processed as by the getFreqMagPhase() of the VNA drivers:
+#  - former processing: list-based unwind(), interleaved magnitude/phase split in a python loop (Anritsu), and one
+#    Datacube.createCol() per column (freq, mag, phase, magCor, phaseCor);
+#  - vectorized processing: application.lib.vna_traces and a single Datacube.createCols() per step.
+# The times of each step and the largest difference between the two unwrapped phases are given.
+import time
+import numpy
+
+from application.lib.datacube import Datacube
+from application.lib import vna_traces
+
+
+def formerUnwind(li, period=360):
+    # the former VNA drivers' unwind(), on lists
+
+    def derivList(li):
+        return list(numpy.concatenate((numpy.array(li)[1:], numpy.array(li)[:1])) - numpy.array(li))[:-1]
+
+    def listIntegrate(li):
+        for i in range(len(li))[1:]:
+            li[i] += li[i - 1]
+        return li
+
+    def jump(x):
+        dif = [abs(x - period), abs(x), abs(x + period)]
+        return dif.index(min(dif)) - 1
+
+    jumps = listIntegrate(map(jump, derivList(li)))
+    jumps.insert(0, 0.)
+    return list(numpy.array(jumps) * period + numpy.array(li))
+
+
+def formerSplit(data):
+    mag, phase = [], []
+    for i in range(0, len(data)):
+        if i % 2 == 0:
+            mag.append(data[i])
+        else:
+            phase.append(data[i])
+    return mag, phase
+
+print '%-10s %-26s %12s %12s %10s' % ('points', 'step', 'former ms', 'numpy ms', 'speedup')
+for nbrPoints in [10000, 100000]:
+    freq = numpy.linspace(4e9, 8e9, nbrPoints)
+    random = numpy.random.RandomState(0)
+    phase = (-360 * freq * 25e-9 + random.normal(0, 2, nbrPoints) + 180) % 360 - 180
+    mag = -20 + random.normal(0, 0.1, nbrPoints)
+    data = list(numpy.array([mag, phase]).T.ravel())
+    times = []
+
+    t0 = time.time()
+    formerMag, formerPhase = formerSplit(data)
+    t1 = time.time()
+    interleaved = numpy.array(data)
+    newMag, newPhase = interleaved[0::2], interleaved[1::2]
+    times.append(('interleaved split', t1 - t0, time.time() - t1))
+
+    t0 = time.time()
+    unwound = formerUnwind(list(phase))
+    t1 = time.time()
+    unwrapped = vna_traces.unwrapPhase(phase)
+    times.append(('unwind', t1 - t0, time.time() - t1))
+    difference = numpy.abs(numpy.array(unwound) - unwrapped).max()
+
+    corrected = numpy.array(unwound) - (-360 * 25e-9) * (freq - freq[0]) + 10.
+    corrected2, parameters = vna_traces.correctPhase(freq, phase, unwindPhase=True, electricalDelay=25e-9,
+                                                     phaseOffset=10.)
+
+    t0 = time.time()
+    cube = Datacube('spectrum')
+    for name, values in [('freq', freq), ('mag', mag), ('phase', phase), ('magCor', mag + 20.),
+                         ('phaseCor', corrected)]:
+        cube.createCol(name=name, values=values)
+    t1 = time.time()
+    cube2 = Datacube('spectrum')
+    cube2.createCols([('freq', freq), ('mag', mag), ('phase', phase)])
+    cube2.createCols([('magCor', mag + 20.)])
+    cube2.createCols([('phaseCor', corrected2)])
+    times.append(('datacube columns', t1 - t0, time.time() - t1))
+
+    for step, former, new in times:
+        print '%-10i %-26s %12.2f %12.2f %10.1f' % (nbrPoints, step, former * 1e3, new * 1e3, former / max(new, 1e-9))
+    print '%-10i largest unwrap difference: %g, corrected phase difference: %g' % (
+        nbrPoints, difference, numpy.abs(corrected - corrected2).max())
@@ -145,4 +145,24 @@ for x in myXLoop:
 ## now run this one line code to redefine tthe measure function
 a=2.
 
-## Finally re-run the for x in myXLoop block of code above to resume the loop at the next step.
\ No newline at end of file
+## Finally re-run the for x in myXLoop block of code above to resume the loop at the next step.
+###############################################################
+## Here is an example showing how to use sweep plans:       ##
+## 	the full trajectory of a loop as a numpy array.        ##
+###############################################################
+
+loopX=SmartLoop(0.,step=0.5,stop=10.0,name='X',toLoopManager=False)
+loopY=SmartLoop(0.,step=1.0,stop=5.0,name='Y',toLoopManager=False,parent=loopX)
+
+# values the loop will output up to its termination
+plan=loopX.sweepPlan()
+print len(plan), plan.values()
+
+# the plan is rebuilt automatically after any change of the loop parameters
+loopX.setStep(0.25)
+print loopX.sweepPlan().values()
+
+# points of the nested loops (one column per loop), the inner loop going back and forth
+nested=loopX.nestedSweepPlan(snake=True)
+print nested.shape(), nested.points()
+print nested.columns()['Y']
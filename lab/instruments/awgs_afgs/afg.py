@@ -7,6 +7,7 @@ import numpy
 import ctypes
 
 from application.lib.instrum_classes import *
+from application.lib.awg_encoding import encodeBlock
 
 
 class Instr(VisaInstrument):
@@ -86,8 +87,7 @@ class Instr(VisaInstrument):
 
     def writeWaveform(self, name, waveform):
         data = self._encodeWaveform(waveform)
-        self.write("DATA:DATA EMemory,#%d%d%s" %
-                   (len(str(len(waveform) * 2)), len(waveform) * 2, data))
+        self.write(encodeBlock("DATA:DATA EMemory,", data))
         self.write("DATA:COPY %s,EMemory" % name)
 
     def setWaveform(self, name):
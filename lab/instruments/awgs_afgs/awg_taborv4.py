@@ -1,7 +1,11 @@
 import time
 import numpy
-from pyvisa.vpp43 import set_attribute
+try:
+    from pyvisa.vpp43 import set_attribute
+except ImportError:
+    set_attribute = None     # pyvisa not installed: only simulated resources can be used
 from application.lib.instrum_classes import *
+from application.lib.awg_encoding import toInt14, encodeBlock
 
 """
 This module implements the basic controls of a Tabor AWG.
@@ -521,7 +525,7 @@ class Instr(VisaInstrument):
             print 'Preparing data...',
         t0 = time.time()
         try:
-            data = numpy.empty(buflen).astype('uint16')             # try to allocate space in memory
+            data = numpy.empty(buflen, dtype='uint16')              # try to allocate space in memory
         except MemoryError:
             if doPrint:
                 print "Not enough RAM => Using hard drive to store temporary files...",
@@ -529,14 +533,13 @@ class Instr(VisaInstrument):
             import os.path as path
             filename = path.join(mkdtemp(), 'taborDataString.dat')
             data = numpy.memmap(filename, dtype='uint16', mode='w+', shape=buflen)
-        conv_factor = 0.5 * ((1 << 14) - 1)
         # built the data array
-        if waveform2 is not None:                                   # convert and interleave if two waveforms
-            for i in xrange(16):
-                data[i::32] = ((waveform2[i::16] + 1) * conv_factor).astype('uint16')
-                data[i + 16::32] = ((waveform1[i::16] + 1) * conv_factor).astype('uint16')
+        if waveform2 is not None:                                   # convert and interleave by blocks of 16 points if two waveforms
+            blocks = data.reshape(-1, 2, 16)
+            blocks[:, 0, :] = toInt14(waveform2).astype('uint16').reshape(-1, 16)
+            blocks[:, 1, :] = toInt14(waveform1).astype('uint16').reshape(-1, 16)
         else:
-            data[:] = ((waveform1[:] + 1) * conv_factor).astype('uint16')  # otherwise just convert
+            data[:] = toInt14(waveform1).astype('uint16')           # otherwise just convert
         if markers is not None:                                     # marker construction
             # skip and step parameters for a single waveform. See doc page 4.65 for the 12 point shift
             skip, step = 8, 16
@@ -555,7 +558,7 @@ class Instr(VisaInstrument):
         if doPrint:
             print "Finished preparing data at time %f s..." % (time.time() - t0)
         # call the download function.
-        self._downloadWaveform(data.tostring(), channel=channel, mode=mode, doPrint=doPrint)
+        self._downloadWaveform(data, channel=channel, mode=mode, doPrint=doPrint)
 
     def _checkWaveforms(self, realWaveforms, markers=None):
         """
@@ -599,7 +602,7 @@ class Instr(VisaInstrument):
         Downloads a waveform or an interleaved pair of waveforms, possibly with additional markers, in the Tabor memory.
         See Tabor WXxx84C user manual(publication N 010614 Rev1.2 July 2015) pages 4.11 and 4.61 - 4.66
         - channel: the integer index of the channel
-        - data: a string(i.e. an array of bytes) encoding the waveform(s) and the marker(s) on 16 bits(2 bytes) per point;
+        - data: a string(i.e. an array of bytes) or a uint16 numpy array encoding the waveform(s) and the marker(s) on 16 bits(2 bytes) per point;
         - mode can be  'SINGle', 'DUPLicate', 'ZERoed', or 'COMBined' can be used(see page 4.63).
         The length of data should be a multiple of 16 points = 32 bytes in 'SINGle', 'DUPLicate', or 'ZERoed' modes,
         and a multiple of 32 points = 64 bytes in 'COMBined' mode.
@@ -607,11 +610,9 @@ class Instr(VisaInstrument):
         Syntax is TRAC: MOD < mode > ; : TRAC  # <header><binary_block> with no termination chars allowed after the binary block!
             Hence the writeNoTermination function in the code below
         """
-        size = len(data)
-        header = "#%d%d" % (len("%d" % len(data)), len(data))
         t0 = time.time()
         self.write("INST %s;:TRAC:MODE %s" % (channel, mode))
-        self.write("TRACe " + header + data)
+        self.write(encodeBlock("TRACe ", data))
         if doPrint:
             print "Data transfered in %f s." % (time.time() - t0)
             print "Please wait until the data has been processed by the awg...",
@@ -659,18 +660,9 @@ class Instr(VisaInstrument):
         '''
         self.write("INSTrument:SELect " + str(int(channel)))
         self.write("SEQ:DEL:ALL")  # delete all stored sequences
-        data = ""
-        for i in xrange(len(seg_nos)):
-            loop = struct.pack("<I", int(loops[i]))
-            seg_no = struct.pack("<H", int(seg_nos[i]))
-            jump_flag = struct.pack("<H", int(jump_flags[i]))
-            data += loop + seg_no + jump_flag
-            # prepare 64 bit integer
-            # data += struct.pack("<Q", loops[i] << 32 + seg_nos[i] << 16 + jump_flags[i] )
-            # temp = struct.pack("<I",int(value))# & ((1 << 32)-1))
-            # print struct.unpack('<L',temp)
-        header = "#%d%d" % (len("%d" % len(data)), len(data))
-        self.write("SEQuence " + header + data)
+        data = numpy.empty(len(seg_nos), dtype=[('loop', '<u4'), ('segment', '<u2'), ('jump', '<u2')])
+        data['loop'], data['segment'], data['jump'] = loops, seg_nos, jump_flags
+        self.write(encodeBlock("SEQuence ", data))
 
     def defineSequence(self, channel, seg_nos, loops, jump_flags):
         '''
@@ -721,19 +713,8 @@ class Instr(VisaInstrument):
         seg_list is a numpy array or list of integers specifying the length of the segments
         '''
         self.write("INSTrument:SELect " + str(int(channel)))
-        data = ""
-        for value in seg_list:
-            # separating the 32 bit number into two two-byte words
-            # part1 = struct.pack("<H",int(value) >> 16)
-            # part2 = struct.pack("<H",int(value) & ((1 << 16)-1))
-            # & ((1 << 32)-1))  #(value & ((1 << 32)-1)) ensures the 32 bit nature of the number
-            data += struct.pack("<L", int(value))
-        #  += part1
-        #  += part2
-            # temp = struct.pack("<I",int(value))# & ((1 << 32)-1))
-            # print struct.unpack('<L',temp)
-        header = "#%d%d" % (len("%d" % len(data)), len(data))
-        self.write("SEGMent " + header + data)
+        data = numpy.asarray(seg_list).astype('<u4')
+        self.write(encodeBlock("SEGMent ", data))
         # import sys
         # print "bytes of data"
         # print sys.getsizeof(data)
@@ -17,7 +17,7 @@ Modified DV Feb 2015.
 """
 
 from application.lib.instrum_classes import VisaInstrument
-#from application.lib.swig.tools import numerical
+from application.lib.awg_encoding import *
 
 
 class Waveform:
@@ -72,24 +72,25 @@ class Instr(VisaInstrument):
         """
         Returns all relevant AWG parameters.
         """
-        params = dict()
-        params["runMode"] = self.runMode()
-        params["repetitionRate"] = self.repetitionRate()
-        params["channels"] = []
-        params["clockSource"] = self.clockSource()
-        params["triggerInterval"] = self.triggerInterval()
-        for i in [1, 2, 3, 4]:
-            channelParams = dict()
-            channelParams["high"] = self.high(i)
-            channelParams["low"] = self.low(i)
-            channelParams["amplitude"] = self.amplitude(i)
-            channelParams["offset"] = self.offset(i)
-            channelParams["skew"] = self.skew(i)
-            channelParams["function"] = self.function(i)
-            channelParams["waveform"] = self.waveform(i)
-            channelParams["phase"] = self.phase(i)
-            channelParams["dac_resolution"] = self.DACResolution(i)
-            params["channels"].append(channelParams)
+        with self.batch('parameters'):
+            params = dict()
+            params["runMode"] = self.runMode()
+            params["repetitionRate"] = self.repetitionRate()
+            params["channels"] = []
+            params["clockSource"] = self.clockSource()
+            params["triggerInterval"] = self.triggerInterval()
+            for i in [1, 2, 3, 4]:
+                channelParams = dict()
+                channelParams["high"] = self.high(i)
+                channelParams["low"] = self.low(i)
+                channelParams["amplitude"] = self.amplitude(i)
+                channelParams["offset"] = self.offset(i)
+                channelParams["skew"] = self.skew(i)
+                channelParams["function"] = self.function(i)
+                channelParams["waveform"] = self.waveform(i)
+                channelParams["phase"] = self.phase(i)
+                channelParams["dac_resolution"] = self.DACResolution(i)
+                params["channels"].append(channelParams)
         return params
 
     def loadSetup(self, name):
@@ -313,50 +314,22 @@ class Instr(VisaInstrument):
     def writeIntData(self, values, markers, useC=False):
         """
         Writes integer data to a string.
+        (useC is kept for compatibility: the numpy encoding is always used)
         """
-        if useC:
-            valuesInt = numpy.zeros(len(values), dtype=numpy.ushort)
-            markersInt = numpy.zeros(len(markers), dtype=numpy.uint8)
-
-            valuesInt[:] = values[:]
-            markersInt[:] = markers[:]
-
-            buf = ctypes.create_string_buffer(len(valuesInt) * 2)
-            numerical.awg_pack_int_data(len(
-                valuesInt), valuesInt.ctypes.data, markersInt.ctypes.data, ctypes.addressof(buf))
-            return buf.raw
-        else:
-            output = ""
-            for i in range(0, len(values)):
-                marker = int(markers[i])
-                value = int(values[i])
-                output += struct.pack("<H", ((marker & 3)
-                                             << 14) + (value & (0xFFFF >> 2)))
-            return output
+        return encodeIntData(values, markers)
 
     def loadRealWaveform(self, realWaveform, channel=1, markers=None, waveformName='ch1'):
         """
         Loads a waveform and 2 marker waveforms into the AWG file.
         Input waveform 'realWaveform' should be encoded between -1 and 1 (and will be converted in the range 0, 2^14-1 = 16383)
         """
-        waveform = numpy.zeros(len(realWaveform))
-        waveform[:] = numpy.real(realWaveform)
-        if max(abs(waveform)) > 1:
+        waveform, clipped = clipWaveform(realWaveform)
+        if clipped:
             print self.name(), " warning: requested pulse not in range [-1,1] => waveform will be truncated."
-
-            def truncate(x):
-                if x > 1:
-                    return 1
-                elif x < -1:
-                    return -1
-                else:
-                    return x
-            waveform[:] = map(truncate, waveform)
         if markers is None:
             markers = numpy.zeros(len(waveform), dtype=numpy.int8)
             markers[:10000] = 3
-        data = self.writeIntData(
-            (waveform + 1.0) / 2.0 * ((1 << 14) - 1), markers)
+        data = self.writeIntData(toInt14(waveform), markers)
         self.createWaveform(waveformName, data, "INT")
         self.setWaveform(channel, waveformName)
         return len(data)
@@ -366,42 +339,20 @@ class Instr(VisaInstrument):
         Loads a waveform and 2 marker waveforms into the AWG file.
         """
 
-        waveform = numpy.zeros(len(realWaveform))
-        waveform[:] = numpy.real(realWaveform)
-
+        waveform = numpy.real(realWaveform)
         if markers is None:
             markers = numpy.zeros(len(waveform), dtype=numpy.int8)
             markers[:10000] = 3
-        data = self.writeIntData(
-            (waveform + 1.0) / 2.0 * ((1 << 14) - 1), markers)
+        data = self.writeIntData(toInt14(waveform), markers)
         self.createWaveform(waveformName, data, "INT")
         return len(data)
 
     def writeRealData(self, values, markers, useC=False):
         """
-        Writes real-valued data to a string.
+        Writes real-valued data to a string (float32 value + marker byte per point).
+        (useC is kept for compatibility: the numpy encoding is always used)
         """
-        output = ""
-        # Fast code that calls a C++ function to encode the data...
-
-        valuesFloat = numpy.zeros(len(values), dtype=numpy.float32)
-        markersInt = numpy.zeros(len(markers), dtype=numpy.uint8)
-
-        valuesFloat[:] = values[:]
-        markersInt[:] = markers[:] << 6
-
-        buf = ctypes.create_string_buffer(len(valuesFloat) * 5)
-        if useC:
-            numerical.awg_pack_real_data(len(
-                valuesFloat), valuesFloat.ctypes.data, markersInt.ctypes.data, ctypes.addressof(buf))
-            return buf.raw
-        else:
-            for i in range(0, len(values)):
-                marker = float(markers[i])
-                value = float(values[i])
-                output += struct.pack("<f", ((marker & 3)
-                                             << 14) + (value & (0xFFFF >> 2)))
-            return output
+        return encodeRealData(values, markers)
 
     def setWaveform(self, channel, name):
         """
@@ -535,47 +486,25 @@ class Instr(VisaInstrument):
         """
         Writes marker data to a string.
         """
-        output = ""
-        for i in range(0, len(markers)):
-            marker = int(markers[i])
-            output += struct.pack("B", marker << 6)
-        return output
+        return encodeMarkers(markers)
 
     def readMarkers(self, data):
         """
         Reads marker data from a string.
         """
-        markers = []
-        for j in range(0, len(data)):
-            marker = int(struct.unpack('B', data[j])[0]) >> 6
-            markers.append(marker)
-        return (numpy.array(markers))
+        return decodeMarkers(data)
 
     def readRealData(self, data):
         """
         Reads real-valued data from a string.
         """
-        values = []
-        markers = []
-        for j in range(0, len(data) / 5):
-            value = struct.unpack('f', data[j * 5:j * 5 + 4])[0]
-            values.append(float(value))
-            marker = int(struct.unpack('B', data[j * 5 + 4:j * 5 + 5])[0])
-            markers.append(marker)
-        return (numpy.array(values), numpy.array(markers))
+        return decodeRealData(data)
 
     def readIntData(self, data):
         """
         Reads integer data from a string.
         """
-        values = []
-        markers = []
-        for j in range(0, len(data) / 2):
-            bytes = struct.unpack('H', data[j * 2:j * 2 + 2])[0]
-            value = (bytes >> 6) & 0xFF
-            values.append(value)
-            markers.append(bytes >> 14)
-        return (numpy.array(values), numpy.array(markers))
+        return decodeIntData(data)
 
     def deleteWaveform(self, name):
         """
@@ -608,9 +537,7 @@ class Instr(VisaInstrument):
             size = len(data) / 2
         # print "Creating waveform of length %d" % size
         self.write("WLIST:WAVEFORM:NEW \"%s\",%d,%s" % (name, size, wavetype))
-        header = "#%d%d" % (len("%d" % len(data)), len(data))
-        self.write("WLIST:WAVEFORM:DATA \"%s\",0,%d," %
-                   (name, size) + header + data)
+        self.write(encodeBlock("WLIST:WAVEFORM:DATA \"%s\",0,%d," % (name, size), data))
         time.sleep(self._waitTime)
 
     def appendWaveformToSequence(self, index, channel, waveform, wait=True, repeat=1):
@@ -636,9 +563,7 @@ class Instr(VisaInstrument):
         """
         data = self.writeMarkers(markers)
         size = len(markers)
-        header = "#%d%d" % (len("%d" % len(data)), len(data))
-        self.write("WLIST:WAVEFORM:MARKER:DATA \"%s\",0,%d," %
-                   (name, size) + header + data)
+        self.write(encodeBlock("WLIST:WAVEFORM:MARKER:DATA \"%s\",0,%d," % (name, size), data))
         time.sleep(self._waitTime)
 
     def getMarkers(self, name):
@@ -761,13 +686,11 @@ class Instr(VisaInstrument):
                         numpy.zeros(len(iqWaveform), dtype=numpy.int8))
         else:
             (iMarkers, qMarkers) = markers
-        iData = self.writeIntData(
-            (iChannel + 1.0) / 2.0 * ((1 << 14) - 1), iMarkers)
+        iData = self.writeIntData(toInt14(iChannel), iMarkers)
         self.createWaveform(waveformNames[0], iData, "INT")
         self.setWaveform(channels[0], waveformNames[0])
 
-        qData = self.writeIntData(
-            (qChannel + 1.0) / 2.0 * ((1 << 14) - 1), qMarkers)
+        qData = self.writeIntData(toInt14(qChannel), qMarkers)
         self.createWaveform(waveformNames[1], qData, "INT")
         self.setWaveform(channels[1], waveformNames[1])
 
@@ -789,38 +712,18 @@ class Instr(VisaInstrument):
 
     #    Is the function below useful?
     def loadRealWaveform2(self, waveform, channel=1, markers=None, waveformName='i'):
-        def reverse(n, p):
-            return sum(1 << (n - 1 - i) for i in range(n) if p >> i & 1)
-        # data=self.writeRealData(waveform,markers)
-        dataD = ""
-        dataM = ""
-
-        if __DEBUG__:
-            t0 = time.time()
+        # bit reversal table of the marker bytes
+        reverse = numpy.array([int('{0:08b}'.format(p)[::-1], 2) for p in range(256)], dtype=numpy.uint8)
 
         print "loading channel ", channel, ",  mean=", numpy.mean(waveform)
 
-        valuesFloat = numpy.zeros(len(waveform), dtype=numpy.float32)
-        markersInt = numpy.zeros(len(markers), dtype=numpy.uint8)
-
-        valuesFloat[:] = waveform[:]
-        markersInt[:] = markers[:]
-
-        print "loading channel ", channel, ",  mean=", numpy.mean(valuesFloat)
-
-        for i in range(0, len(waveform)):
-            #output+=struct.pack("<f",((marker & 3) << 14) + (value & (0xFFFF >> 2)))
-            dataD += struct.pack("<f", valuesFloat[i])
-            dataD += struct.pack("<b", 0)
-            dataM += struct.pack("<B", reverse(8, markersInt[i]))
+        markersInt = numpy.asarray(markers).astype(numpy.uint8)
+        dataD = encodeRealData(numpy.asarray(waveform, dtype=numpy.float32), numpy.zeros(len(waveform), dtype=numpy.uint8))
+        dataM = reverse[markersInt].tostring()
 
         size = len(dataD) / 5
         wavetype = 'REAL'
         self.write("WLIST:WAVEFORM:NEW \"%s\",%d,%s" %
                    (waveformName, size, wavetype))
-        headerD = "#%d%d" % (len("%d" % len(dataD)), len(dataD))
-        self.write("WLIST:WAVEFORM:DATA \"%s\",0,%d," %
-                   (waveformName, size) + headerD + dataD)
-        headerM = "#%d%d" % (len("%d" % len(dataM)), len(dataM))
-        self.write("WLIST:WAVEFORM:MARKER:DATA \"%s\",0,%d," %
-                   (waveformName, size) + headerM + dataM)
+        self.write(encodeBlock("WLIST:WAVEFORM:DATA \"%s\",0,%d," % (waveformName, size), dataD))
+        self.write(encodeBlock("WLIST:WAVEFORM:MARKER:DATA \"%s\",0,%d," % (waveformName, size), dataM))
@@ -10,6 +10,8 @@ import scipy.interpolate
 from numpy import *
 from application.lib.instrum_classes import *
 from application.lib.datacube import Datacube
+from application.lib.iq_calibration_table import IQCalibrationTable
+from application.lib.iq_calibration_optimizer import minimizeQuadratic, CalibrationSweep
 from application.helpers.instrumentmanager.instrumentsmgr import InstrumentManager
 from macros.optimization import Minimizer
 reload(sys.modules['macros.optimization'])
@@ -71,8 +73,8 @@ class Instr(Instrument):
         # datacube for storing a single minimization process
         self._optiCube = None
 
-        self._iOffsetInterpolation = lambda x: 0
-        self._qOffsetInterpolation = lambda x: 0
+        # compiled lookup table of the two calibration cubes, rebuilt on the first lookup after they change
+        self._calibrationTable = None
 
         self.loadCal()                      # try to load existing calibration if available
 
@@ -96,6 +98,7 @@ class Instr(Instrument):
         """
         self._offsetCalCube = None
         self._sidebandCalCube = None
+        self.invalidateCalibrationTable()
 
     def setCal(self, offsetCalCube=None, sidebandCalCube=None):
         """
@@ -103,7 +106,8 @@ class Instr(Instrument):
         """
         for calCube, newCalCube in zip(['_offsetCalCube', '_sidebandCalCube'], [offsetCalCube, sidebandCalCube]):
             if isinstance(newCalCube, Datacube):
-                self.set_attr(calCube, newCalCube)
+                setattr(self, calCube, newCalCube)
+        self.invalidateCalibrationTable()
 
     def saveCal(self, directory=None):
         """
@@ -160,6 +164,7 @@ class Instr(Instrument):
                 # 2) or create an empty datacube if allowed.
                 if create:
                     setattr(self, calCube, Datacube(filename))
+        self.invalidateCalibrationTable()
 
     def setOffsetCalibration(self, datacube):
         """set the offset calibration datacube"""
@@ -169,6 +174,7 @@ class Instr(Instrument):
     def setSidebandCalibration(self, datacube):
         """set the sideband calibration datacube"""
         self._sidebandCalCube = datacube
+        self.invalidateCalibrationTable()
 
     def parameters(self):
         """
@@ -242,7 +248,7 @@ class Instr(Instrument):
             return array([])
         waveformIQ = zeros((max(1, length)), dtype=complex128)
         times = arange(0, length, 1)
-        if any([c, phi]) is None:
+        if c is None or phi is None:
             c1, phi1 = 0, 0
             if useCalibIfNone:                            # get corrections from calibration
                 try:
@@ -310,16 +316,18 @@ class Instr(Instrument):
                 IFRange=IFRange, optToDataMan=optToDataMan, calToDataMan=calToDataMan)
         print 'calibration ended'
 
-    def calibrateIQOffset(self, LORange=None, reference=-5, method="scipy.optimize.fmin", save=True, optToDataMan=False, calToDataMan=False):
+    def calibrateIQOffset(self, LORange=None, reference=-5, method="quadratic", save=True, optToDataMan=False, calToDataMan=False, resume=False):
         """
-        Calibrate the IQ mixer DC offsets at a series of LO frequencies
+        Calibrate the IQ mixer DC offsets at a series of LO frequencies.
+        With method "quadratic", each LO frequency starts from the offsets found at the previous one (see optimizeIQMixerQuadratic).
+        The offsets are stored in the calibration cube at each LO frequency (and the cube saved if save is true), so that an interrupted calibration resumes with resume=True, which skips the LO frequencies already in the cube.
         """
         self.debugPrint('in calibrateIQOffset with LORange, save, optToDataMan,calToDataMan = ',
                         (LORange, save, optToDataMan, calToDataMan))
         if LORange is None:
             # use current carrier frequency if not specified
             LORange = [self._mwg.frequency()]
-        elif isinstance(LORange, [float, int]):
+        elif isinstance(LORange, (float, int)):
             LORange = [LORange]  # make a list if single frequency
         channels = self._params["AWGChannels"]
         try:
@@ -343,7 +351,12 @@ class Instr(Instrument):
             if optToDataMan:
                 cu.toDataManager()
             LOpower = self._mwg.power()
+            previous = None                                         # optimum at the previous LO frequency
             for LO in LORange:                                      # loop over LO frequencies
+                if resume and cube.column('LO_GHz') is not None and LO in cube.column('LO_GHz'):
+                    row = cube.search(LO_GHz=LO)[-1]
+                    previous = [cube.column('lowI')[row], cube.column('lowQ')[row]]
+                    continue
                 cu.set(LO_dBm=LOpower, LO_GHz=LO, columnOrder=[
                        'LO_dBm', 'LO_GHz'], commit=True)
                 self._optiCube = Datacube(name='LO_GHz=' + str(LO))
@@ -352,7 +365,11 @@ class Instr(Instrument):
                 # self._mwg.turnOn()
                 self._fsp.write("SENSE1:FREQUENCY:CENTER %f GHZ" % LO)
                 time.sleep(1)
-                if method == "scipy.optimize.fmin":                    # find minimum power
+                if method == "quadratic":                              # find minimum power
+                    (voltages, minimum) = self.optimizeIQMixerQuadratic(
+                        x0=previous, replaceOptiCube=False)
+                    previous = voltages
+                elif method == "scipy.optimize.fmin":
                     (voltages, minimum) = self.optimizeIQMixerPowell(
                         replaceOptiCube=False)
                 elif method == "vs.fmin":
@@ -387,15 +404,17 @@ class Instr(Instrument):
             self._awg.setOffset(channels[0], self.iOffset(LO))
             self._awg.setOffset(channels[1], self.qOffset(LO))
 
-    def calibrateSideband(self, LORange=None, IFRange=arange(-0.5, 0.51, 0.1), reference=0, method="scipy.optimize.fmin", save=True, optToDataMan=False, calToDataMan=False):
+    def calibrateSideband(self, LORange=None, IFRange=arange(-0.5, 0.51, 0.1), reference=0, method="quadratic", save=True, optToDataMan=False, calToDataMan=False, resume=False):
         """
         Calibrate the IQ mixer in sideband generation for a set of LO frequencies and a set of IF frequencies.
+        With method "quadratic", each (LO, IF) point is optimized with a local quadratic model of the sideband power, starting from the optimum of the previous point (see application.lib.iq_calibration_optimizer).
+        Each optimum is stored in the calibration cube as soon as it is found (and the cube saved if save is true), so that an interrupted calibration resumes with resume=True, which skips the points already in the cube.
         """
         self.debugPrint('in calibrateSideband with LORange, IFRange, save, optToDataMan,calToDataMan = ',
                         (LORange, IFRange, save, optToDataMan, calToDataMan))
         if LORange is None:
             LORange = [self._mwg.frequency()]
-        elif isinstance(LORange, [float, int]):
+        elif isinstance(LORange, (float, int)):
             LORange = [LORange]
         try:
             # setup the different generators
@@ -419,37 +438,86 @@ class Instr(Instrument):
             cu = self._topOptiCube = Datacube(name=self._name + '_SBOptim')
             if optToDataMan:
                 cu.toDataManager()
-            for LO in LORange:                                      # loop over LO frequencies
-                # center frequency rounded to 1 MHz
-                LO = round(LO, 3)
-                self._mwg.setFrequency(LO)
-                # self._awg.setAmplitude(channels[0],1)  # Displaced in setup awg
-                # self._awg.setAmplitude(channels[1],1)
-                self._awg.setOffset(channels[0], self.iOffset(LO))
-                self._awg.setOffset(channels[1], self.qOffset(LO))
-                cu.set(LO_dBm=self._mwg.power(), LO_GHz=LO,
-                       columnOrder=['LO_dBm', 'LO_GHz'], commit=True)
-                if cube.column('LO_GHz') is None or LO not in cube.column('LO_GHz'):
-                    cube.set(LO_dBm=self._mwg.power(), LO_GHz=LO,
-                             columnOrder=['LO_dBm', 'LO_GHz'], commit=True)
-                    child = Datacube("LO_GHz=%g" % LO)
-                    cube.addChild(child, LO_GHz=LO)
-                else:
-                    child = cube.children(LO_GHz=LO)[-1]
-                # child cube at a particular LO carrier LO to gather grand
-                # children cubes
-                cuChild = Datacube("LO_GHz=%g" % LO)
-                cu.addChild(cuChild)
-                for IF in IFRange:                                     # loop over IF frequencies
-                    cuChild.set(IF_GHz=IF, commit=True)
-                    # optimization grandchild cube at a particular couple
-                    # (LO,IF)
-                    self._optiCube = Datacube("IF_GHz=%g" % IF)
-                    cuChild.addChild(self._optiCube)
-                    print "LO_GHz=%g, IF_GHz=%g" % (LO, IF)
+            current = {'LO': None}
+
+            def moveTo(point):
+                LO, IF = point
+                if LO != current['LO']:                                 # new LO frequency
+                    current['LO'] = LO
+                    self._mwg.setFrequency(LO)
+                    self._awg.setOffset(channels[0], self.iOffset(LO))
+                    self._awg.setOffset(channels[1], self.qOffset(LO))
+                    cu.set(LO_dBm=self._mwg.power(), LO_GHz=LO,
+                           columnOrder=['LO_dBm', 'LO_GHz'], commit=True)
+                    if cube.column('LO_GHz') is None or LO not in cube.column('LO_GHz'):
+                        cube.set(LO_dBm=self._mwg.power(), LO_GHz=LO,
+                                 columnOrder=['LO_dBm', 'LO_GHz'], commit=True)
+                        current['child'] = Datacube("LO_GHz=%g" % LO)
+                        cube.addChild(current['child'], LO_GHz=LO)
+                    else:
+                        current['child'] = cube.children(LO_GHz=LO)[-1]
+                    # child cube at a particular LO carrier LO to gather grand
+                    # children cubes
+                    current['cuChild'] = Datacube("LO_GHz=%g" % LO)
+                    cu.addChild(current['cuChild'])
+                current['cuChild'].set(IF_GHz=IF, commit=True)
+                # optimization grandchild cube at a particular couple (LO,IF)
+                self._optiCube = Datacube("IF_GHz=%g" % IF)
+                current['cuChild'].addChild(self._optiCube)
+                print "LO_GHz=%g, IF_GHz=%g" % (LO, IF)
+                self._fsp.write(
+                    "SENSE1:FREQUENCY:CENTER %f GHZ" % (LO - IF))
+                time.sleep(1)
+
+            def done(point):
+                # optimum already in the calibration cube, if resuming
+                LO, IF = point
+                if not resume or not cube.children(LO_GHz=LO):
+                    return None
+                child = cube.children(LO_GHz=LO)[-1]
+                rows = child.search(IF_GHz=IF) if child.column('IF_GHz') is not None else []
+                if rows == []:
+                    return None
+                return [child.column('absC')[rows[-1]], child.column('argC_rad')[rows[-1]]]
+
+            def store(point, params, value=None, evaluations=None):
+                LO, IF = point
+                child = current['child']
+                print "LO_GHz=%g, IF_GHz=%g, c = %g, phi = %g rad : value = %g" % (LO, IF, params[0], params[1], self.measureAveragePower())
+                self.loadSidebandWaveform(IF=IF, c=params[0], phi=params[
+                                          1], length=self._params["AWGMaxPoints"])
+                child.set(LO_GHz=LO, IF_GHz=IF, absC=params[0], argC_rad=params[
+                          1], columnOrder=['LO_GHz', 'IF_GHz', 'absC', 'argC_rad'])
+                # measure the different sidebands
+                for i in [-3, -2, -1, 0, 1, 2, 3]:
                     self._fsp.write(
-                        "SENSE1:FREQUENCY:CENTER %f GHZ" % (LO - IF))
+                        "SENSE1:FREQUENCY:CENTER %f GHZ" % (LO + IF * i))
                     time.sleep(1)
+                    if i < 0:
+                        suppl = "m"
+                    else:
+                        suppl = ""
+                    power = self.measureAveragePower()
+                    child.set(**{"p_sb%s%d" % (suppl, abs(i)): power})
+                    print "Power at ", (LO + IF * i), " GHz: ", power
+                child.commit()
+                self.invalidateCalibrationTable()
+                if save:                                                # checkpoint
+                    cube.savetxt(overwrite=True)
+
+            # center frequencies rounded to 1 MHz
+            points = [(round(LO, 3), IF) for LO in LORange for IF in IFRange]
+            if method == "quadratic":
+                sweep = CalibrationSweep(lambda x, point: self.measureSidebandPower(x, point[1]), [0., 0.], [0.1, 0.1],
+                                         xtol=0.0005, moveTo=moveTo, done=done, store=store)
+                sweep.run(points)
+                print "%i sideband power measurements for %i points" % (sweep.evaluations, len(points))
+            else:
+                for point in points:
+                    if done(point) is not None:
+                        continue
+                    moveTo(point)
+                    IF = point[1]
                     print "minimizing"
                     if method == "scipy.optimize.fmin":
                         # defines the directions, as well as the initial steps
@@ -464,32 +532,12 @@ class Instr(Instrument):
                         result = minimizer.result()
                     else:
                         raise Error("bad method selected !!")
-                    params = result[0]
-                    value = result[1]
-                    print "LO_GHz=%g, IF_GHz=%g, c = %g, phi = %g rad : value = %g" % (LO, IF, params[0], params[1], self.measureAveragePower())
-                    self.loadSidebandWaveform(IF=IF, c=params[0], phi=params[
-                                              1], length=self._params["AWGMaxPoints"])
-                    child.set(LO_GHz=LO, IF_GHz=IF, absC=params[0], argC_rad=params[
-                              1], columnOrder=['LO_GHz', 'IF_GHz', 'absC', 'argC_rad'])
-                    # measure the different sidebands
-                    for i in [-3, -2, -1, 0, 1, 2, 3]:
-                        self._fsp.write(
-                            "SENSE1:FREQUENCY:CENTER %f GHZ" % (LO + IF * i))
-                        time.sleep(1)
-                        if i < 0:
-                            suppl = "m"
-                        else:
-                            suppl = ""
-                        power = self.measureAveragePower()
-                        child.set(**{"p_sb%s%d" % (suppl, abs(i)): power})
-                        print "Power at ", (LO + IF * i), " GHz: ", power
-                    child.commit()
-                if save:
-                    cube.savetxt(overwrite=True)
+                    store(point, result[0], result[1])
         except:
             raise
         finally:
             self.teardown()
+            self.invalidateCalibrationTable()
 
     #########################################
     #  optimization                         #
@@ -608,6 +656,26 @@ class Instr(Instrument):
         #result = scipy.optimize.fmin(lambda x: self.measurePower(x),[0.,0.],full_output = 1,xtol = 0.001,ftol = 1e-2,maxiter =50,maxfun =50, disp=True, retall=True)
         return (result[0], result)
 
+    def optimizeIQMixerQuadratic(self, x0=None, x0Limit=.1, step=0.02, warmStep=0.005, xtol=0.0001, replaceOptiCube=True):
+        """
+        Minimize the power leak in the IQ mixer by fitting a local quadratic model of the leaking power (see application.lib.iq_calibration_optimizer).
+        Starts from x0 with initial steps warmStep if x0 is given (e.g. the optimum at a neighbouring LO frequency), or from the current AWG offsets with initial steps step.
+        """
+        if replaceOptiCube or not isinstance(self._optiCube, Datacube):
+            self._optiCube = Datacube(name='IQMixerQuadratic')
+        self.debugPrint('in optimizeIQMixerQuadratic with x0 = ', x0)
+        if x0 is None:
+            x0 = [0, 0]
+            for i in [0, 1]:
+                x0[i] = self._awg.offset(self._params["AWGChannels"][i])
+                if x0Limit is not None and abs(x0[i]) > abs(x0Limit):
+                    x0[i] = x0Limit
+        else:
+            step = warmStep
+        result = minimizeQuadratic(lambda x: self.measurePower(x), x0, [step, step], xtol=xtol, maxEvaluations=40)
+        print "%i power measurements" % result[2]
+        return (result[0], result[1])
+
     def measurePower(self, lows):
         """
         Measure the leaking power of the IQ mixer at a given point.
@@ -668,99 +736,64 @@ class Instr(Instrument):
     #  interpolation function               #
     #########################################
 
+    def calibrationTable(self):
+        """
+        Returns the IQCalibrationTable compiled from the offset and sideband calibration cubes, building it if the
+        cubes changed since the last lookup.
+        """
+        if self._calibrationTable is None:
+            self._calibrationTable = IQCalibrationTable(self._offsetCalCube, self._sidebandCalCube)
+        return self._calibrationTable
+
+    def invalidateCalibrationTable(self):
+        """
+        Discards the compiled calibration table, to be called whenever the calibration cubes are modified.
+        """
+        self._calibrationTable = None
+
     def updateOffsetCalInterpolation(self):
         """
-        Builts or rebuilts the two  I offset and Q offset interpolation functions of the LO frequency, using the offset calibration cube if it exists.
-        """
-        cube = self._offsetCalCube
-        if cube and 'LO_GHz' in cube.names():
-            if len(cube.column('LO_GHz')) > 1:
-                freqs, iOffsets, qOffsets = cube.column(
-                    'LO_GHz'), cube.column('lowI'), cube.column('lowQ')
-                self._iOffsetInterpolation = scipy.interpolate.interp1d(
-                    freqs, iOffsets)
-                self._qOffsetInterpolation = scipy.interpolate.interp1d(
-                    freqs, qOffsets)
-            elif len(cube.column('LO_GHz')) == 1:
-                self._iOffsetInterpolation = lambda x: cube.column('lowI')[0]
-                self._qOffsetInterpolation = lambda x: cube.column('lowQ')[0]
+        Makes the I offset and Q offset interpolation of the LO frequency follow the offset calibration cube.
+        Here simply aliases invalidateCalibrationTable().
+        """
+        self.invalidateCalibrationTable()
 
     def iOffset(self, LO):
         """
-        Returns the I offset at a carrier frequency LO, using the interpolation function _iOffsetInterpolation.
+        Returns the I offset at a carrier frequency LO (or an array of frequencies), interpolated in the calibration table.
         """
-        return self._iOffsetInterpolation(LO)
+        return self.calibrationTable().offsets(LO)[0]
 
     def qOffset(self, LO):
         """
-        Returns the Q offset at a carrier frequency LO, using the interpolation function _iOffsetInterpolation.
+        Returns the Q offset at a carrier frequency LO (or an array of frequencies), interpolated in the calibration table.
         """
-        return self._qOffsetInterpolation(LO)
+        return self.calibrationTable().offsets(LO)[1]
 
     def offsetCorrection(self, LO):
         """
-        Returns a tuple of the I and Q offsets at a carrier frequency f=LO, using the interpolation functions _iOffsetInterpolation and _qOffsetInterpolation.
+        Returns a tuple of the I and Q offsets at a carrier frequency LO (or an array of frequencies), interpolated in
+        the calibration table.
         """
-        return (self._qOffsetInterpolation(f), self._qOffsetInterpolation(f))
+        return self.calibrationTable().offsets(LO)
 
     def sidebandCorrection(self, LO, IF):
         """
-        Returns a tuple of interpolated c and phi correction parameters at carrier frequency LO and IF frequency IF.
+        Returns a tuple of the c and phi correction parameters at carrier frequency LO and IF frequency IF (or arrays of
+        frequencies), bilinearly interpolated in the calibration table.
+        Returns (0, 0) if there is no sideband calibration.
         """
         self.debugPrint('in sidebandCorrection with LO=', LO, ' and IF =', IF)
-        cube = self._sidebandCalCube
-        if cube and cube.children(LO_GHz=LO) == []:
+        table = self.calibrationTable()
+        if not table.hasSideband():
             print 'No value in sidebandCalibrationData'
-            self.debugPrint('corrections c = 0, phi =0')
-            return (0, 0)
-        try:
-            calibrationData = self._sidebandCalCube.children(LO_GHz=LO)[-1]
-            rows = calibrationData.search(IF_GHz=IF)
-            self.debugPrint(rows)
-            if rows == []:
-                try:
-                    if len(calibrationData['IF_GHz']) > 1:
-                        calibrationData.sortBy('IF_GHz')
-                        cList = calibrationData.column("absC")
-                        phiList = calibrationData.column("argC_rad")
-                        IFList = calibrationData.column("IF_GHz")
-                        self.debugPrint('absC', cList, 'argC_rad',
-                                        phiList, 'IF_GHz', IFList)
-                        try:
-                            self.debugPrint("trying to interpolate")
-                            phiInterpolation = scipy.interpolate.interp1d(
-                                IFList, phiList)
-                            cInterpolation = scipy.interpolate.interp1d(
-                                IFList, cList)
-                            c = cInterpolation(IF)
-                            phi = phiInterpolation(IF)
-                            self.debugPrint('c', c, 'phi', phi)
-                            print c, phi
-                            return c, phi
-                        except Exception as e:
-                            print e
-                            print "interpolation failed"
-                except:
-                    print "unknown error in sidebandCorrection"
-                    return (0, 0)
-            elif rows != []:
-                c, phi = calibrationData.column(
-                    "absC")[rows[-1]], calibrationData.column("argC_rad")[rows[-1]]
-            else:
-                c, phi = calibrationData.column(
-                    "absC")[-1], calibrationData.column("argC_rad")[-1]
-            debugPrint('found corrections c = ', c, ' phi = ', phi)
-            return (c, phi)
-        except Exception as e:
-            raise
-            print e, "(error 4)"
-            return (0, 0)
+        c, phi = table.sideband(LO, IF)
+        self.debugPrint('found corrections c = ', c, ' phi = ', phi)
+        return (c, phi)
 
     def calCorrection(self, LO, IF):
         try:
-            (iO, qO) = (self.iOffset(LO), self.qOffset(LO))
-            (c, phi) = self.sidebandCorrection(LO, IF)
-            return {'i0': iO, 'q0': qO, 'c': c, 'phi': phi}
+            return self.calibrationTable().corrections(LO, IF)
         except:
             raise
             print "unable to find correct parameters -> return (0,0,0,0)"
@@ -14,6 +14,8 @@ import scipy.optimize
 import copy
 from application.lib.instrum_classes import *
 from application.lib.datacube import Datacube
+from application.lib.measurement_accumulator import MeasurementAccumulator
+from application.lib.iq_discrimination import fitSweep, fitDistribution, separatrices, separatrixLine
 from application.helpers.datamanager.datamgr import DataManager
 from application.helpers.instrumentsmanager import Manager
 from application.lib.datacube import Datacube
@@ -366,6 +368,8 @@ class Instr(Instrument):
 
         if fitModel:
             separatrixList = []
+            distributions = []
+            previousFit = None
         self.notify('iqP', 0)
         ps = []
         maxcov = 0
@@ -391,12 +395,10 @@ class Instr(Instrument):
                 self.notify("iqP", (trends[0], trends[1], ((x, 0, 1 - x))))
 
                 if fitModel:
-                    try:
-                        fitResults = self.multiGaussianClusters(
-                            trends.transpose())
-                    except:
-                        raise
-                    sep = self.separatrixBimodal(fitResults)
+                    # live fit warm-started from the previous point, refined for the whole sweep at the end
+                    distributions.append(trends.transpose())
+                    previousFit = fitDistribution(distributions[-1], init=previousFit)
+                    sep = self._separatrixList(separatrices(previousFit))[0]
                     separatrixList.append(sep)
 
                     self.separatrixList = separatrixList
@@ -436,6 +438,8 @@ class Instr(Instrument):
             # calculate separatrix
             print "fitModel: ", fitModel
             if fitModel:
+                fit, sweepSeparatrices = self.discriminateSweep(distributions)
+                separatrixList = self._separatrixList(sweepSeparatrices)
                 self.separatrixList = separatrixList
 
                 sepCenters = [s[0] for s in self.separatrixList]
@@ -444,7 +448,7 @@ class Instr(Instrument):
                 self.notify("centersIQ", [sepCenters, centers])
 
                 print "separatrixList: ", separatrixList
-                coefs, st = self.separatrixMulti(separatrixList, 0.1, 0.9)
+                coefs, st = separatrixLine(sweepSeparatrices, 0.1, 0.9)
                 I0 = separatrixList[len(separatrixList) / 2][0][0]
                 Q0 = coefs[0] * I0 + coefs[1]
                 angle = arctan(coefs[0])
@@ -514,8 +518,7 @@ class Instr(Instrument):
 
         print "means = " + str(mean(trends[0])) + " " + str(mean(trends[1]))
 
-        fitResults = self.multiGaussianClusters(trends.transpose())
-        sep = self.separatrixBimodal(fitResults)
+        sep = self._separatrixList(separatrices(fitDistribution(trends.transpose())))[0]
         sepCenter = sep[0]
         sepAngle = sep[1]
 
@@ -771,66 +774,53 @@ class Instr(Instrument):
         r = self._pulseAnalyser._acqiris.convertToProbabilities(clicks)
         return (r, IQData)
 
-    def measure(self, nLoops=None, fast=False):
+    def measure(self, nLoops=None, fast=False, targetUncertainty=None, uncertaintyKeys=None, maxRetries=2):
         """
         acquire, measure and calculate probabilities
+        If nLoops is larger than _nLoopsMax, the measurement is taken in chunks of at most _nLoopsMax loops whose
+        results are accumulated in a MeasurementAccumulator (see measureAccumulator()), a failed chunk being retried up
+        to maxRetries times. After each chunk, the partial means and their errors are notified as 'partialMeasure'.
+        If targetUncertainty is given, the measurement stops as soon as the standard errors of uncertaintyKeys (all keys
+        if None) are below it.
+        Returns [means] in the chunked case.
         """
-        try:
-            if nLoops is None:
-                nLoops = self.nLoops()
-            if nLoops > self._nLoopsMax:
-                firstNLoops = nLoops - \
-                    int(nLoops / self._nLoopsMax) * self._nLoopsMax
+        if nLoops is None:
+            nLoops = self.nLoops()
+        if nLoops <= self._nLoopsMax and targetUncertainty is None:
+            return self._pulseAnalyser.analyse(nLoops, fast=fast)
+        accumulator = MeasurementAccumulator()
+        self._measureAccumulator = accumulator
+        nChunks = int(nLoops / self._nLoopsMax)
+        chunks = [nLoops - nChunks * self._nLoopsMax] + [self._nLoopsMax] * nChunks
+        chunks = [chunk for chunk in chunks if chunk > 0]
+        for i, chunk in enumerate(chunks):
+            for attempt in range(maxRetries + 1):
                 try:
-                    r = self._pulseAnalyser.analyse(
-                        firstNLoops, fast=fast)  # [-1]
-                except:
-                    print "error in pre-loop -> catched"
-                if __DEBUG__:
-                    print r[0], r[-1]
-                toReturn = dict()
-                for key in r[-1].keys():
-                    toReturn[key] = firstNLoops * r[-1][key]
-#        for key in r[0].keys():
-           #         toReturn[key]=firstNLoops*r[0][key]
-    #        r[key]*=firstNLoops
-                    extraLoop = int(nLoops / self._nLoopsMax)
-                if __DEBUG__:
-                    print toReturn
-                for i in range(0, extraLoop):
-
-                    for j in [0, 1, 2]:
-                        try:
-                            print "index:", i, " over ", extraLoop
-                            r = self._pulseAnalyser.analyse(
-                                self._nLoopsMax, fast=fast)
-                            if __DEBUG__:
-                                print r[0], r[-1]
-                            for key in r[-1].keys():
-                                toReturn[key] += self._nLoopsMax * r[-1][key]
-                            # for key in r[0].keys():
-                            #  toReturn[key]+=self._nLoopsMax*r[0][key]
-                            if __DEBUG__:
-                                print toReturn
-                            print "OK !"
-                        except Exception as a:
-                            print "error in extraLoop-> catched"
-                            print a
-                            pass
-                        else:
-                            break
-                if __DEBUG__:
-                    print "dividing by ", nLoops
-                for key in toReturn.keys():
-                    toReturn[key] /= nLoops
-                toReturn = [toReturn]
-            else:
-                toReturn = self._pulseAnalyser.analyse(nLoops, fast=fast)
-
-            return toReturn
-        except Exception as a:
-            print "error in extraLoop->not catched"
-            print a
+                    r = self._pulseAnalyser.analyse(chunk, fast=fast)
+                except Exception as error:
+                    print "error in chunk %i/%i (attempt %i): %s" % (i + 1, len(chunks), attempt + 1, error)
+                    if attempt < maxRetries:
+                        accumulator.addRetry(error)
+                    else:
+                        accumulator.addFailure(chunk, error)
+                else:
+                    accumulator.add(r[-1], chunk)
+                    break
+            if __DEBUG__:
+                print "chunk %i/%i:" % (i + 1, len(chunks)), accumulator.means()
+            self.notify("partialMeasure", accumulator.summary())
+            if targetUncertainty is not None and accumulator.converged(targetUncertainty, uncertaintyKeys):
+                break
+        if accumulator.chunks == 0:
+            raise RuntimeError("All the %i chunks of the measurement failed: %s" %
+                               (len(chunks), accumulator.failures[-1][1]))
+        return [accumulator.means()]
+
+    def measureAccumulator(self):
+        """
+        Returns the MeasurementAccumulator of the last chunked measurement (means, errors, failed chunks), or None.
+        """
+        return getattr(self, '_measureAccumulator', None)
 
     def nLoops(self):
         try:
@@ -958,6 +948,24 @@ class Instr(Instrument):
 
 # Utility functions for separating clusters
 
+    def discriminateSweep(self, distributions, n_components=2, init=None):
+        """
+        Fits Gaussian mixtures to the IQ distributions (list of (N,2) arrays) of all the points of a sweep in one batched
+        operation, each point being warm-started from its neighbour (see application.lib.iq_discrimination).
+        Returns (MixtureFit, separatrices) where separatrices is the dictionary of the arrays of the separatrix points,
+        angles, weights, centers, sigmas, thresholds and fidelities of all the points.
+        """
+        fit = fitSweep(distributions, nComponents=n_components, init=init)
+        return fit, separatrices(fit)
+
+    def _separatrixList(self, separatrices):
+        """
+        Converts the dictionary of arrays returned by separatrices() into the list of the
+        [sepPoint, beta, weights, centers, sigmas] of separatrixBimodal().
+        """
+        return [[separatrices['points'][i], separatrices['angles'][i], separatrices['weights'][i],
+                 separatrices['centers'][i], separatrices['sigmas'][i]] for i in range(len(separatrices['points']))]
+
     def multiGaussianClusters(self, distribution, n_components=2, scale=True, returnGMM=False, predict=False):
         scaler = preprocessing.StandardScaler()
         distribution2 = distribution
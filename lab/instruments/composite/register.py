@@ -4,6 +4,10 @@ import struct
 import shelve
 import os.path
 import yaml
+import sqlite3
+import threading
+import cPickle
+from contextlib import contextmanager
 
 from application.lib.instrum_classes import *
 
@@ -12,8 +16,20 @@ class Instr(Instrument):
 
     """
     A persistent parameter register.
+    The register is stored in a sqlite database in write-ahead-log (WAL) mode, so that:
+      - each write is durable without rewriting the whole file;
+      - several writes can be grouped in a single commit using 'with register.transaction(): ...';
+      - a single key is read without copying the whole register;
+      - several processes (IDE, instrument server,...) can read the register while another one writes to it.
+    Each modified key is notified to the register's observers with notify('register', (key, value)),
+    and callbacks can be attached to particular keys with watch(key, callback).
+    Changes made by other processes are detected and notified by calling checkChanges().
+    A shelve register from a previous version with the same filename is imported at first opening.
     """
 
+    _changeLogSize = 10000      # number of changes kept in the change log
+    _pruneInterval = 1000       # number of commits between two prunings of the change log
+
     def initialize(self, filename=None, path=None):
         """
         Initialize the register.
@@ -27,49 +43,219 @@ class Instr(Instrument):
         basename = os.path.basename(filename)
         fullPath = path + "/" + basename
         print "Opening register with filename %s" % fullPath
-        self._register = shelve.open(fullPath)
+        self._lock = threading.RLock()
+        self._transactionDepth = 0
+        self._pending = []                  # (key, value, version) changes to be notified at commit
+        self._watchers = dict()             # {key: [callbacks]}
+        isNew = not os.path.exists(fullPath + '.sqlite')
+        self._register = sqlite3.connect(fullPath + '.sqlite', timeout=30, check_same_thread=False)
+        self._register.text_factory = str
+        self._register.execute('PRAGMA journal_mode=WAL')
+        self._register.execute('PRAGMA synchronous=NORMAL')
+        self._register.execute(
+            'CREATE TABLE IF NOT EXISTS register (key TEXT PRIMARY KEY, value BLOB, version INTEGER)')
+        # log of modified keys used to detect the changes made by other processes
+        self._register.execute(
+            'CREATE TABLE IF NOT EXISTS changes (version INTEGER PRIMARY KEY AUTOINCREMENT, key TEXT)')
+        self._version = self._lastVersion()
+        self._pruneChanges(self._version)
+        self._register.commit()
+        self._ownVersions = set()           # versions written by this instance and not yet processed by checkChanges
+        self._commits = 0
+        if isNew:
+            self._importShelve(fullPath)
+
+    def _importShelve(self, fullPath):
+        """
+        Private method importing the content of a shelve register with the same filename, if any.
+        """
+        try:
+            old = shelve.open(fullPath, 'r')
+        except:
+            return
+        try:
+            print "Importing shelve register %s" % fullPath
+            self.load(dict(old))
+        finally:
+            old.close()
+
+    def _pruneChanges(self, lastVersion):
+        """
+        Private method removing the changes older than the _changeLogSize last ones from the change log.
+        """
+        self._register.execute('DELETE FROM changes WHERE version < ?', (lastVersion - self._changeLogSize,))
+
+    def _lastVersion(self):
+        row = self._register.execute('SELECT MAX(version) FROM changes').fetchone()
+        return row[0] or 0
+
+    @contextmanager
+    def transaction(self):
+        """
+        Context manager grouping all writes done inside a 'with' block in a single commit.
+        Changes are notified after the commit, and are all discarded if an exception is raised in the block.
+        Transactions can be nested, the commit occurring at the end of the outermost one.
+        """
+        with self._lock:
+            self._transactionDepth += 1
+            try:
+                yield self
+            except:
+                self._transactionDepth -= 1
+                if self._transactionDepth == 0:
+                    self._register.rollback()
+                    for key, value, version in self._pending:
+                        self._ownVersions.discard(version)
+                    self._pending = []
+                raise
+            self._transactionDepth -= 1
+            if self._transactionDepth == 0:
+                self._commit()
+
+    def _commit(self):
+        """
+        Private method committing the pending writes and notifying them.
+        """
+        self._register.commit()
+        pending, self._pending = self._pending, []
+        for key, value, version in pending:
+            # a write following the last processed version leaves nothing to process in checkChanges
+            if version == self._version + 1:
+                self._version = version
+                self._ownVersions.discard(version)
+        if pending:
+            lastVersion = pending[-1][2]
+            # own versions older than the change log can no longer be met by checkChanges
+            if len(self._ownVersions) > self._changeLogSize:
+                self._ownVersions = set([version for version in self._ownVersions
+                                         if version >= lastVersion - self._changeLogSize])
+            self._commits += 1
+            if self._commits % self._pruneInterval == 0:
+                self._pruneChanges(lastVersion)
+                self._register.commit()
+        for key, value, version in pending:
+            self._notifyKey(key, value)
+
+    def _write(self, key, value, delete=False):
+        """
+        Private method writing (or deleting) a key, and committing immediately if not in a transaction.
+        """
+        with self._lock:
+            version = self._register.execute('INSERT INTO changes (key) VALUES (?)', (key,)).lastrowid
+            self._ownVersions.add(version)
+            if delete:
+                self._register.execute('DELETE FROM register WHERE key=?', (key,))
+            else:
+                blob = sqlite3.Binary(cPickle.dumps(value, cPickle.HIGHEST_PROTOCOL))
+                self._register.execute('INSERT OR REPLACE INTO register (key, value, version) VALUES (?, ?, ?)',
+                                       (key, blob, version))
+            self._pending.append((key, value, version))
+            if self._transactionDepth == 0:
+                self._commit()
+
+    def _notifyKey(self, key, value):
+        self.notify('register', (key, value))
+        for callback in self._watchers.get(key, []):
+            callback(key, value)
+
+    def watch(self, key, callback):
+        """
+        Calls callback(key, value) each time the key is modified (value is None when the key is deleted).
+        """
+        self._watchers.setdefault(key, [])
+        if callback not in self._watchers[key]:
+            self._watchers[key].append(callback)
+
+    def unwatch(self, key, callback=None):
+        """
+        Removes a callback (or all callbacks if callback is None) attached to the key.
+        """
+        if callback is None:
+            self._watchers.pop(key, None)
+        elif callback in self._watchers.get(key, []):
+            self._watchers[key].remove(callback)
+
+    def checkChanges(self):
+        """
+        Notifies the keys modified or deleted by other processes since the last call, and returns the list of their names.
+        """
+        with self._lock:
+            rows = self._register.execute('SELECT version, key FROM changes WHERE version > ? ORDER BY version',
+                                          (self._version,)).fetchall()
+            if rows:
+                self._version = rows[-1][0]
+            keys = []
+            for version, key in rows:
+                if version in self._ownVersions:
+                    self._ownVersions.discard(version)
+                elif key not in keys:
+                    keys.append(key)
+        for key in keys:
+            self._notifyKey(key, self.get(key))
+        return keys
 
     def parameters(self):
         """
         Return a copy of the register dictionary.
         """
-        return dict(self._register)
+        with self._lock:
+            rows = self._register.execute('SELECT key, value FROM register').fetchall()
+        return dict([(key, cPickle.loads(str(blob))) for key, blob in rows])
+
+    def get(self, key, default=None):
+        """
+        Get a variable from the register, or default if the key does not exist.
+        """
+        with self._lock:
+            row = self._register.execute('SELECT value FROM register WHERE key=?', (key,)).fetchone()
+        if row is None:
+            return default
+        return cPickle.loads(str(row[0]))
 
     def __getitem__(self, key):
         """
         Get a variable from the register.
         """
         if not hasattr(self, "_register"):
-            self._register = dict()
-        if key in self._register:
-            return self._register[key]
+            raise IndexError("Register %s is not initialized" % self.name())
+        with self._lock:
+            row = self._register.execute('SELECT value FROM register WHERE key=?', (key,)).fetchone()
+        if row is not None:
+            return cPickle.loads(str(row[0]))
         raise IndexError("No such key in register: %s" % key)
 
     def hasKey(self, key):
-        if key in self._register:
-            return True
-        return False
+        with self._lock:
+            row = self._register.execute('SELECT 1 FROM register WHERE key=?', (key,)).fetchone()
+        return row is not None
+
+    def __contains__(self, key):
+        return self.hasKey(key)
 
     def keys(self):
-        return self._register.keys()
+        with self._lock:
+            return [row[0] for row in self._register.execute('SELECT key FROM register')]
 
     def __setitem__(self, key, value):
         """
         Store a variable in the register.
         """
-        self._register[key] = value
-        self._register.sync()
+        self._write(key, value)
 
     def __len__(self):
-        return len(self._register)
+        with self._lock:
+            return self._register.execute('SELECT COUNT(*) FROM register').fetchone()[0]
 
     def load(self, params):
         """
         Load the register from a dictionary.
         """
-        self._register.clear()
-        for key in params:
-            self._register[key] = params[key]
+        with self.transaction():
+            for key in self.keys():
+                if key not in params:
+                    self._write(key, None, delete=True)
+            for key in params:
+                self._write(key, params[key])
 
     def loadFromFile(self, filename):
         """
@@ -91,8 +277,9 @@ class Instr(Instrument):
         """
         Delete an item from the register.
         """
-        if key in self._register:
-            del self._register[key]
+        if self.hasKey(key):
+            self._write(key, None, delete=True)
 
     def __del__(self):
-        self._register.close()
+        if hasattr(self, "_register"):
+            self._register.close()
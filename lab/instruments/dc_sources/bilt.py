@@ -6,6 +6,7 @@ import time
 import math
 
 from application.lib.instrum_classes import VisaInstrument
+from application.lib.ramp_engine import Ramp, rampScheduler
 
 
 class Trace:
@@ -27,39 +28,45 @@ class Instr(VisaInstrument):
         self.notify("voltage", float(string))
         return float(string)
 
-    def setVoltage(self, value, slewRate=None):
+    def setVoltage(self, value, slewRate=None, wait=True):
         """
-        Sets the voltage to a given value with a given slew rate
+        Sets the voltage to a given value with a given slew rate in V/s.
+        The ramp is run by the ramp scheduler (see rampVoltage).
+        If wait is False and the voltage is ramped, returns the Ramp without waiting for its end.
         """
-        self.write("I %u" % (self._unit))
         if slewRate is None:
             slewRate = self.slewRate
         if math.fabs(value) > 50.0:
-            raise "Error! Voltage is too high!"
+            raise Exception("Error! Voltage is too high!")
         if slewRate is None:
+            rampScheduler().cancel(self)
+            self.write("I %u" % (self._unit))
             self.write("volt %f" % value)
         else:
-            slewRate = abs(slewRate)
-            v = self.voltage()
-            while math.fabs(v - value) > 0.0000001:
-                time.sleep(0.1)
-                if v > value:
-                    if v - value > slewRate * 0.1:
-                        v -= slewRate * 0.1
-                    else:
-                        v = value
-                    self.write("volt %f" % v)
-                    v = self.voltage()
-                elif v < value:
-                    if value - v > slewRate * 0.1:
-                        v += slewRate * 0.1
-                    else:
-                        v = value
-                    self.write("volt %f" % v)
-                    v = self.voltage()
-
+            ramp = self.rampVoltage(value, slewRate=slewRate)
+            if not wait:
+                return ramp
+            ramp.result()
         return self.voltage()
 
+    def _writeVoltage(self, value):
+        self.write("I %u" % (self._unit))
+        self.write("volt %f" % value)
+
+    def rampVoltage(self, value, slewRate=None):
+        """
+        Starts ramping the voltage to value at slewRate in V/s (the default slew rate if None) in the background
+        and returns the Ramp, an OperationFuture whose result is the voltage read back at the end of the ramp.
+        The units of a rack, as several sources, ramp simultaneously. A ramp in progress can be stopped with ramp.cancel().
+        """
+        if slewRate is None:
+            slewRate = self.slewRate
+        if math.fabs(value) > 50.0:
+            raise Exception("Error! Voltage is too high!")
+        ramp = Ramp(self.name(), self._writeVoltage, value, slewRate, readValue=self.voltage, minStep=1e-7,
+                    progress=lambda v: self.notify("voltage", v))
+        return rampScheduler().start(ramp, source=self)
+
     def output(self):
         """
         Returns the output status of the device (ON/OFF)
@@ -7,6 +7,7 @@ import struct
 import time
 import math
 from application.lib.instrum_classes import VisaInstrument
+from application.lib.ramp_engine import Ramp, rampScheduler
 
 
 class Trace:
@@ -90,61 +91,75 @@ class Instr(VisaInstrument):
         self.notify('voltage', float(string))
         return float(string)
 
-    def _setVoltageOrCurrent(self, mode, value, slewrate, turnOn):
+    def _setVoltageOrCurrent(self, mode, value, slewrate, turnOn, wait=True):
         """
         Private function for setVoltage or setCurrent
         """
+        rampScheduler().cancel(self)
         string = self.ask("od;")
         if mode == 'voltage' and string.find('CA') != -1:
             self.toVoltage()
         elif mode == 'current' and string.find('CV') != -1:
             self.toCurrent()
-        self.setOutputValue(value, slewrate=slewrate)
+        result = self.setOutputValue(value, slewrate=slewrate, wait=wait)
+        if not wait and isinstance(result, Ramp):
+            if turnOn:
+                result.addDoneCallback(lambda ramp: self.turnOn())
+            return result
         if turnOn:
             self.turnOn()
         return self.outputValue()
 
-    def setVoltage(self, value, slewrate=None, turnOn=False):
+    def setVoltage(self, value, slewrate=None, turnOn=False, wait=True):
         """
         Switches to voltage mode if necessary, outputs voltage, and optionnaly switches output on.
+        If wait is False and the voltage is ramped, returns the Ramp without waiting for its end (see rampOutputValue).
         """
-        return self._setVoltageOrCurrent('voltage', value, slewrate, turnOn)
+        return self._setVoltageOrCurrent('voltage', value, slewrate, turnOn, wait)
 
-    def setCurrent(self, value, slewrate=None, turnOn=False):
+    def setCurrent(self, value, slewrate=None, turnOn=False, wait=True):
         """
         Switches to current mode if necessary, outputs voltage, and optionnaly switches output on.
+        If wait is False and the current is ramped, returns the Ramp without waiting for its end (see rampOutputValue).
         """
-        return self._setVoltageOrCurrent('current', value, slewrate, turnOn)
+        return self._setVoltageOrCurrent('current', value, slewrate, turnOn, wait)
 
-    def setOutputValue(self, value, slewrate=None, raiseError=False):
+    def rampOutputValue(self, value, slewrate=None):
         """
-        Sets the voltage to a given value with a given slew rate.
-        The "slew rate" is actually in V/s or A/s during the waiting time between increments.
-        Since the time to set and read the output value is not negligible with respect to the waiting time, the "slew rate" is very approximative.
+        Starts ramping the output to value at slewrate in V/s or A/s (the default slew rate if None) in the background
+        and returns the Ramp, an OperationFuture whose result is the value read back at the end of the ramp.
+        Ramps of several sources run simultaneously. A ramp in progress can be stopped with ramp.cancel().
+        No other command should be sent to the source before the end of the ramp.
+        """
+        if slewrate is None:
+            slewrate = self._slewrate
+        ramp = Ramp(self.name(), lambda v: self.write('S%f;E;' % v), value, slewrate, readValue=self.outputValue,
+                    minStep=self.precision, progress=lambda v: self.notify('voltage', v))
+        return rampScheduler().start(ramp, source=self)
+
+    def setOutputValue(self, value, slewrate=None, raiseError=False, wait=True):
+        """
+        Sets the voltage to a given value with a given slew rate in V/s or A/s.
+        The ramp is run by the ramp scheduler (see rampOutputValue), the value written at each step being computed
+        from the time elapsed since the start of the ramp.
+        If wait is False and the value is ramped, returns the Ramp without waiting for its end.
         """
-        prec = self.precision()               # determline the precision
         if slewrate is None:
             slewrate = self._slewrate
         if slewrate is None:
+            rampScheduler().cancel(self)
             self.write('S%f;E;' % value)
         else:
-            # and an increment larger than or equal to the precision
-            inc = max(abs(slewrate) * 0.1, prec)
-            v = self.outputValue()
-            while abs(value - v) > prec:   # while you have the precision to get closer
-                time.sleep(0.1)
-                if value > v + inc:
-                    v += inc
-                elif value < v - inc:
-                    v -= inc
-                else:
-                    v = value
-                self.write('S%f;E;' % v)
+            ramp = self.rampOutputValue(value, slewrate=slewrate)
+            if not wait:
+                return ramp
+            ramp.result()
+        prec = self.precision()               # determine the precision
         v = self.outputValue()
         if abs(v - value) > prec:
             msg = 'Error: could not set the requested value!'
             if raiseError:
-                raise msg
+                raise Exception(msg)
             else:
                 print msg
         return v
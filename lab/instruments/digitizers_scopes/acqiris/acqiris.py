@@ -22,6 +22,8 @@ from application.helpers.instrumentsmanager import *
 from application.lib.instrum_classes import *
 from application.lib.datacube import Datacube
 
+from acqiris_ring import AcquisitionBuffer, AcquisitionRing
+
 #import acqiris_ModuleDLL2
 
 # utility class for helping in C to python interface
@@ -394,7 +396,7 @@ class Instr(Instrument):
         return status
 
     # acquisition and transfer function
-    def AcquireTransfer(self, voltages=True, wantedChannels=15, transferAverage=False, getHorPos=True, getTimeStamps=True, nLoops=1., timeOut=10):
+    def AcquireTransfer(self, voltages=True, wantedChannels=15, transferAverage=False, getHorPos=True, getTimeStamps=True, nLoops=1., timeOut=10, buffer=None):
         """
         Start a sequence acquisition and transfer the acquired sequence by calling the C DLL function AcquireTransfer.
         A number of nLoops sequences can be piled up to circumvent the sequence limitation of the acqiris system.
@@ -402,6 +404,8 @@ class Instr(Instrument):
         All acquisition parameters and the sequence data are first stored in global variables and copied in a dictionary 
         to be used by a possible frontpanel.
         Systematic notification de-activated. Callers have to use a dispatch call to get notification.
+        If buffer is an AcquisitionBuffer with the sizes of acquisitionSizes(), the sequence is transferred into its
+        preallocated arrays instead of new ones (see acquisitionRing()).
         """
         self.debugPrint('in acqiris.AcquireTransfer(voltages=', voltages, ',wantedChannels=', wantedChannels, ',transferAverage=',
                         transferAverage, ',getHorPos=', getHorPos, ',getTimeStamps=', getTimeStamps, ',nLoops=', nLoops, ',timeOut=', timeOut, ')')
@@ -413,41 +417,40 @@ class Instr(Instrument):
         totalArraySizes = zeros(4, dtype=int32)
         transferAverages = zeros(4, dtype=bool)
         transferAverages[:] = [transferAverage] * 4
-        # We reserve the required size and reset the arrays
-        if transferAverage == False:  # that will contain the transferred vertical data if no averaging
-            size = int(self._params["numberOfPoints"] *
-                       self._params["numberOfSegments"] * nLoops)
-        else:                         # that will contain the transferred vertical data if averaging
-            size = int(self._params["numberOfPoints"])
+        # We reserve the required size and reset the arrays (or take those of buffer)
+        waveSizes, horPosSize, timeStampsSize = self.acquisitionSizes(
+            wantedChannels, transferAverage, getHorPos, getTimeStamps, nLoops)
+        if buffer is not None and not buffer.fits(waveSizes, horPosSize, timeStampsSize):
+            self._memoryLocked = False
+            raise ValueError('The acquisition buffer does not fit the current configuration.')
         for i in range(0, self.nbrOfChannels):
-            size2 = 1
-            if wantedChannels & (1 << i):
-                size2 = size
-            self.lastWaveformArraySizes[i] = size2
-            self.lastWaveformArray[i] = zeros(size2, dtype=float64)
+            self.lastWaveformArraySizes[i] = waveSizes[i]
+            if buffer is None:
+                self.lastWaveformArray[i] = zeros(waveSizes[i], dtype=float64)
+            else:
+                self.lastWaveformArray[i] = buffer.waves[i]
+        if buffer is not None:
+            self.lastNbrSegmentsArray = buffer.nbrSegmentsArray
+        else:
+            self.lastNbrSegmentsArray = zeros(4, dtype=int32)
         self.lastAverageCalculated = False
         samplingTime = myType(0, float64)
         nbrSamplesPerSeg = myType(0, dtype=int32)
         nbrSegments = myType(0, dtype=int32)
         nbrSegmentsArray = zeros(4, dtype=int32)
 
-        if getHorPos:  # reserve the required size for horizontal positions of the successive triggers
-            horPosArraySize = myType(
-                self._params["numberOfSegments"] * nLoops, dtype=int32)
-            self.lastHorPositionsArray = zeros(
-                self._params["numberOfSegments"] * nLoops, dtype=float64)
-        else:
-            horPosArraySize = myType(0, dtype=int32)
-            self.horPosArray = zeros(1, dtype=float64)
-
-        if getTimeStamps:  # reserve the required size for timestamps of the successive triggers
-            timeStampsArraySize = myType(
-                self._params["numberOfSegments"] * nLoops, dtype=int32)
-            self.lastTimeStampsArray = zeros(
-                self._params["numberOfSegments"] * nLoops, dtype=float64)
+        # reserve the required size for horizontal positions and timestamps of the successive triggers
+        horPosArraySize = myType(horPosSize, dtype=int32)
+        timeStampsArraySize = myType(timeStampsSize, dtype=int32)
+        if buffer is None:
+            if getHorPos:
+                self.lastHorPositionsArray = zeros(horPosSize, dtype=float64)
+            else:
+                self.horPosArray = zeros(1, dtype=float64)
+            self.lastTimeStampsArray = zeros(max(timeStampsSize, 1), dtype=float64)
         else:
-            timeStampsArraySize = myType(0, dtype=int32)
-            self.lastTimeStampsArray = zeros(1, dtype=float64)
+            self.lastHorPositionsArray = buffer.horPos
+            self.lastTimeStampsArray = buffer.timeStamps
         maxDelayBetweenTrigs_s = myType(100, dtype=float64)
         time_s = myType(0, float64)
 
@@ -490,11 +493,46 @@ class Instr(Instrument):
         self.lastTimeStampsArraySize = timeStampsArraySize.value()
         self.lastHorPositionsArraySize = horPosArraySize.value()
         self.lastWaveIdentifier += 1
+        if buffer is not None:
+            buffer.info.update({'identifier': self.lastWaveIdentifier, 'samplingTime': self.lastSamplingTime,
+                                'transferedChannels': self.lastTransferredChannel, 'transferAverage': transferAverage,
+                                'nbrSamplesPerSeg': self.lastNbrSamplesPerSeg,
+                                'timeStampsSize': self.lastTimeStampsArraySize,
+                                'horPosSize': self.lastHorPositionsArraySize, 'status': status})
         # unlock memory
         self._memoryLocked = False
         # return the status returned by the DLL function
         return status
 
+    def acquisitionSizes(self, wantedChannels=15, transferAverage=False, getHorPos=True, getTimeStamps=True, nLoops=1.):
+        """
+        Returns the sizes ([sizes of the 4 waves], horPos size, timeStamps size) of an acquisition with the current
+        numberOfPoints and numberOfSegments.
+        """
+        if transferAverage == False:  # that will contain the transferred vertical data if no averaging
+            size = int(self._params["numberOfPoints"] *
+                       self._params["numberOfSegments"] * nLoops)
+        else:                         # that will contain the transferred vertical data if averaging
+            size = int(self._params["numberOfPoints"])
+        waveSizes = [size if wantedChannels & (1 << i) else 1 for i in range(4)]
+        nbrTriggers = int(self._params["numberOfSegments"] * nLoops)
+        return waveSizes, nbrTriggers if getHorPos else 0, nbrTriggers if getTimeStamps else 0
+
+    def acquisitionRing(self, nbrBuffers=2, voltages=True, wantedChannels=15, transferAverage=False, getHorPos=True,
+                        getTimeStamps=False, nLoops=1., timeOut=10):
+        """
+        Returns an AcquisitionRing of nbrBuffers buffers preallocated for the current configuration, in which the
+        acquisition and transfer of the next sequence overlap the processing of the current one (see acqiris_ring).
+        """
+        sizes = self.acquisitionSizes(wantedChannels, transferAverage, getHorPos, getTimeStamps, nLoops)
+        buffers = [AcquisitionBuffer(*sizes) for i in range(nbrBuffers)]
+
+        def fill(buffer):
+            self.AcquireTransfer(voltages=voltages, wantedChannels=wantedChannels, transferAverage=transferAverage,
+                                 getHorPos=getHorPos, getTimeStamps=getTimeStamps, nLoops=nLoops, timeOut=timeOut,
+                                 buffer=buffer)
+        return AcquisitionRing(fill, buffers)
+
     def getLastWave(self):
         """
         Return a dictionary with all the information about the last sequence aquired.
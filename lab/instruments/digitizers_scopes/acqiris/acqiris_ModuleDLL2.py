@@ -8,6 +8,10 @@ import traceback
 import scipy.optimize
 import ctypes
 import os
+import math
+
+import acqiris_demodulation
+import acqiris_clicks
 # Import the high level library
 
 #import lib.swig.acqiris_QuantroDLL2.acqiris_QuantroDLL2.acqiris_QuantroDLL2 as acqiris_QuantroDLL2_lib
@@ -79,6 +83,10 @@ class ModuleDLL2():
 
         self.corrections = dict()
         self.parent = parent
+        # portable numpy demodulation, used by frequenciesAnalyse unless useDLLDemodulation is True
+        self.numpyDemodulator = acqiris_demodulation.MultiFrequencyDemodulator()
+        self.useDLLDemodulation = False
+        self.lastDemodulation = None
 
     def setChannels(self, i=0, q=1):
         """
@@ -116,7 +124,8 @@ class ModuleDLL2():
             print "pre-acquire"
             self.parent.AcquireTransfer(
                 voltages=True, wantedChannels=3, transferAverage=False, getHorPos=True, getTimeStamps=False, nLoops=1)
-        self.lenArray = 4
+        # one row per readout index (at least 4 for the front panels)
+        self.lenArray = max([4] + [frequency[2] + 1 for frequency in frequencies])
         # Acquire
         #self.AcquireTransferV4(voltages=True, wantedChannels=15, transferAverage=False, getHorPos=True, getTimeStamps=False,nLoops=nLoops)
         self.parent.AcquireTransfer(voltages=True, wantedChannels=15,
@@ -125,106 +134,47 @@ class ModuleDLL2():
         # Array for demodulation
         components = zeros(
             (self.lenArray, 2, self.parent.getLastWave()['nbrSegmentArray'][0]))
-        rotatedComponents = zeros(
-            (self.lenArray, 2, self.parent.getLastWave()['nbrSegmentArray'][0]))
-
-        # Array for clicks
-        clicks = zeros(
-            (self.lenArray, self.parent.getLastWave()['nbrSegmentArray'][0]))
-
-        # Array for probabilities
-        probabilities = zeros(self.lenArray)
 
         results = dict()
         t0 = time.time()
         # Demodulation
-        for i in range(0, len(frequencies)):
-            if frequencies[i][1]:
-
-                index = frequencies[i][2]
-                frequency = frequencies[i][0]
-
-                hp = self.parent.getLastWave()['horPos']
-#        hp[:]=0
-#        (o1,o2,components[frequencies[i][2],0,:],components[frequencies[i][2],1,:],o3,o4)=self.demodulate2ChIQ(self.parent.getLastWave()['wave'][self.iChannel],self.parent.getLastWave()['wave'][self.qChannel],self.parent.getLastWave()['horPos'],self.parent.getLastWave()['nbrSegmentArray'][0],int(self.parent.getLastWave()['nbrSamplesPerSeg']),self.parent.getLastWave()['samplingTime'], frequency * 1E9,intervalMode=intervalMode)
-                t = time.time()
-                (o1, o2, components[frequencies[i][2], 0, :], components[frequencies[i][2], 1, :], o3, o4) = self.demodulate2ChIQ(self.parent.getLastWave()['wave'][self.iChannel], self.parent.getLastWave()['wave'][
-                    self.qChannel], hp, self.parent.getLastWave()['nbrSegmentArray'][0], int(self.parent.getLastWave()['nbrSamplesPerSeg']), self.parent.getLastWave()['samplingTime'], frequency * 1e9, intervalMode=intervalMode)
-                print "demodulation time :", (time.time() - t)
-                t = time.time()
-                length = c_long(self.parent.getLastWave()
-                                ['nbrSegmentArray'][0])
-
-                coX = zeros(self.parent.getLastWave()[
-                            'nbrSegmentArray'][0], dtype=c_float)
-                coY = zeros(self.parent.getLastWave()[
-                            'nbrSegmentArray'][0], dtype=c_float)
-
-                coX[:] = components[frequencies[i][2], 0, :]
-                coY[:] = components[frequencies[i][2], 1, :]
-
-                coU = zeros(self.parent.getLastWave()[
-                            'nbrSegmentArray'][0], dtype=c_float)
-                coV = zeros(self.parent.getLastWave()[
-                            'nbrSegmentArray'][0], dtype=c_float)
-
-                clicksf = zeros(self.parent.getLastWave()[
-                                'nbrSegmentArray'][0], dtype=c_float)
-
-                # co=zeros((2,self.parent.getLastWave()['nbrSegmentArray'][0]))
-                # co[0,:]=components[frequencies[i][2],0,:]
-                # co[1,:]=components[frequencies[i][2],1,:]
-
-                #Rotate and count in C
-                #(clicks[index,:],cop)=self.multiplexedBifurcationMapAdd(co,frequency)
-                #Rotate and count in python
-                #(clicks[index,:],cop)=self.multiplexedBifurcationMapAdd(co,frequency)
-
-                [xOffset, yOffset, angle] = self.getCorrections(frequency)
-
-                prob = zeros(1, dtype=c_float)
-
-                self.easyMath.shiftRotate(coX.ctypes.data, coY.ctypes.data, coU.ctypes.data, coV.ctypes.data, c_float(
-                    xOffset), c_float(yOffset), c_float(angle), length)
-                self.easyMath.aboveThreshold(
-                    coU.ctypes.data, clicksf.ctypes.data, c_float(0.), prob.ctypes.data, length)
-
-#        cop=zeros((2,len(co[1])))
-#        for h in range(0,len(co[1])):
-#          cop[0,h]=(co[0,h]-self.Io)*cos(self.r)+(co[1,h]-self.Qo)*sin(self.r)
-#          cop[1,h]=(co[0,h]-self.Io)*sin(self.r)-(co[1,h]-self.Qo)*cos(self.r)
-#          if cop[0,h]>0:clicks[index,h]=1
-#        rotatedComponents[frequencies[i][2],0,:]=cop[0,:]
-#        rotatedComponents[frequencies[i][2],1,:]=cop[1,:]
-
-                rotatedComponents[frequencies[i][2], 0, :] = coU[:]
-                rotatedComponents[frequencies[i][2], 1, :] = coV[:]
-                clicks[index, :] = clicksf[:]
-
-                print "rotation time :" + str(time.time() - t)
-                probabilities[frequencies[i][2]] = prob[0]
-                results['b%i' % frequencies[i][2]
-                        ] = probabilities[frequencies[i][2]]
+        lastWave = self.parent.getLastWave()
+        nbrSegments = lastWave['nbrSegmentArray'][0]
+        active = [frequency for frequency in frequencies if frequency[1]]
+        if not self.useDLLDemodulation:
+            # all the frequencies in one pass; the intervals of a segment are averaged for the clicks
+            self.lastDemodulation = self.numpyDemodulator.demodulate(lastWave['wave'][self.iChannel], lastWave['wave'][self.qChannel],
+                                                                     lastWave['horPos'], nbrSegments, int(lastWave['nbrSamplesPerSeg']),
+                                                                     lastWave['samplingTime'], [frequency[0] * 1e9 for frequency in active],
+                                                                     intervalMode=intervalMode)
+            for frequency, (I, Q) in zip(active, self.lastDemodulation):
+                components[frequency[2], 0, :] = I.mean(axis=1)
+                components[frequency[2], 1, :] = Q.mean(axis=1)
+        else:
+            hp = lastWave['horPos']
+            for frequency in active:
+                (o1, o2, components[frequency[2], 0, :], components[frequency[2], 1, :], o3, o4) = self.demodulate2ChIQ(lastWave['wave'][self.iChannel], lastWave['wave'][
+                    self.qChannel], hp, nbrSegments, int(lastWave['nbrSamplesPerSeg']), lastWave['samplingTime'], frequency[0] * 1e9, intervalMode=intervalMode)
+        print "demodulation time :", (time.time() - t0)
+
+        # Rotate, count the clicks and calculate all probabilities
+        t = time.time()
+        corrections = zeros((self.lenArray, 3))
+        for frequency in active:
+            corrections[frequency[2]] = self.getCorrections(frequency[0])
+        (rotatedComponents, clicks, probabilities, proba, correlations) = acqiris_clicks.countClicks(components, corrections)
+        print "rotation time :" + str(time.time() - t)
+        for frequency in active:
+            results['b%i' % frequency[2]] = probabilities[frequency[2]]
+        for frequency1 in active:
+            for frequency2 in active:
+                if frequency1[2] < frequency2[2]:
+                    results['c%i_%i' % (frequency1[2], frequency2[2])] = correlations[frequency1[2], frequency2[2]]
 
         print 'total demodulation duration: %f sec' % (time.time() - t0)
 
-        # Calculate all probabilities
-
-        nJBA = self.lenArray
-        proba = zeros(2**nJBA, dtype=c_float)
-        nbSegments = self.parent.getLastWave()['nbrSegmentArray'][0]
-        t0 = time.time()
-        tempArray = zeros(nbSegments)
-        for i in range(0, nJBA):
-            for j in range(0, nbSegments):
-                tempArray[j] += clicks[i, j] * 2**i
-        for j in range(0, nbSegments):
-            proba[tempArray[j]] += 1. / nbSegments
-##    self.easyMath.counter(clicks.ctypes.data,proba.ctypes.data, c_int(nJBA), c_long(nbSegments))
         probasInDict = dict()
-        for v in range(0, 2**nJBA):
-            # probasInDict['p%i'%v]=mean([tempArray[i] == v else 0 for i in
-            # range(0,nbSegments) ])
+        for v in range(0, 2**self.lenArray):
             probasInDict['p%i' % v] = proba[v]
 
         if fast:
@@ -0,0 +1,78 @@
+"""
+Vectorized click counting of multiplexed bifurcation readouts, in numpy.
+
+The demodulated components (I, Q) of each readout are shifted and rotated with the corrections of its frequency
+(as easyMath.shiftRotate):
+    U = (I - xOffset) cos(angle) + (Q - yOffset) sin(angle)
+    V = (I - xOffset) sin(angle) - (Q - yOffset) cos(angle)
+and a readout clicks in a segment when U is above the threshold (as easyMath.aboveThreshold).
+The clicks of the n readouts of a segment are packed in the outcome index sum_i click_i 2**i, whose histogram
+(numpy.bincount) gives the 2**n joint probabilities in a single pass over the segments.
+"""
+
+import numpy
+
+
+def shiftRotate(I, Q, xOffset=0., yOffset=0., angle=0.):
+    """
+    Returns the rotated components (U, V) of the components (I, Q) (see module docstring).
+    """
+    c, s = numpy.cos(angle), numpy.sin(angle)
+    x, y = numpy.asarray(I) - xOffset, numpy.asarray(Q) - yOffset
+    return x * c + y * s, x * s - y * c
+
+
+def aboveThreshold(U, threshold=0.):
+    """
+    Returns the clicks (uint8 array of 0 and 1) of the rotated components U.
+    """
+    return (numpy.asarray(U) > threshold).view(numpy.uint8)
+
+
+def outcomeIndices(clicks):
+    """
+    Returns the outcome indices sum_i clicks[i] 2**i of the segments, for the (nbrReadouts, nbrSegments) clicks array.
+    """
+    clicks = numpy.asarray(clicks)
+    if clicks.shape[0] > 62:
+        raise ValueError('Cannot pack the clicks of more than 62 readouts.')
+    return numpy.dot(2 ** numpy.arange(clicks.shape[0], dtype=numpy.int64), clicks.astype(numpy.int64))
+
+
+def jointProbabilities(clicks):
+    """
+    Returns the array of the 2**nbrReadouts joint probabilities of the outcomes, indexed by the outcome index.
+    """
+    clicks = numpy.asarray(clicks)
+    nbrReadouts, nbrSegments = clicks.shape
+    if nbrSegments == 0:
+        return numpy.zeros(2 ** nbrReadouts)
+    return numpy.bincount(outcomeIndices(clicks), minlength=2 ** nbrReadouts) / float(nbrSegments)
+
+
+def correlators(clicks):
+    """
+    Returns the (nbrReadouts, nbrReadouts) matrix of the pairwise correlators <c_i c_j> - <c_i><c_j> of the clicks.
+    """
+    clicks = numpy.asarray(clicks, dtype=float)
+    nbrSegments = max(clicks.shape[1], 1)
+    probabilities = clicks.sum(axis=1) / nbrSegments
+    return numpy.dot(clicks, clicks.T) / nbrSegments - numpy.outer(probabilities, probabilities)
+
+
+def countClicks(components, corrections, threshold=0.):
+    """
+    Rotates the (nbrReadouts, 2, nbrSegments) components of the readouts with corrections, the list of their
+    (xOffset, yOffset, angle), and counts the clicks.
+    Returns (rotatedComponents, clicks, probabilities, jointProbabilities, correlators).
+    """
+    components = numpy.asarray(components)
+    corrections = numpy.asarray(corrections, dtype=float).reshape(-1, 3)
+    x = components[:, 0, :] - corrections[:, 0:1]
+    y = components[:, 1, :] - corrections[:, 1:2]
+    c, s = numpy.cos(corrections[:, 2:3]), numpy.sin(corrections[:, 2:3])
+    rotatedComponents = numpy.empty(components.shape)
+    rotatedComponents[:, 0, :] = x * c + y * s
+    rotatedComponents[:, 1, :] = x * s - y * c
+    clicks = aboveThreshold(rotatedComponents[:, 0, :], threshold)
+    return (rotatedComponents, clicks, clicks.mean(axis=1), jointProbabilities(clicks), correlators(clicks))
@@ -0,0 +1,131 @@
+"""
+Portable multi-frequency demodulation of the Acqiris sequences, in numpy.
+
+The segments of the I and Q channels of a sequence (ChA and ChB, concatenated segment after segment as in
+acqiris.getLastWave()['wave']) are demodulated at all the requested frequencies in a single pass: each channel is viewed
+as a (nbrSegments, nbrSamplesPerSegment) matrix and multiplied by a weight matrix whose columns hold the cosine and sine
+of every demodulation interval of every frequency, so that the work is done by two matrix products.
+For the sample k of the segment s, at time t = horPos[s] + k * samplingTime with respect to the trigger, the complex
+component demodulated over an interval of L samples is
+    I + iQ = 1/L sum (ChA + i ChB) exp(-i (2 pi f t + phase))
+the phase of the trigger position being applied to the result of the product, segment by segment.
+The intervals follow the intervalMode convention of the demodulation DLL:
+  * intervalMode > 0: intervals of intervalMode half-periods, as many as the segment can hold (if possible, otherwise 0);
+  * 0: one interval of the maximum integer number of half-periods in the segment (if possible, otherwise -1);
+  * -1: one interval with the full segment length.
+The weight matrices are cached, so that repeated acquisitions with the same configuration do not reallocate them.
+"""
+
+import math
+import numpy
+
+
+def demodulationIntervals(nbrSamplesPerSegment, samplingTime, frequency, intervalMode=-1):
+    """
+    Returns (nbrSamplesPerInterval, nbrIntervalsPerSegment) for the given intervalMode (see module docstring).
+    """
+    if frequency != 0:
+        nbrSamplesPerHalfPeriod = 1. / (2 * samplingTime * abs(frequency))
+    else:
+        nbrSamplesPerHalfPeriod = 1.
+    if intervalMode > 0:
+        nbrSamplesPerInterval = int(nbrSamplesPerHalfPeriod * intervalMode)
+        if 0 < nbrSamplesPerInterval <= nbrSamplesPerSegment:
+            return nbrSamplesPerInterval, nbrSamplesPerSegment // nbrSamplesPerInterval
+        intervalMode = 0
+    if intervalMode == 0:
+        nbrSamplesPerInterval = int(nbrSamplesPerHalfPeriod * int(nbrSamplesPerSegment / nbrSamplesPerHalfPeriod) + 0.5)
+        if 0 < nbrSamplesPerInterval <= nbrSamplesPerSegment:
+            return nbrSamplesPerInterval, 1
+    return nbrSamplesPerSegment, 1
+
+
+class MultiFrequencyDemodulator(object):
+    """
+    Demodulates the segments of a sequence at several frequencies in one pass (see module docstring).
+    """
+
+    def __init__(self, maxCachedWeights=8, chunkSize=4096):
+        self.maxCachedWeights = maxCachedWeights
+        self.chunkSize = chunkSize          # number of segments multiplied at once (bounds the temporary arrays)
+        self._weights = dict()              # {(nbrSamplesPerSegment, samplingTime, frequencies, intervalMode): weights}
+
+    def weights(self, nbrSamplesPerSegment, samplingTime, frequencies, intervalMode=-1):
+        """
+        Returns (weights, layout) where weights is the (nbrSamplesPerSegment, 2 * nbrColumns) matrix of the cosines
+        and sines of all the intervals of all the frequencies divided by the interval lengths, and layout the list
+        [(first column, nbrIntervalsPerSegment)] of the frequencies.
+        """
+        key = (int(nbrSamplesPerSegment), float(samplingTime), tuple(frequencies), intervalMode)
+        if key in self._weights:
+            return self._weights[key]
+        layout = []
+        nbrColumns = 0
+        for frequency in frequencies:
+            nbrSamplesPerInterval, nbrIntervals = demodulationIntervals(nbrSamplesPerSegment, samplingTime, frequency,
+                                                                        intervalMode)
+            layout.append((nbrColumns, nbrIntervals, nbrSamplesPerInterval))
+            nbrColumns += nbrIntervals
+        weights = numpy.zeros((nbrSamplesPerSegment, 2 * nbrColumns))
+        angles = 2 * math.pi * samplingTime * numpy.arange(nbrSamplesPerSegment)
+        for frequency, (column, nbrIntervals, nbrSamplesPerInterval) in zip(frequencies, layout):
+            for j in range(nbrIntervals):
+                samples = slice(j * nbrSamplesPerInterval, (j + 1) * nbrSamplesPerInterval)
+                weights[samples, column + j] = numpy.cos(frequency * angles[samples]) / nbrSamplesPerInterval
+                weights[samples, nbrColumns + column + j] = numpy.sin(frequency * angles[samples]) / nbrSamplesPerInterval
+        layout = [(column, nbrIntervals) for column, nbrIntervals, nbrSamplesPerInterval in layout]
+        if len(self._weights) >= self.maxCachedWeights:
+            self._weights.clear()
+        self._weights[key] = (weights, layout)
+        return weights, layout
+
+    def demodulate(self, chA, chB, horPos, nbrSegments, nbrSamplesPerSegment, samplingTime, frequencies, phase=0.,
+                   intervalMode=-1):
+        """
+        Demodulates the nbrSegments segments of chA (I) and chB (Q, or None for a single channel) at all frequencies.
+        horPos is the array of the trigger positions of the segments (or None).
+        Returns the list of the (I, Q) pairs of (nbrSegments, nbrIntervalsPerSegment) arrays of the frequencies.
+        """
+        nbrSegments, nbrSamplesPerSegment = int(nbrSegments), int(nbrSamplesPerSegment)
+        frequencies = [float(frequency) for frequency in frequencies]
+        weights, layout = self.weights(nbrSamplesPerSegment, samplingTime, frequencies, intervalMode)
+        nbrColumns = weights.shape[1] // 2
+        segmentsA = numpy.asarray(chA)[:nbrSegments * nbrSamplesPerSegment].reshape(nbrSegments, nbrSamplesPerSegment)
+        segmentsB = None
+        if chB is not None:
+            segmentsB = numpy.asarray(chB)[:nbrSegments * nbrSamplesPerSegment].reshape(nbrSegments, nbrSamplesPerSegment)
+        components = numpy.empty((nbrSegments, nbrColumns), dtype=complex)
+        for start in range(0, nbrSegments, self.chunkSize):
+            stop = min(start + self.chunkSize, nbrSegments)
+            productA = numpy.dot(segmentsA[start:stop], weights)
+            # (A + iB)(cos - i sin) = A cos + B sin + i (B cos - A sin)
+            components.real[start:stop] = productA[:, :nbrColumns]
+            components.imag[start:stop] = -productA[:, nbrColumns:]
+            if segmentsB is not None:
+                productB = numpy.dot(segmentsB[start:stop], weights)
+                components.real[start:stop] += productB[:, nbrColumns:]
+                components.imag[start:stop] += productB[:, :nbrColumns]
+        results = []
+        for frequency, (column, nbrIntervals) in zip(frequencies, layout):
+            frequencyComponents = components[:, column:column + nbrIntervals]
+            if horPos is not None or phase:
+                offsets = numpy.zeros(nbrSegments) if horPos is None else numpy.asarray(horPos)[:nbrSegments]
+                frequencyComponents = frequencyComponents * \
+                    numpy.exp(-1j * (2 * math.pi * frequency * offsets + phase))[:, numpy.newaxis]
+            results.append((frequencyComponents.real.copy(), frequencyComponents.imag.copy()))
+        return results
+
+    def demodulate2ChIQ(self, ChA, ChB, horPos, nbrSegments, nbrSamplesPerSegment, samplingTime, frequency, phase=0,
+                        intervalMode=-1, averageOnly=False):
+        """
+        Single frequency demodulation with the outputs of ModuleDLL2.demodulate2ChIQ:
+        (nbrSegments, nbrIntervalsPerSegment, arrayI, arrayQ, arrayMeanI, arrayMeanQ).
+        """
+        I, Q = self.demodulate(ChA, ChB, horPos, nbrSegments, nbrSamplesPerSegment, samplingTime, [frequency], phase,
+                               intervalMode)[0]
+        nbrIntervals = I.shape[1]
+        if averageOnly:
+            arrayI, arrayQ = numpy.zeros(1, dtype=numpy.float32), numpy.zeros(1, dtype=numpy.float32)
+        else:
+            arrayI, arrayQ = I.ravel().astype(numpy.float32), Q.ravel().astype(numpy.float32)
+        return (int(nbrSegments), nbrIntervals, arrayI, arrayQ, I.mean(axis=0), Q.mean(axis=0))
@@ -0,0 +1,196 @@
+"""
+Ring of preallocated acquisition buffers of the Acqiris digitizer.
+
+An AcquisitionRing runs the acquisitions and transfers in a background thread, each of them into one of a few
+preallocated AcquisitionBuffers, while the script processes the previous acquisition:
+    ring = acqiris.acquisitionRing(nbrBuffers=2, wantedChannels=15)
+    for wave in ring.acquisitions(100):
+        process(wave)         # the acquisition of the next batch runs meanwhile
+    print ring.statistics()
+The waves given to the consumer are dictionaries with the keys of acqiris.getLastWave(), whose arrays are read-only
+views of the buffer. A buffer is given back to the acquisition thread when the consumer asks for the next acquisition,
+so that a consumer keeping data beyond that point must copy it.
+"""
+
+import time
+import threading
+import Queue
+
+import numpy
+
+
+def readOnly(array):
+    """
+    Returns a read-only view of array.
+    """
+    view = array.view()
+    view.flags.writeable = False
+    return view
+
+
+class AcquisitionBuffer(object):
+    """
+    Preallocated arrays of an acquisition: waves (4 channels), horPos, timeStamps and nbrSegmentsArray.
+    """
+
+    def __init__(self, waveSizes, horPosSize, timeStampsSize):
+        self.waveSizes = numpy.array(waveSizes, dtype=numpy.int32)
+        self.waves = [numpy.zeros(max(size, 1), dtype=numpy.float64) for size in waveSizes]
+        self.horPos = numpy.zeros(max(horPosSize, 1), dtype=numpy.float64)
+        self.timeStamps = numpy.zeros(max(timeStampsSize, 1), dtype=numpy.float64)
+        self.nbrSegmentsArray = numpy.zeros(4, dtype=numpy.int32)
+        self.info = dict()
+
+    def fits(self, waveSizes, horPosSize, timeStampsSize):
+        """
+        Returns True if the buffer has the given sizes.
+        """
+        return list(self.waveSizes) == list(waveSizes) and len(self.horPos) == max(horPosSize, 1) and \
+            len(self.timeStamps) == max(timeStampsSize, 1)
+
+    def view(self):
+        """
+        Returns the acquisition as a dictionary with the keys of acqiris.getLastWave() and read-only arrays.
+        """
+        wave = dict(self.info)
+        wave['waveSizes'] = readOnly(self.waveSizes)
+        wave['wave'] = [readOnly(array) for array in self.waves]
+        wave['horPos'] = readOnly(self.horPos)
+        wave['timeStamps'] = readOnly(self.timeStamps)
+        wave['nbrSegmentArray'] = readOnly(self.nbrSegmentsArray)
+        return wave
+
+
+class AcquisitionRing(object):
+    """
+    Runs fill(buffer), acquiring and transferring into buffer, in a background thread over a ring of buffers
+    (see module docstring).
+    """
+
+    def __init__(self, fill, buffers):
+        self._fill = fill
+        self.buffers = list(buffers)
+        self._free = Queue.Queue()
+        self._filled = Queue.Queue()
+        self._current = None
+        self._stop = threading.Event()
+        self._thread = None
+        self.acquisitionTime = 0.
+        self.processingTime = 0.
+        self.waitingTime = 0.
+        self.count = 0
+        self._t0 = None
+        self._t1 = None
+        self._lastDelivery = None
+
+    def start(self, nbrAcquisitions=None):
+        """
+        Starts the acquisitions (endless if nbrAcquisitions is None, until stop()).
+        """
+        if self._thread is not None:
+            raise RuntimeError('The acquisition ring is already running.')
+        self._stop.clear()
+        self._free, self._filled = Queue.Queue(), Queue.Queue()
+        for buffer in self.buffers:
+            self._free.put(buffer)
+        self._current = None
+        self.acquisitionTime = self.processingTime = self.waitingTime = 0.
+        self.count = 0
+        self._t0, self._t1 = time.time(), None
+        self._lastDelivery = None
+        self._thread = threading.Thread(target=self._run, args=(nbrAcquisitions,), name='AcquisitionRing')
+        self._thread.daemon = True
+        self._thread.start()
+        return self
+
+    def _run(self, nbrAcquisitions):
+        i = 0
+        while not self._stop.isSet() and (nbrAcquisitions is None or i < nbrAcquisitions):
+            try:
+                buffer = self._free.get(timeout=0.1)
+            except Queue.Empty:
+                continue
+            t0 = time.time()
+            try:
+                self._fill(buffer)
+            except Exception as error:
+                self._filled.put(error)
+                break
+            self.acquisitionTime += time.time() - t0
+            self._filled.put(buffer)
+            i += 1
+        self._filled.put(None)              # end of the acquisitions
+
+    def next(self, timeout=None):
+        """
+        Gives back the buffer of the previous acquisition and returns the view of the next one
+        (None when the acquisitions are over).
+        """
+        now = time.time()
+        if self._lastDelivery is not None:
+            self.processingTime += now - self._lastDelivery
+        if self._current is not None:
+            self._free.put(self._current)
+            self._current = None
+        try:
+            buffer = self._filled.get(timeout=timeout)
+        except Queue.Empty:
+            raise RuntimeError('No acquisition after %s s.' % timeout)
+        self._lastDelivery = time.time()
+        self.waitingTime += self._lastDelivery - now
+        if buffer is None:
+            self._lastDelivery = None
+            self._thread = None
+            self._t1 = self._t1 or time.time()
+            return None
+        if isinstance(buffer, Exception):
+            self._thread = None
+            raise buffer
+        self._current = buffer
+        self.count += 1
+        return buffer.view()
+
+    def acquisitions(self, nbrAcquisitions=None, timeout=None):
+        """
+        Starts the ring and yields the views of nbrAcquisitions acquisitions.
+        """
+        self.start(nbrAcquisitions)
+        try:
+            while True:
+                wave = self.next(timeout)
+                if wave is None:
+                    return
+                yield wave
+        finally:
+            self.stop()
+
+    def stop(self):
+        """
+        Stops the acquisitions after the current one.
+        """
+        self._stop.set()
+        if self._current is not None:
+            self._free.put(self._current)
+            self._current = None
+        thread = self._thread
+        if thread is not None:
+            thread.join()
+            self._thread = None
+        self._lastDelivery = None
+        if self._t0 is not None:
+            self._t1 = self._t1 or time.time()
+
+    def statistics(self):
+        """
+        Returns {'acquisitions', 'elapsed', 'acquisitionTime', 'processingTime', 'waitingTime', 'throughput', 'overlap'}
+        where overlap is the fraction of the shorter of the acquisition and processing times that ran concurrently
+        with the other one.
+        """
+        elapsed = (self._t1 or time.time()) - self._t0 if self._t0 is not None else 0.
+        shorter = min(self.acquisitionTime, self.processingTime)
+        overlap = 0.
+        if shorter > 0:
+            overlap = min(max((self.acquisitionTime + self.processingTime - elapsed) / shorter, 0.), 1.)
+        return {'acquisitions': self.count, 'elapsed': elapsed, 'acquisitionTime': self.acquisitionTime,
+                'processingTime': self.processingTime, 'waitingTime': self.waitingTime,
+                'throughput': self.count / elapsed if elapsed else 0., 'overlap': overlap}
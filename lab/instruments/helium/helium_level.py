@@ -2,16 +2,15 @@ import sys
 import getopt
 
 from application.lib.instrum_classes import *
+from application.lib.socket_pool import readOnConnect
 
 
 class Instr(Instrument):
 
     def heliumLevel(self):
+        # the server sends the helium level on each new connection
         try:
-            sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-            sock.settimeout(0.5)
-            sock.connect((self.host, self.port))
-            return float(sock.recv(1024))
+            return float(readOnConnect(self.host, self.port, timeout=0.5))
         except:
             return None
 
@@ -5,6 +5,7 @@ sys.path.append('.')
 sys.path.append('../')
 
 from application.lib.instrum_classes import *
+from application.lib.timeseries_store import timeSeries
 from application.lib.instrum_panel import FrontPanel
 from application.ide.mpl.canvas import MyMplCanvas as Canvas
 from application.ide.widgets.numericedit import *
@@ -25,20 +26,25 @@ class Panel(FrontPanel):
         if property == "heliumLevel":
             self.updateHeliumLevel(value)
 
+    def setWindow(self, window):
+        """
+        Sets the displayed history (in s), which can span days (see application.lib.timeseries_store).
+        """
+        self.window = window
+
     def updateHeliumLevel(self, l):
         if l is None:
             return
         newTime = time.time()
-        self.heliumLevels.append(l)
-        self.times.append(newTime)
-        while len(self.heliumLevels) > 200:
-            self.heliumLevels.pop(0)
-            self.times.pop(0)
-        self.canvas.axes.clear()
-        self.canvas.axes.plot(self.times, self.heliumLevels)
-        self.canvas.axes.set_xticks((self.times[0], self.times[-1]))
-        xAxis = self.canvas.axes.xaxis
-        xAxis.set_major_formatter(ticker.FuncFormatter(self.formatDate))
+        self.heliumLevels.append(l, newTime)
+        times, heliumLevels = self.heliumLevels.query(newTime - self.window, maxPoints=self.maxPoints)
+        # update the data of the existing line instead of clearing and replotting the axes
+        self.heliumLevelLine.set_data(times, heliumLevels)
+        axes = self.canvas.axes
+        axes.set_xlim(times[0], max(times[-1], times[0] + 1))
+        axes.relim()
+        axes.autoscale_view(scalex=False)
+        axes.set_xticks((times[0], times[-1]))
         self.canvas.draw()
         if l < 30:
             warning = "<br><font size=\"10\"color=\"red\"><blink><b>Refill Helium!</b></blink></font>"
@@ -52,15 +58,18 @@ class Panel(FrontPanel):
         self.title = QLabel(instrument.name())
         self.title.setAlignment(Qt.AlignCenter)
         self.title.setStyleSheet("QLabel {font:18px;}")
-        self.heliumLevels = []
-        self.times = []
-        self.gliding = []
+        # readings kept in a bounded multi-resolution store (saved if directories.monitoring is set)
+        self.heliumLevels = timeSeries(instrument.name() + '_heliumLevel')
+        self.window = 2000                  # displayed history in s
+        self.maxPoints = 500                # maximum number of points displayed
 
         self.heliumLevel = QLabel("Please wait, fetching helium level...")
         self.heliumLevel.setAlignment(Qt.AlignCenter)
         self.heliumLevel.setStyleSheet("QLabel {font:14px;}")
         self.canvas = Canvas(dpi=100)
         self.canvas.setFixedHeight(150)
+        self.heliumLevelLine, = self.canvas.axes.plot([], [])
+        self.canvas.axes.xaxis.set_major_formatter(ticker.FuncFormatter(self.formatDate))
 
         self.grid = QGridLayout(self)
         self.interval = 10000
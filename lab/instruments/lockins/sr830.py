@@ -1,7 +1,9 @@
 
 # imports
+import time
 import numpy as np
 from application.lib.instrum_classes import *
+from application.lib.datacube import Datacube
 
 
 class Instr(VisaInstrument):
@@ -22,6 +24,14 @@ class Instr(VisaInstrument):
     filterSlopes = [6, 12, 18, 24]
     parameters = {'x': 1, 'y': 2, 'r': 3, 't': 4, 'auxIn1': 5, 'auxIn2': 6,
                   'auxIn3': 7, 'auxIn4': 8, 'f': 9, 'ch1': 10, 'ch2': 11}
+    # settings cached by VisaInstrument.write/ask (see application.lib.visa_cache);
+    # FREQ is not cached as it is measured in external reference mode.
+    cachedSettings = ['PHAS', 'FMOD', 'SLVL', 'HARM', 'RSLP', 'ISRC', 'ICPL', 'ILIN', 'SENS', 'OFLT', 'OFSL']
+    cacheInvalidations = [('AGAN', 'SENS'), ('APHS', 'PHAS'), ('AOFF', None)]
+    # data buffer
+    sampleRates = [0.0625 * 2 ** i for i in range(14)]      # in Hz, for SRAT 0 to 13
+    bufferDisplays = [['x', 'r', 'xNoise', 'auxIn1', 'auxIn2'], ['y', 't', 'yNoise', 'auxIn3', 'auxIn4']]
+    bufferSize = 16383                                      # points per channel
 
     # Reference and phase commands
 
@@ -317,3 +327,90 @@ class Instr(VisaInstrument):
         Returns the list of R and Theta.
         """
         return self.measure(['ch1', 'ch2'])
+
+    # buffered acquisition
+
+    def configureBuffer(self, sampleRate=512., ch1='x', ch2='y'):
+        """
+        Configures the data buffer to store ch1 in {'x', 'r', 'xNoise', 'auxIn1', 'auxIn2'} and ch2 in
+        {'y', 't', 'yNoise', 'auxIn3', 'auxIn4'} at the internal sample rate closest above sampleRate (62.5 mHz to 512 Hz),
+        in one shot mode (the acquisition stops when the buffer is full).
+        Returns the sample rate in Hz.
+        """
+        index = min(np.searchsorted(self.sampleRates, sampleRate), len(self.sampleRates) - 1)
+        self.write('DDEF 1,%i,0;DDEF 2,%i,0' % (self.bufferDisplays[0].index(ch1), self.bufferDisplays[1].index(ch2)))
+        self.write('SRAT %i;SEND 0;TSTR 0' % index)
+        return self.sampleRates[index]
+
+    def startBuffer(self):
+        """
+        Resets the data buffer and starts the acquisition.
+        Returns the time of the start, to which the time of the point i is time + i / sample rate.
+        """
+        t0 = time.time()
+        self.write('REST;STRT')
+        return (t0 + time.time()) / 2
+
+    def pauseBuffer(self):
+        self.write('PAUS')
+
+    def bufferedPoints(self):
+        """
+        Returns the number of points stored in the data buffer.
+        """
+        return int(self.ask('SPTS?'))
+
+    def readBuffer(self, channel, start, count):
+        """
+        Returns as a numpy array the count points of the data buffer of channel (1 or 2) starting at index start.
+        The points are transferred in the fast non normalized binary format of TRCL? (2 bytes of mantissa and 2 bytes
+        of exponent per point).
+        """
+        if count <= 0:
+            return np.zeros(0)
+        self.write('TRCL? %i,%i,%i' % (channel, start, count))
+        words = np.frombuffer(self.read_raw(), dtype='<i2', count=2 * count).reshape(count, 2)
+        return np.ldexp(words[:, 0].astype(float), words[:, 1].astype(int) - 124)
+
+    def acquireBuffered(self, duration=None, points=None, sampleRate=512., ch1='x', ch2='y', cube=None, interval=0.1,
+                        slack=2.):
+        """
+        Acquires ch1 and ch2 through the data buffer (see configureBuffer) during duration seconds or for points points
+        (at most bufferSize), and returns the datacube cube (new datacube if None) with the columns t (in s from the
+        first point, on the sample clock), ch1 and ch2.
+        Points are transferred every interval seconds while the buffer fills, and appended to cube at once.
+        Raises OperationTimeoutError if the points are not acquired slack seconds (plus 10%) after the time they should
+        take at the sample rate (lost trigger, buffer paused or reset...), the points read so far being kept in cube.
+        """
+        rate = self.configureBuffer(sampleRate=sampleRate, ch1=ch1, ch2=ch2)
+        if points is None:
+            points = int(round(duration * rate)) if duration is not None else self.bufferSize
+        points = min(points, self.bufferSize)
+        if cube is None:
+            cube = Datacube('sr830 buffer')
+        cube.setParameters({'sampleRate': rate, 'ch1': ch1, 'ch2': ch2})
+        offset = len(cube)
+        for name in ['t', ch1, ch2]:
+            cube.createCol(name=name, notify=False)
+        cube.extendTo(rowIndex=offset + points - 1)
+        cube.notify('names', cube.names())
+        start = self.startBuffer()
+        cube.setParameter('startTime', start)
+        read = 0
+        deadline = start + 1.1 * points / rate + slack
+        while read < points:
+            time.sleep(max(0., min(start + float(read) / rate + interval, deadline) - time.time()))
+            count = min(self.bufferedPoints(), points) - read
+            if count <= 0:
+                if time.time() > deadline:
+                    self.pauseBuffer()
+                    raise OperationTimeoutError('%s buffer stopped at %i of %i points.' % (self.name(), read, points))
+                time.sleep(1. / rate)
+                continue
+            cube.createCol(name='t', offsetRow=offset + read, values=np.arange(read, read + count) / rate, notify=False)
+            cube.createCol(name=ch1, offsetRow=offset + read, values=self.readBuffer(1, read, count), notify=False)
+            cube.createCol(name=ch2, offsetRow=offset + read, values=self.readBuffer(2, read, count), notify=False)
+            read += count
+            cube.notify('commit')
+        self.pauseBuffer()
+        return cube
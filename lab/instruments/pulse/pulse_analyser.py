@@ -134,8 +134,7 @@ class Instr(Instrument):
         try:
             self._calibration = Datacube()
             self._calibration.setName('analyser IQ mixer Calibration')
-            self._calibration.loadtxt(register.parameters()[
-                                      '%s Cal' % self._name])
+            self._calibration.loadtxt(register['%s Cal' % self._name])
         except:
             pass
         self._Ilist = []
@@ -97,7 +97,131 @@ class Marker:
             stop2 = stop1
         self._shape2[:] = getattr(generatorFunctionLib, 'square')(
             self._numberOfPoints, self._samplingTime, start2, stop2, amplitude=2)
-        self.markerArray = [sum(i)for i in zip(self._shape1, self._shape2)]
+        self.markerArray = self._shape1 + self._shape2
+
+
+class SequenceCompiler:
+    """
+    Renders the pulses and markers of a pulse generator into preallocated buffers:
+      - the sideband carriers generated by the IQ mixer are cached per (IF, length, c, phi);
+      - each pulse contribution is kept with the state it was rendered with (envelope, frequency, phase, corrections),
+        so that only the pulses that changed since the last compilation are re-rendered;
+      - markers are summed and clipped for all markers of a channel at once.
+    The returned sequence is a buffer reused at each compilation: copy it to keep a previous sequence.
+    Call clearCache() after modifying the envelope of a pulse in place.
+    """
+
+    maxCarriers = 64
+
+    def __init__(self, pulseGenerator):
+        self._pulseGenerator = pulseGenerator
+        self._length = None
+        self.clearCache()
+
+    def clearCache(self):
+        """
+        Forgets the cached carriers and pulse contributions.
+        """
+        self._carriers = dict()     # {(IF, length, c, phi): carrier}
+        self._rendered = dict()     # {pulse: (state, envelope, contribution)}
+
+    def _allocate(self, length):
+        if length != self._length:
+            self.clearCache()
+            self._length = length
+            self._sequence = zeros(length, dtype=numpy.complex128)
+
+    def carrier(self, IF, length, c=0, phi=0):
+        """
+        Returns the sideband carrier of the mixer for IF and the corrections c and phi, generating it only once.
+        """
+        key = (IF, length, c, phi)
+        if key not in self._carriers:
+            if len(self._carriers) >= self.maxCarriers:
+                self._carriers.clear()
+            self._carriers[key] = self._pulseGenerator._mixer.generateSidebandWaveform(
+                IF=IF, c=c, phi=phi, length=length, useCalibIfNone=False)
+        return self._carriers[key]
+
+    def _sidebandCorrection(self, carrierFrequency, IF, applyCorrection):
+        if not applyCorrection:
+            return (0., 0.)
+        try:
+            c, phi = self._pulseGenerator._mixer.sidebandCorrection(carrierFrequency, IF)
+            return (float(c), float(phi))
+        except Exception as e:
+            print e
+            return (0., 0.)
+
+    def _render(self, pulse, state, out):
+        """
+        Private method rendering the contribution of pulse in out according to its state.
+        """
+        mode = state[0]
+        if mode == "IQMixer":
+            IF, c, phi, phase = state[1:]
+            multiply(pulse._pulseArray, self.carrier(IF, self._length, c, phi), out)
+            out *= exp(1.j * phase)
+        elif mode == "SimpleMixer":
+            out[:] = pulse._pulseArray
+        elif mode is None:
+            if state[1] and hasattr(self._pulseGenerator, "pulseCorrectionFunction"):
+                out[:] = self._pulseGenerator.pulseCorrectionFunction(pulse._pulseArray)
+            else:
+                if state[1]:
+                    print self._pulseGenerator.name(), ": no correction function found for DC pulses"
+                out[:] = pulse._pulseArray
+        else:
+            out[:] = 0
+
+    def compile(self, pulses, modulationMode, carrierFrequency=0, applyCorrection=False):
+        """
+        Returns the sum of the contributions of the pulses that are on, re-rendering only the modified ones.
+        """
+        self._allocate(self._pulseGenerator.numberOfPoints())
+        corrections = dict()
+        states = []
+        for pulse in pulses:
+            if not(pulse.pulseOn):
+                continue
+            if modulationMode == "IQMixer":
+                if pulse.frequency is None:
+                    pulse.frequency = carrierFrequency
+                IF = pulse.frequency - carrierFrequency
+                if IF not in corrections:
+                    corrections[IF] = self._sidebandCorrection(carrierFrequency, IF, applyCorrection)
+                state = (modulationMode, IF) + corrections[IF] + (pulse.phase,)
+            else:
+                state = (modulationMode, applyCorrection)
+            states.append((pulse, state))
+        rendered = dict()
+        self._sequence[:] = 0
+        for pulse, state in states:
+            previous = self._rendered.get(pulse)
+            if previous is not None and previous[0] == state and previous[1] is pulse._pulseArray:
+                contribution = previous[2]
+            else:
+                if previous is not None:
+                    contribution = previous[2]
+                else:
+                    contribution = zeros(self._length, dtype=numpy.complex128)
+                self._render(pulse, state, contribution)
+            rendered[pulse] = (state, pulse._pulseArray, contribution)
+            self._sequence += contribution
+        self._rendered = rendered
+        return self._sequence
+
+    def compileMarkers(self, markers, out):
+        """
+        Fills out with the sum of the markers, each of the two marker shapes being clipped to its level (1 and 2).
+        """
+        if len(markers) == 0:
+            out[:] = 0
+            return out
+        shapes1 = numpy.array([marker._shape1 for marker in markers])
+        shapes2 = numpy.array([marker._shape2 for marker in markers])
+        out[:] = minimum(shapes1.sum(axis=0), 1) + minimum(shapes2.sum(axis=0), 2)
+        return out
 
 
 class Instr(Instrument):
@@ -328,6 +452,14 @@ class Instr(Instrument):
                                          start1=start1, stop1=stop1),)
         self.debugPrint("markerAdded")
 
+    def sequenceCompiler(self):
+        """
+        Returns the SequenceCompiler rendering the pulses and markers of this generator.
+        """
+        if not hasattr(self, "_sequenceCompiler"):
+            self._sequenceCompiler = SequenceCompiler(self)
+        return self._sequenceCompiler
+
     def preparePulseSequence(self):
         """
           Generates the sample values of each pulse waveform channels and markers in pulseList and markersList, and adds them to form a single waveform per channel.
@@ -344,101 +476,33 @@ class Instr(Instrument):
             pulse.applyCorrections for pulse in self.pulseList]
         applyCorrection = True in applyCorrectionsArray
 
-        # Define self.pulseSequenceArray
-        self.pulseSequenceArray = zeros(
-            self.numberOfPoints(), dtype=numpy.complex128)
         self._offsets = [None, None]
-
-        for pulse in self.pulseList:
-            if not(pulse.pulseOn):
-                continue
-            correctedPulseArray = zeros(
-                self.numberOfPoints(), dtype=numpy.complex128)
-
-            if self._params["modulationMode"] == "IQMixer":
-                if pulse.frequency is None:
-                    pulse.frequency = carrierFrequency
-                IF = pulse.frequency - carrierFrequency
-                # if applyCorrection:
-                #  calibrationParameters=self._mixer.calibrationParameters(f_sb=pulse.frequency-carrierFrequency, f_c=carrierFrequency)
-                # self.debugPrint(calibrationParameters)
-                #  sidebandPulse=self._mixer.generateSidebandWaveform(f_sb = f_sb,c = calibrationParameters['c'],phi = calibrationParameters['phi'],length=self.numberOfPoints())
-                #  self._offsets=[calibrationParameters["i0"],calibrationParameters["q0"]]
-                # else:
-                #  sidebandPulse = exp(-1.j*(2.0*math.pi*f_sb*arange(0,self.numberOfPoints())))
-                sidebandPulse = self._mixer.generateSidebandWaveform(
-                    IF=IF, useCalibIfNone=applyCorrection, length=self.numberOfPoints())
-                correctedPulseArray[:] = pulse._pulseArray * \
-                    sidebandPulse * exp(1.j * pulse.phase)
-
-            elif self._params["modulationMode"] == "SimpleMixer":
-                if applyCorrection:
-                    self._offsets = [self._mixer.calibrationParameters()]
-                else:
-                    self._offsets[0] = 0
-                correctedPulseArray[:] = pulse._pulseArray
-
-            elif self._params["modulationMode"] == "InternalModulation":
-                print "not configured yet"
-
-            elif self._params["modulationMode"] is None:
-                if applyCorrection:
-                    if hasattr(self, "pulseCorrectionFunction"):
-                        correctedPulseArray[:] = self.pulseCorrectionFunction(
-                            pulse._pulseArray)
-                    else:
-                        print self.name(), ": no correction function found for DC pulses"
-                        correctedPulseArray[:] = pulse._pulseArray
-                else:
-                    correctedPulseArray[:] = pulse._pulseArray
+        mode = self._params["modulationMode"]
+        if mode == "SimpleMixer" and True in [pulse.pulseOn for pulse in self.pulseList]:
+            if applyCorrection:
+                self._offsets = [self._mixer.calibrationParameters()]
             else:
-                print "bad modulationMode"
+                self._offsets[0] = 0
+        elif mode == "InternalModulation":
+            print "not configured yet"
+        elif mode not in ["IQMixer", "SimpleMixer", None]:
+            print "bad modulationMode"
 
-            self.pulseSequenceArray[:] += correctedPulseArray[:]
+        self.pulseSequenceArray = self.sequenceCompiler().compile(
+            self.pulseList, mode, carrierFrequency, applyCorrection)
 
     def prepareMarkerSequence(self):
         """
           concatenates the markers. If it is a 2 channel mixer (i.e. an IQ mixer) and markers list for the second cannel is empty, markersList2=(), then the first on is copied to it (i.e markersList2=markersList1)
         """
-        # first prepare the markers for the first channel of the pulse
-        # generaton
-        markerSequence1shape1 = zeros(self.numberOfPoints(), dtype=numpy.int8)
-        markerSequence1shape2 = zeros(self.numberOfPoints(), dtype=numpy.int8)
-        for marker in self.markersList1:
-            markerSequence1shape1[:] += marker._shape1
-            markerSequence1shape2[:] += marker._shape2
-
-        # take care of marker ovelap
-        for i in range(len(markerSequence1shape1)):
-            if markerSequence1shape1[i] > 1:
-                markerSequence1shape1[i] = 1
-            if markerSequence1shape2[i] > 2:
-                markerSequence1shape2[i] = 2
-
-        self.markerArray1[:] = [sum(i)for i in zip(
-            markerSequence1shape1[:], markerSequence1shape2[:])]
+        compiler = self.sequenceCompiler()
+        compiler.compileMarkers(self.markersList1, self.markerArray1)
 
         # if there are 2 channels the second one is prepared here
         if self.markersChannels == 2:
-
-            markerSequence2shape1 = zeros(
-                self.numberOfPoints(), dtype=numpy.int)
-            markerSequence2shape2 = zeros(
-                self.numberOfPoints(), dtype=numpy.int)
-
             if self.markersList2 == ():
                 self.markersList2 = self.markersList1
-            for marker in self.markersList2:
-                markerSequence2shape1[:] += marker._shape1
-                markerSequence2shape2[:] += marker._shape2
-            for i in range(len(markerSequence2shape1)):
-                if markerSequence2shape1[i] > 1:
-                    markerSequence2shape1[i] = 1
-                if markerSequence2shape2[i] > 2:
-                    markerSequence2shape2[i] = 2
-
-            self.markerArray2[:] = [sum(i)for i in zip(
-                markerSequence2shape1[:], markerSequence2shape2[:])]
+            compiler.compileMarkers(self.markersList2, self.markerArray2)
 
     def clearPulse(self):
         """
@@ -2,8 +2,11 @@ import sys
 import getopt
 import time
 
+import numpy
+
 from application.lib.instrum_classes import *
 from application.lib.datacube import *
+from application.lib.visa_blocks import decodeBlock
 
 """ MODIFIED BY DV IN DEC 2014"""
 
@@ -30,6 +33,15 @@ class Instr(VisaInstrument):
     The Rhode & Schwarz FSP instrument class.
     """
 
+    # settings cached by VisaInstrument.write/ask (see application.lib.visa_cache)
+    cachedSettings = [r'(SENSE1:)?FREQ(UENCY)?:(MODE|START|STOP|CENTER|SPAN)', r'(SENSE1:)?SWE(EP)?:(TIME|POINT|POIN|COUN)',
+                      'FORM', r'BAND:(RES|VID)', r'DISP:TRACE1:Y:RLEVEL']
+    # start and stop follow center and span (and conversely), the automatic sweep time follows span and bandwidths
+    cacheInvalidations = [(r'(SENSE1:)?FREQ', r'FREQ'),
+                          (r'(SENSE1:)?(FREQ|BAND|SWE)', r'SWE:TIME')]
+    # traces are transferred as REAL,32 binary blocks, until an answer is not a valid block (then in ASCII)
+    binaryTransfer = True
+
     def initialize(self, visaAddress="TCPIP0::192.168.0.17::inst0", **kwargs):
         try:
             self.debugPrint('Initializing FSP')
@@ -195,7 +207,8 @@ class Instr(VisaInstrument):
 
     def getSetup(self):
         """ """
-        return {'centerInGHz': self.getFrequency(), 'spanInGHz': self.getSpanInGHz(), 'startInGHz': self.getStartInGHz(), 'stopInGHz': self.getStopInGHz(), 'resBWInHz': self.getResBWInHz(), 'vidBWInHz': self.getVidBWInHz(), 'NumOfPoints': self.getNumOfPoints(), 'sweepTimeInSec': self.getSweepTimeInSec(), 'sweepCount': self.getSweepCounts()}
+        with self.batch('getSetup'):
+            return {'centerInGHz': self.getFrequency(), 'spanInGHz': self.getSpanInGHz(), 'startInGHz': self.getStartInGHz(), 'stopInGHz': self.getStopInGHz(), 'resBWInHz': self.getResBWInHz(), 'vidBWInHz': self.getVidBWInHz(), 'NumOfPoints': self.getNumOfPoints(), 'sweepTimeInSec': self.getSweepTimeInSec(), 'sweepCount': self.getSweepCounts()}
 
     ######################
     #  GET TRACES BELOW  #
@@ -204,50 +217,65 @@ class Instr(VisaInstrument):
     def getTrac(self, trace=1):
         """
         Transfers immeditaly a trace from the FSP.
-        Returns the trace as a list of two lists.
+        Returns the trace as a list of two numpy arrays [frequencies or times, values].
         For internal use only. USE getTrace() OR getTraceCube  INSTEAD.
         """
         if DEBUG:
             print "Getting trace..."
-        freq_mode = self.ask("FREQ:MODE?")
-        timedomain = False
-        sweeptime = 0
-        freqStart = 0
-        freqStop = 0
-        if freq_mode == 'FIX':
-            # This is a time domain measurement.
-            if DEBUG:
-                print "Time domain measurement..."
-            timedomain = True
-            sweeptime = float(self.ask("SWE:TIME?"))
-            if DEBUG:
-                print "Sweeptime: %f " % sweeptime
-        else:
-            # This is a frequency domain measurement.
-            freqStart = float(self.ask("FREQ:START?"))
-            freqStop = float(self.ask("FREQ:STOP?"))
-            if DEBUG:
-                print "Frequency domain measurement from %f to %f" % (freqStart, freqStop)
-        self.write("FORM ASC;TRAC? TRACE%d" % trace)
-        trace = self.read()
+        with self.batch('getTrac', ["FREQ:MODE?", "FREQ:START?", "FREQ:STOP?"]):
+            freq_mode = self.ask("FREQ:MODE?")
+            timedomain = False
+            sweeptime = 0
+            freqStart = 0
+            freqStop = 0
+            if freq_mode == 'FIX':
+                # This is a time domain measurement.
+                if DEBUG:
+                    print "Time domain measurement..."
+                timedomain = True
+                sweeptime = float(self.ask("SWE:TIME?"))
+                if DEBUG:
+                    print "Sweeptime: %f " % sweeptime
+            else:
+                # This is a frequency domain measurement.
+                freqStart = float(self.ask("FREQ:START?"))
+                freqStop = float(self.ask("FREQ:STOP?"))
+                if DEBUG:
+                    print "Frequency domain measurement from %f to %f" % (freqStart, freqStop)
+        values = None
+        if self.binaryTransfer:
+            self.write("FORM REAL,32")
+            self.write("TRAC? TRACE%d" % trace)
+            values = decodeBlock(self.read_raw(), dtype='<f4')
+            if values is None:
+                self.debugPrint('Binary trace transfer not supported: switching to ASCII.')
+                self.binaryTransfer = False
+        if values is None:
+            self.write("FORM ASC;TRAC? TRACE%d" % trace)
+            values = numpy.fromstring(self.read(), sep=',')
         # self.write("INIT:CONT ON")# 20/03/2012 VS recoved Denis 30/01/2013
-        values = trace.split(',')
-        values = map(lambda x: float(x), values)
         if timedomain:
             self.lastTrace.frequencies = []
-            times = [i * sweeptime / len(values)
-                     for i in range(0, len(values))]
+            times = numpy.linspace(0, sweeptime, len(values), endpoint=False)
             self.lastTrace.times = times
             result = [times, values]
         else:
             self.lastTrace.times = []
-            frequencies = [
-                freqStart + i * (freqStop - freqStart) / len(values) for i in range(0, len(values))]
+            # the first and last points of the trace are at the start and stop frequencies
+            frequencies = numpy.linspace(freqStart, freqStop, len(values))
             self.lastTrace.frequencies = frequencies
             result = [frequencies, values]
         self.transferIndex += 1
         return result
 
+    def startSweep(self, timeout=20):
+        """
+        Sets the instrument to single sweep mode, starts a sweep and returns an OperationFuture done at the end of
+        the sweep (see operationComplete), so that the sweeps of several instruments can be overlapped.
+        """
+        self.write('INIT:CONT OFF')
+        return self.operationComplete('INIT', timeout=timeout)
+
     def getTrace(self, trace=1, waitFullSweep=False, timeout=20, cubeOut=False):
         """
         If waitFullSweep=true, sets the instrument to single sweep mode, resets the sweep count, waits until the data acqusition finishes and transfers the data from the instrument.
@@ -256,20 +284,10 @@ class Instr(VisaInstrument):
         USE KEYWORD ARGUMENT cubeOut=True TO RETURN A DATACUBE.   
         """
         if waitFullSweep:
-            self.write('INIT:CONT OFF')
-            self.write('INIT;*WAI')
-            result = 0
-            cnt = 0
-            # Check the status of the data acquisition operation.
-            while True:
-                try:
-                    result = int(self.ask('*OPC?'))
-                except VisaIOError:
-                    pass
-                if result == 1 or cnt > timeout * 10:
-                    break
-                cnt += 1
-                time.sleep(0.1)
+            try:
+                self.startSweep(timeout=timeout).result()
+            except (OperationTimeoutError, VisaIOError):
+                self.debugPrint('Sweep not complete after %s s.' % timeout)
         result = self.getTrac(trace=trace)
         if not cubeOut:
             return result
@@ -278,8 +296,8 @@ class Instr(VisaInstrument):
             name = "freq"
             if len(self.lastTrace.times) != 0:
                 name = 'time'
-            cube.createCol(name=name, values=result[0])
-            cube.createCol(name="mag", values=result[1])
+            cube.createCol(name=name, values=result[0], notify=False)
+            cube.createCol(name="mag", values=result[1], notify=False)
             return cube
 
     def getSingleTrace(self, **kwargs):
@@ -2,12 +2,16 @@ import sys
 import getopt
 import math
 from numpy import *
-from pyvisa import vpp43
+try:
+    from pyvisa import vpp43
+except ImportError:
+    vpp43 = None             # pyvisa not installed: only simulated resources can be used
 
 from application.lib.instrum_classes import *
 if 'lib.datacube' in sys.modules:
     reload(sys.modules['lib.datacube'])
 from application.lib.datacube import Datacube
+from application.lib import vna_traces
 
 
 class VNATrace:
@@ -325,128 +329,61 @@ class Instr(VisaInstrument):
             data = self.ask_for_values('OFD;')
         if waitFullSweep:
             print "done."
-        freqs.pop(0)
-        data.pop(0)
-        mag = []
-        phase = []
-        # If y length is twice the x length, we got phase and magnitude.
+        freqs = array(freqs[1:])
+        data = array(data[1:])
+        # If y length is twice the x length, we got interleaved magnitude and phase.
+        phase = None
         if len(data) == 2 * len(freqs):
-            for i in range(0, len(data)):
-                if i % 2 == 0:
-                    mag.append(data[i])
-                else:
-                    phase.append(data[i])
+            mag, phase = data[0::2], data[1::2]
         else:
             mag = data
         att = self.attenuation()
         trace.setParameters({'attenuation': att, 'power': self.totalPower()})
-        trace.createCol(name='freq', values=freqs)
-        trace.createCol(name='mag', values=array(mag) + att)
-        if len(phase) != 0:
-            trace.createCol(name='phase', values=phase)
+        columns = [('freq', freqs), ('mag', mag + att)]
+        if phase is not None:
+            columns.append(('phase', phase))
+        trace.createCols(columns)
         return trace
 
     def getFullTrace(self, **kwargs):
         self.getTrace(waitFullSweep=True, **kwargs)
 
-    def getFreqMagPhase(self, waitFullSweep=False, fromMemory=False, timeOut=60, addedAttenuators=0., unwindPhase=False, subtractedSlope=None, deltaPhase=None, phaseOffset=None, phaseStart=None, phaseStop=None):
+    def getFreqMagPhase(self, waitFullSweep=False, fromMemory=False, timeOut=60, addedAttenuators=0., unwindPhase=False, subtractedSlope=None, deltaPhase=None, phaseOffset=None, phaseStart=None, phaseStop=None, electricalDelay=None):
         """ 
         - Get a trace in the VNA
         - Correct amplitude for added attenuation.
-        - Unwind phase, and/or remove slope, and/or impose a phase difference between last and first point, and/or add an offset to the phase, if requested.
+        - Unwind phase, and/or remove slope, and/or impose a phase difference between last and first point, and/or remove an electrical delay (in the inverse unit of the frequencies), and/or add an offset to the phase, if requested.
         Get the memory instead of main trace if fromMemory=True.
         Restart a sweep and wait for its completion if fromMemory=False and waitFullSweep=True.
+        The corrections are computed on whole arrays (see application.lib.vna_traces).
         """
         trace = self.getTrace(waitFullSweep=waitFullSweep,
                               fromMemory=fromMemory, timeOut=timeOut)
         if addedAttenuators != 0:
             self.correctMag(trace, addedAttenuators=addedAttenuators)
-        if unwindPhase or subtractedSlope is not None or deltaPhase is not None or phaseOffset is not None:
+        if unwindPhase or subtractedSlope is not None or deltaPhase is not None or phaseOffset is not None or electricalDelay is not None or phaseStart is not None or phaseStop is not None:
             self.correctPhase(trace, unwindPhase=unwindPhase, subtractedSlope=subtractedSlope,
-                              deltaPhase=deltaPhase, phaseOffset=phaseOffset, phaseStart=phaseStart, phaseStop=phaseStop)
+                              deltaPhase=deltaPhase, phaseOffset=phaseOffset, phaseStart=phaseStart, phaseStop=phaseStop, electricalDelay=electricalDelay)
         return trace
 
     def correctMag(self, traceCube, addedAttenuators=0.):
         if 'mag' in traceCube.names():
-            traceCube.createCol(name='magCor', values=traceCube[
-                                'mag'] + addedAttenuators)
+            traceCube.createCols([('magCor', traceCube['mag'] + addedAttenuators)])
             params = traceCube.parameters()
             params['addedAtten'] = addedAttenuators
 
-    def correctPhase(self, traceCube, unwindPhase=False, subtractedSlope=None, deltaPhase=None, phaseOffset=None, phaseStart=None, phaseStop=None):
-        traceCube.names()
+    def correctPhase(self, traceCube, unwindPhase=False, subtractedSlope=None, deltaPhase=None, phaseOffset=None, phaseStart=None, phaseStop=None, electricalDelay=None):
         if 'phase' in traceCube.names():
-            params = traceCube.parameters()
-            params['unwind'] = False
-            for key in ['subtractedSlope', 'deltaPhase', 'phaseOffset']:
-                params[key] = None
-            phase = traceCube['phase']
-            if unwindPhase:
-                # unwind phase if requested
-                phase = self.unwind(phase, period=360)
-                params['unwind'] = True
-            # flatten phase if requested
-            if subtractedSlope is not None:
-                freq = traceCube['freq']
-                # flatten by slope subtraction has priority over imposing a the
-                # total delta jump
-                phase = phase - subtractedSlope * (freq - freq[0])
-                params['subtractedSlope'] = subtractedSlope
-            # impose a the total delta jump
-            elif deltaPhase is not None:
-                phase = phase - \
-                    (+phase[-1] - phase[0] - deltaPhase) / \
-                    len(phase) * arange(len(phase))
-                params['deltaPhase'] = deltaPhase
-            if phaseStart is not None:
-                phaseOffset = phaseStart - phase[0]
-            elif phaseStop is not None:
-                phaseOffset = phaseStop - phase[-1]
-            if phaseOffset is not None:
-                phase = phase + phaseOffset
-                params['phaseOffset'] = phaseOffset
-            traceCube.createCol(name='phaseCor', values=phase)
+            phase, corrections = vna_traces.correctPhase(traceCube['freq'], traceCube['phase'], unwindPhase=unwindPhase,
+                                                         subtractedSlope=subtractedSlope, deltaPhase=deltaPhase,
+                                                         electricalDelay=electricalDelay, phaseOffset=phaseOffset,
+                                                         phaseStart=phaseStart, phaseStop=phaseStop)
+            traceCube.parameters().update(corrections)
+            traceCube.createCols([('phaseCor', phase)])
 
     def unwind(self, li, period=360):
         """Unwind a list, tuple or 1D array initially defined on a circle with period period. Format is preserved."""
-
-        def substract(li1, li2):
-            """Subtraction li1-li2 between two lists, tuples or 1D arrays. Format is preserved."""
-            result = array(li1) - array(li2)
-            if isinstance(li1, list):
-                result = list(result)
-            elif isinstance(li1, tuple):
-                result = tuple(result)
-            return result
-
-        def rotateLeft(li, shift=1):
-            """Rotate a list, tuple or 1st dimension of an array by shift positions to the left. Format is preserved."""
-            shift = shift % len(li)
-            result = concatenate((array(li)[shift:], array(li)[:shift]))
-            if isinstance(li, list):
-                result = list(result)
-            elif isinstance(li, tuple):
-                result = tuple(result)
-            return result
-
-        def derivList(li):
-            """Discrete derivative of a list, tuple or 1D array.
-            Format is preserved, but with an output length 1 unit below the input length."""
-            return substract(rotateLeft(li), li)[:-1]
-
-        def listIntegrate(li):
-            """Discrete integration of a list, tuple or 1D array. Format is preserved."""
-            for i in range(len(li))[1:]:
-                li[i] += li[i - 1]
-            return li
-
-        def jump(x):
-            dif = [abs(x - period), abs(x), abs(x + period)]
-            return dif.index(min(dif)) - 1
-
-        jumps = listIntegrate(map(jump, derivList(li)))
-        jumps.insert(0, 0.)
-        result = array(jumps) * period + array(li)
+        result = vna_traces.unwrapPhase(li, period=period)
         if isinstance(li, list):
             result = list(result)
         elif isinstance(li, tuple):
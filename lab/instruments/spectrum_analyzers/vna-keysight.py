@@ -7,7 +7,12 @@ if 'lib.datacube' in sys.modules:
     reload(sys.modules['lib.datacube'])
 from application.lib.datacube import Datacube
 from numpy import *
-from pyvisa import vpp43
+try:
+    from pyvisa import vpp43
+except ImportError:
+    vpp43 = None             # pyvisa not installed: only simulated resources can be used
+from application.lib.visa_blocks import decodeBlock
+from application.lib import vna_traces
 
 
 class VNATrace:
@@ -24,6 +29,16 @@ class VNATrace:
 
 class Instr(VisaInstrument):
 
+    # settings cached by VisaInstrument.write/ask (see application.lib.visa_cache)
+    cachedSettings = ['FORM', 'FORM:BORDER', r'CALC\d*:PAR:MNUM', r'CALC\d*:X', r'SYST:MEAS:CAT',
+                      r'SENS\d*:FREQ:(START|STOP|CENT|SPAN)', r'SENS\d*:SWEEP:POINTS', r'SENS\d*:BAND']
+    # the frequency axis changes with the sweep settings, start, stop, center and span follow each other, and the
+    # measurement catalog changes with the measurement definitions
+    cacheInvalidations = [(r'SENS\d*:(FREQ|SWEEP:POINTS|SWE:TYPE)|SOUR\d*:POW\d*:(STAR|STOP)', r'CALC\d*:X'),
+                          (r'SENS\d*:FREQ', r'(SENS\d*:)?FREQ'),
+                          (r'SENS:SWE:TYPE', r'(SENS\d*:)?FREQ'),
+                          (r'CALC\d*:PAR(AMETER)?:(DEF|DEL|EXT)', r'SYST:MEAS:CAT|CALC\d*:PAR:MNUM')]
+
     # Initializes the instrument.
     def initialize(self, visaAddress="TCPIP0::192.168.0.71::inst0::INSTR", powerParams={}):
         print 'Initializing ' + self.name() + ' with adress ', visaAddress, ':',
@@ -37,14 +52,18 @@ class Instr(VisaInstrument):
         self.setPowerParams(powerParams)
 
     def clearDevice(self):
+        self.invalidateCache()
         handle = self.getHandle()
         handle.timeout = 1
-        vpp43.clear(handle.vi)
+        if vpp43 is not None:
+            vpp43.clear(handle.vi)
+        else:
+            handle.clear()
         # handle.write('*CLS')
         try:
             print 'STB=', self.ask('*STB?')
             return True
-        except visa.VisaIOError:
+        except VisaIOError:
             return False
 
     def powerParams(self):
@@ -218,9 +237,10 @@ class Instr(VisaInstrument):
         return self.averageCount()
 
     def getSetup(self):
-        return {'power': self.totalPower(), 'cwONOFF': self.getCW(), 'centerInGHz': self.getCenterInGHz(), 'spanInGHz': self.getSpanInGHz(), 'startInGHz': self.getStartInGHz(),
-                'stopInGHz': self.getStopInGHz(), 'BWInHz': self.bandwidth(), 'numOfPoints': self.numberOfPoints(), 'avgCount': self.averageCount(),
-                'avgONOFF': self.average()}
+        with self.batch('getSetup'):
+            return {'power': self.totalPower(), 'cwONOFF': self.getCW(), 'centerInGHz': self.getCenterInGHz(), 'spanInGHz': self.getSpanInGHz(), 'startInGHz': self.getStartInGHz(),
+                    'stopInGHz': self.getStopInGHz(), 'BWInHz': self.bandwidth(), 'numOfPoints': self.numberOfPoints(), 'avgCount': self.averageCount(),
+                    'avgONOFF': self.average()}
 
     # measurement number = tr# (and mont the trace) on the PNA
     def measurements(self, channel=1):
@@ -326,46 +346,43 @@ class Instr(VisaInstrument):
 
     # see doc "Getting Data from the Analyzer"
     def decodeBlock(self, str1, byteEncoding=4):
-        if str1[0] != '#' or (byteEncoding != 4 and byteEncoding != 8):
+        if byteEncoding != 4 and byteEncoding != 8:
             return
-        dtype = float64
-        if byteEncoding == 4:
-            dtype = float32
-        numDigit = int(str1[1])
-        byteCount = int(str1[2:2 + numDigit])
-        str1 = str1[2 + numDigit:]
-        if len(str1) != byteCount or len(str1) % byteEncoding != 0:
-            return
-        return fromstring(str1, dtype=dtype)
+        return decodeBlock(str1, dtype='<f%i' % byteEncoding)
 
     def trigger(self, channel=1):
         self.write('TRIG:SOUR MAN')
         self.write('INIT' + str(channel) + ':IMM')
 
-    def waitFullSweep(self, channel=1, restore=False):
+    def startFullSweep(self, channel=1, restore=False, timeout=60):
+        """
+        Triggers a sweep and returns an OperationFuture done at the end of the sweep (see operationComplete),
+        so that the sweeps of several instruments can be overlapped.
+        If restore is True, the trigger source is restored at the end of the sweep.
+        """
         mode = self.ask('TRIG:SOUR?')
-        self.trigger(channel=channel)
-        self.write('*OPC')
-        while True:
-            time.sleep(0.5)
-            esr = int(self.ask('*ESR?'))
-            if (esr & 1) == 1:
-                break
+        future = self.operationComplete(lambda: self.trigger(channel=channel), timeout=timeout)
         if restore:
-            self.write('TRIG:SOUR ' + mode)
+            future.addDoneCallback(lambda future: self.write('TRIG:SOUR ' + mode))
+        return future
+
+    def waitFullSweep(self, channel=1, restore=False, timeout=60):
+        return self.startFullSweep(channel=channel, restore=restore, timeout=timeout).result()
 
     def getTrace(self, channel=1, trace=1, waitFullSweep=False, fromMemory=False, timeOut=60):
         handle = self.getHandle()
         handle.timeout = timeOut
         if waitFullSweep:
             print "Getting trace...",
-            self.waitFullSweep(channel=channel, restore=True)
+            self.waitFullSweep(channel=channel, restore=True, timeout=timeOut)
         self.write('FORM:BORDER SWAP')  # swap for ibm pc
-        # 64 bits = 8 bytes for frequencies according to Keysight doc
-        self.write('FORM REAL,64')
         self.selectTrace(channel=channel, trace=trace)
-        x = self.decodeBlock(
-            self.ask('CALC' + str(channel) + ':X?'), byteEncoding=8)
+        xQuery = 'CALC' + str(channel) + ':X?'
+        # 64 bits = 8 bytes for frequencies according to Keysight doc
+        # (useless when the frequency axis is served by the settings cache)
+        if self.settingsCache().cached(xQuery) is None:
+            self.write('FORM REAL,64')
+        x = self.decodeBlock(self.ask(xQuery), byteEncoding=8)
         # 32 bits = 4 bytes for data according to Keysight doc
         self.write('FORM REAL,32')
         term = 'FDATA'
@@ -377,100 +394,57 @@ class Instr(VisaInstrument):
             print "done."
         return x, y
 
-    def getFreqMagPhase(self, channel=1, tracesMagPhase=[1, 2], waitFullSweep=False, fromMemory=False, timeOut=60, addedAttenuators=0, unwindPhase=False, substractedSlope=None, deltaPhase=None, phaseOffset=None):
+    def getFreqMagPhase(self, channel=1, tracesMagPhase=[1, 2], waitFullSweep=False, fromMemory=False, timeOut=60, addedAttenuators=0, unwindPhase=False, substractedSlope=None, deltaPhase=None, phaseOffset=None, electricalDelay=None):
+        """
+        - Get the magnitude and phase traces tracesMagPhase of a channel in the VNA, and store them as whole columns of a datacube.
+        - Correct amplitude for added attenuation (column magCor).
+        - Unwind phase, and/or remove slope or impose a phase difference between last and first point, and/or remove an electrical delay (in s), and/or add an offset to the phase, if requested (column phaseCor).
+        The corrections are computed on whole arrays (see application.lib.vna_traces).
+        """
+        columns = []
+        f1 = f2 = None
         if tracesMagPhase[0] is not None:
             f1, mag = self.getTrace(channel=channel, trace=tracesMagPhase[
                                     0], waitFullSweep=waitFullSweep, fromMemory=fromMemory, timeOut=timeOut)
+            columns += [("freq", f1), ("mag", mag)]
         if tracesMagPhase[1] is not None:
             f2, phase = self.getTrace(channel=channel, trace=tracesMagPhase[
-                                      1], waitFullSweep=False, fromMemory=fromMemory, timeOut=timeOut)
+                                      1], waitFullSweep=waitFullSweep and f1 is None, fromMemory=fromMemory, timeOut=timeOut)
+            if f1 is None:
+                columns.append(("freq", f2))
+            elif len(f2) != len(f1) or (f2 != f1).any():
+                columns.append(("freq2", f2))
+            columns.append(("phase", phase))
         cube = Datacube('spectrum')
-        cube.createCol(name="freq", values=f1)
-        cube.createCol(name="mag", values=mag + addedAttenuators)
-        if (f2 != f1).any():
-            cube.createCol(name="freq2", values=f2)
-        cube.createCol(name="phase", values=phase)
+        cube.createCols(columns)
         if addedAttenuators != 0:
-            self.correctMag(trace, addedAttenuators=addedAttenuators)
-        if unwindPhase or substractedSlope is not None or deltaPhase is not None or phaseOffset is not None:
-            self.correctPhase(trace, unwindPhase=unwindPhase, substractedSlope=substractedSlope,
-                              deltaPhase=deltaPhase, phaseOffset=phaseOffset)
+            self.correctMag(cube, addedAttenuators=addedAttenuators)
+        if unwindPhase or substractedSlope is not None or deltaPhase is not None or phaseOffset is not None or electricalDelay is not None:
+            self.correctPhase(cube, unwindPhase=unwindPhase, substractedSlope=substractedSlope,
+                              deltaPhase=deltaPhase, phaseOffset=phaseOffset, electricalDelay=electricalDelay)
         return cube
 
     def correctMag(self, traceCube, addedAttenuators=0):
-        if 'mag' in trace.names():
-            trace.createCol(name='magCor', values=trace[
-                            'mag'] + addedAttenuators)
-            params = trace.parameters()
+        if 'mag' in traceCube.names():
+            traceCube.createCols([('magCor', traceCube['mag'] + addedAttenuators)])
+            params = traceCube.parameters()
             params['addedAttenuation'] = addedAttenuators
 
-    def correctPhase(self, traceCube, unwindPhase=False, substractedSlope=None, deltaPhase=None, phaseOffset=None):
-        if 'phase' in trace.names():
-            params['unwound'] = False
-            for key in ['substractedSlope', 'deltaPhase', 'phaseOffset']:
-                params[ket] = None
-            phase = trace['phase']
-            if unwindPhase:
-                # unwind phase if requested
-                phase = self.unwind(phase, period=360)
-                params['unwound'] = True
-            # flatten phase if requested
-            if substractedSlope is not None:
-                # flatten by slope subtraction has priority over imposing a the
-                # total delta jump
-                phase = phase - substractedSlope * (f2 - f2[0])
-                params['substractedSlope'] = substractedSlope
-            # impose a the total delta jump
-            elif deltaPhase is not None:
-                phase = phase - \
-                    (+phase[-1] - phase[0] - deltaPhase) / \
-                    len(phase) * arange(len(phase))
-                params['deltaPhase'] = deltaPhase
-            if phaseOffset is not None:
-                phase = phase + phaseOffset
-                params['phaseOffset'] = phaseOffset
-            trace.createCol(name='phaseCor', values=phase)
+    def correctPhase(self, traceCube, unwindPhase=False, substractedSlope=None, deltaPhase=None, phaseOffset=None, electricalDelay=None):
+        if 'phase' in traceCube.names():
+            freq = traceCube['freq2'] if 'freq2' in traceCube.names() else traceCube['freq']
+            phase, corrections = vna_traces.correctPhase(freq, traceCube['phase'], unwindPhase=unwindPhase,
+                                                         subtractedSlope=substractedSlope, deltaPhase=deltaPhase,
+                                                         electricalDelay=electricalDelay, phaseOffset=phaseOffset)
+            params = traceCube.parameters()
+            params['unwound'] = corrections.pop('unwind')
+            corrections['substractedSlope'] = corrections.pop('subtractedSlope')
+            params.update(corrections)
+            traceCube.createCols([('phaseCor', phase)])
 
     def unwind(self, li, period=360):
         """Unwind a list, tuple or 1D array initially defined on a circle with period period. Format is preserved."""
-
-        def substract(li1, li2):
-            """Subtraction li1-li2 between two lists, tuples or 1D arrays. Format is preserved."""
-            result = array(li1) - array(li2)
-            if isinstance(li1, list):
-                result = list(result)
-            elif isinstance(li1, tuple):
-                result = tuple(result)
-            return result
-
-        def rotateLeft(li, shift=1):
-            """Rotate a list, tuple or 1st dimension of an array by shift positions to the left. Format is preserved."""
-            shift = shift % len(li)
-            result = concatenate((array(li)[shift:], array(li)[:shift]))
-            if isinstance(li, list):
-                result = list(result)
-            elif isinstance(li, tuple):
-                result = tuple(result)
-            return result
-
-        def derivList(li):
-            """Discrete derivative of a list, tuple or 1D array.
-            Format is preserved, but with an output length 1 unit below the input length."""
-            return substract(rotateLeft(li), li)[:-1]
-
-        def listIntegrate(li):
-            """Discrete integration of a list, tuple or 1D array. Format is preserved."""
-            for i in range(len(li))[1:]:
-                li[i] += li[i - 1]
-            return li
-
-        def jump(x):
-            dif = [abs(x - period), abs(x), abs(x + period)]
-            return dif.index(min(dif)) - 1
-
-        jumps = listIntegrate(map(jump, derivList(li)))
-        jumps.insert(0, 0.)
-        result = array(jumps) * period + array(li)
+        result = vna_traces.unwrapPhase(li, period=period)
         if isinstance(li, list):
             result = list(result)
         elif isinstance(li, tuple):
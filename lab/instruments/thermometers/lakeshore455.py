@@ -6,6 +6,7 @@ import time
 import math
 
 from application.lib.instrum_classes import VisaInstrument
+from application.lib.timeseries_store import timeSeries
 
 
 class Trace:
@@ -58,6 +59,18 @@ class Instr(VisaInstrument):
 
     def readField(self):
         """
-        Read the displyed value.
+        Read the displyed value, and record it in the field time series (see fieldHistory).
         """
-        return self.ask('RDGFIELD?')
+        field = self.ask('RDGFIELD?')
+        try:
+            timeSeries(self.name() + '_field').append(float(field))
+        except (TypeError, ValueError):
+            pass
+        return field
+
+    def fieldHistory(self, t0=None, t1=None, maxPoints=None):
+        """
+        Returns the (times, fields) arrays of the fields read between times t0 and t1, at the finest resolution giving at
+        most maxPoints points (see application.lib.timeseries_store).
+        """
+        return timeSeries(self.name() + '_field').query(t0, t1, maxPoints)
@@ -3,6 +3,7 @@ import getopt
 import time
 
 from application.lib.instrum_classes import *
+from application.lib.socket_pool import socketPool
 
 
 class Instr(Instrument):
@@ -21,31 +22,52 @@ class Instr(Instrument):
     def saveState(self, name):
         return self.parameters()
 
+    def _readVar(self, connection):
+        """
+        Reads the reply to a variable request from connection and returns the variable's value.
+        """
+        # the last field of the header line is the length of the variable data
+        length = int(connection.readLine().split(';')[-1])
+        # split the data at each ';' and keep the third element which is the variable's value
+        return float(connection.readExactly(length).split(';')[2])
+
+    def getVars(self, varIndices):
+        """
+        Returns the list of the values of the variables varIndices, requested in a single message on the persistent
+        connection to the module (see application.lib.socket_pool).
+        """
+        def transaction(connection):
+            values = []
+            while len(values) < len(varIndices):
+                remaining = varIndices[len(values):]
+                if not connection.connected():
+                    connection.connect()
+                connection.sendall(''.join(['2;7;' + str(varIndex) + '\n' for varIndex in remaining]))
+                try:
+                    for varIndex in remaining:
+                        values.append(self._readVar(connection))
+                except socket.error:
+                    # a server closing the connection after some replies gets the remaining requests on a new one
+                    if len(values) == len(varIndices) - len(remaining):
+                        raise
+                    connection.close()
+            return values
+        return socketPool.request(self.address, self.port, transaction, timeout=2.0)
+
     def getVar(self, varIndex=1):
         """
         Returns the value of variable varIndex
         """
-        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-        sock.settimeout(2.0)
-        sock.connect((self.address, self.port))
-        sock.send('2;7;' + str(varIndex) + '\n')
-        string = ''
-        while True:           # progress until \n
-            char = sock.recv(1)
-            if char == '\n':
-                break
-            elif char == ';':     # and empty the string at each ';' to end with the last value, which is the length of the variable data
-                string = ''
-            elif char != '\r':
-                string += char
-        # receive the length obtained above, split at each ';', and keep the
-        # third element which is the variable's value
-        value = float(sock.recv(int(string)).split(';')[2])
-        sock.close()
-        return value
+        return self.getVars([varIndex])[0]
 
     def temperature(self, thermometerIndex=1):
         if 1 <= thermometerIndex <= len(self.thermoVarIndices):
             return self.getVar(self.thermoVarIndices[thermometerIndex - 1])
         else:
             return -1
+
+    def temperatures(self):
+        """
+        Returns the list of the temperatures of all the thermometers, in a single request.
+        """
+        return self.getVars(self.thermoVarIndices)
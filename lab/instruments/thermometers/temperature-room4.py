@@ -2,19 +2,14 @@ import sys
 import getopt
 
 from application.lib.instrum_classes import *
+from application.lib.socket_pool import readOnConnect
 
 
 class Instr(Instrument):
 
     def temperature(self):
-        try:
-            sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-            sock.settimeout(0.5)
-            sock.connect((self.host, self.port))
-            return float(sock.recv(1024))
-        except:
-            raise
-            return 0
+        # the server sends the temperature on each new connection
+        return float(readOnConnect(self.host, self.port, timeout=0.5))
 
     def parameters(self):
         params = dict()
@@ -5,6 +5,7 @@ sys.path.append('.')
 sys.path.append('../')
 
 from application.lib.instrum_classes import *
+from application.lib.timeseries_store import timeSeries, TimeSeriesStore
 from gui.mpl.canvas import MyMplCanvas as Canvas
 from gui.frontpanel import FrontPanel
 from gui.elements.numericedit import *
@@ -25,31 +26,34 @@ class Panel(FrontPanel):
         if property == "temperature":
             self.updateTemperature(value)
 
+    def setWindow(self, window):
+        """
+        Sets the displayed history (in s), which can span days (see application.lib.timeseries_store).
+        """
+        self.window = window
+
     def updateTemperature(self, t):
         try:
             if t is None:
                 return
             newTime = time.time()
-            self.temperatures.append(t * 1000)
-            self.times.append(newTime)
-            if len(self.gliding) > 0:
-                self.gliding.append(self.gliding[-1] * 0.7 + t * 0.3 * 1000)
-            else:
-                self.gliding.append(t * 1000)
-            while len(self.temperatures) > 200:
-                self.temperatures.pop(0)
-                self.times.pop(0)
-                self.gliding.pop(0)
-            self.canvas.axes.clear()
-            self.canvas.axes.plot(self.times, self.temperatures)
-            self.canvas.axes.plot(self.times, self.gliding)
-            self.canvas.axes.set_xticks((self.times[0], self.times[-1]))
-            xAxis = self.canvas.axes.xaxis
-            xAxis.set_major_formatter(ticker.FuncFormatter(self.formatDate))
+            self.temperatures.append(t, newTime)
+            last = self.gliding.last()
+            self.gliding.append(last[1] * 0.7 + t * 0.3 if last is not None else t, newTime)
+            times, temperatures = self.temperatures.query(newTime - self.window, maxPoints=self.maxPoints)
+            glidingTimes, gliding = self.gliding.query(newTime - self.window, maxPoints=self.maxPoints)
+            # update the data of the existing lines instead of clearing and replotting the axes
+            self.temperatureLine.set_data(times, temperatures * 1000)
+            self.glidingLine.set_data(glidingTimes, gliding * 1000)
+            axes = self.canvas.axes
+            axes.set_xlim(times[0], max(times[-1], times[0] + 1))
+            axes.relim()
+            axes.autoscale_view(scalex=False)
+            axes.set_xticks((times[0], times[-1]))
             self.canvas.draw()
-            if len(self.gliding) > 1:
-                slope = (self.gliding[-1] - self.gliding[1]) / \
-                    (self.times[-1] - self.times[1]) * 60 * 60
+            if len(gliding) > 1:
+                slope = (gliding[-1] - gliding[1]) * 1000 / \
+                    (glidingTimes[-1] - glidingTimes[1]) * 60 * 60
             else:
                 slope = 0
             if (slope > 500) and t < 0.5:
@@ -75,15 +79,20 @@ class Panel(FrontPanel):
         self.title = QLabel(instrument.name())
         self.title.setAlignment(Qt.AlignCenter)
         self.title.setStyleSheet("QLabel {font:18px;}")
-        self.temperatures = []
-        self.times = []
-        self.gliding = []
+        # readings in a bounded multi-resolution store (saved if directories.monitoring is set), gliding mean in memory
+        self.temperatures = timeSeries(instrument.name() + '_temperature')
+        self.gliding = TimeSeriesStore(instrument.name() + '_gliding', rawCapacity=1000)
+        self.window = 2000                  # displayed history in s
+        self.maxPoints = 500                # maximum number of points displayed
 
         self.temperature = QLabel("Please wait, fetching temperature...")
         self.temperature.setAlignment(Qt.AlignCenter)
         self.temperature.setStyleSheet("QLabel {font:14px;}")
         self.canvas = Canvas(dpi=100)
         self.canvas.setFixedHeight(150)
+        self.temperatureLine, = self.canvas.axes.plot([], [])
+        self.glidingLine, = self.canvas.axes.plot([], [])
+        self.canvas.axes.xaxis.set_major_formatter(ticker.FuncFormatter(self.formatDate))
 
         self.grid = QGridLayout(self)
         self.interval = 10000
@@ -2,11 +2,14 @@ import sys
 import getopt
 
 from application.lib.instrum_classes import *
+from application.lib.socket_pool import readOnConnect
 
 
 class Instr(Instrument):
 
     def temperature(self):
+        # the server sends the temperature on each new connection
+        return float(readOnConnect(self.host, self.port, timeout=0.5))
 
     def parameters(self):
         params = dict()